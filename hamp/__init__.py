@@ -16,11 +16,19 @@ from ._module import (
     attribute,
     unique,
     instance,
+    elaborate,
 )
 from ._struct import (
     struct,
 )
 from ._firrtl import firrtl, verilog
+from ._sim import simulator, coverage_report
+from ._batch import batch_simulator
+from ._runner import run_sharded
+from ._vcd import trace
+from ._flatten import flatten
+from ._dce import remove_unused
+from ._simplify import simplify
 
 from ._stdlib import cat, pad
 
@@ -41,9 +49,18 @@ __all__ = (
     "attribute",
     "unique",
     "instance",
+    "elaborate",
     "struct",
     "firrtl",
     "verilog",
+    "simulator",
+    "coverage_report",
+    "batch_simulator",
+    "run_sharded",
+    "trace",
+    "flatten",
+    "remove_unused",
+    "simplify",
     "cat",
     "pad",
 )
@@ -0,0 +1,311 @@
+"""
+Batch simulation
+Simulates many independent lanes of a design at once, with the values
+of each signal in a NumPy array over the lanes
+"""
+
+from typing import Any, Optional
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from ._db import DB
+from ._sim import (
+    _CompiledSimulator,
+    _Emitter,
+    _Memory,
+    _Program,
+    _IN_RANGE,
+    _format,
+    _SOURCE,
+    _mask,
+    program,
+)
+
+# Signals and operators wider than this use object arrays (of Python
+# integers), narrower use int64 arrays
+_WIDE = 62
+
+
+def _where(c, a, b):
+    return np.where(c != 0, a, b)
+
+
+def _int(x):
+    return np.asarray(x, dtype=np.int64)
+
+
+def _obj(x):
+    return np.asarray(x, dtype=object)
+
+
+def _bool(x):
+    return np.asarray(x, dtype=np.int64)
+
+
+def _shift(x):
+    return np.minimum(x, 63)
+
+
+def _div(a, b):
+    a, b = np.broadcast_arrays(a, b)
+    zero = b == 0
+    q = np.abs(a) // np.where(zero, 1, np.abs(b))
+    return np.where(zero, 0, np.where((a < 0) != (b < 0), -q, q))
+
+
+def _rem(a, b):
+    a, b = np.broadcast_arrays(a, b)
+    zero = b == 0
+    r = np.abs(a) % np.where(zero, 1, np.abs(b))
+    return np.where(zero, 0, np.where(a < 0, -r, r))
+
+
+def _parity(x):
+    x = np.asarray(x)
+    if x.dtype == object:
+        return _int(np.frompyfunc(lambda y: y.bit_count() & 1, 1, 1)(x))
+    for s in (32, 16, 8, 4, 2, 1):
+        x = x ^ (x >> s)
+    return x & 1
+
+
+def _read(mem, addr, depth):
+    lanes = mem.shape[1]
+    addr = np.broadcast_to(addr, (lanes,))
+    ok = addr < depth
+    return np.where(ok, mem[np.where(ok, addr, 0), np.arange(lanes)], 0)
+
+
+def _write(mem, addr, sel, data):
+    lanes = mem.shape[1]
+    idx = np.nonzero(np.broadcast_to(sel, (lanes,)))[0]
+    addr = np.broadcast_to(addr, (lanes,))[idx]
+    mem[addr, idx] = np.broadcast_to(data, (lanes,))[idx]
+
+
+_BATCH_SOURCE = {
+    **_SOURCE,
+    **{
+        op: f"_bool({{0}} {op} {{1}})"
+        for op in ("==", "!=", ">", ">=", "<", "<=")
+    },
+}
+
+
+class _BatchEmitter(_Emitter):
+    """Generates source of functions operating on arrays of lanes.
+    Operators with results or arguments wider than 62 bits are
+    computed on object arrays.
+    """
+
+    namespace = {
+        "_div": _div,
+        "_rem": _rem,
+        "_where": _where,
+        "_int": _int,
+        "_obj": _obj,
+        "_bool": _bool,
+        "_shift": _shift,
+        "_parity": _parity,
+        "_read": _read,
+        "_write": _write,
+    }
+
+    def value(self, e: tuple, type: tuple) -> str:
+        t, v = e
+        if type[1] > _WIDE and t[1] <= _WIDE and not isinstance(v, int):
+            # Widen to object array before normalizing to type
+            return self.normalize(f"_obj({self.expr(e)})", type)
+        s = super().value(e, type)
+        if isinstance(e[1], str) and e[0] == type:
+            return s
+        return f"_obj({s})" if type[1] > _WIDE else f"_int({s})"
+
+    def op(self, t: tuple, op: str, args: tuple, depth: int) -> str:
+        a = [self.expr(x, depth + 1) for x in args]
+        wide = max(t[1], *(x[0][1] for x in args)) > _WIDE
+        if wide:
+            a = [
+                s if isinstance(x[1], int) else f"_obj({s})"
+                for s, x in zip(a, args)
+            ]
+        match op:
+            case "mux":
+                return self.select(*a)
+            case "andr":
+                m = _mask(args[0])
+                return f"_bool(({a[0]} & {m}) == {m})"
+            case "orr":
+                return f"_bool(({a[0]} & {_mask(args[0])}) != 0)"
+            case "xorr":
+                return f"_parity({a[0]} & {_mask(args[0])})"
+            case "cat":
+                m0, m1, w1 = _mask(args[0]), _mask(args[1]), args[1][0][1]
+                s = f"((({a[0]} & {m0}) << {w1}) | ({a[1]} & {m1}))"
+            case "bits":
+                hi, lo = args[1][1], args[2][1]
+                return f"(({a[0]} >> {lo}) & {(1 << (hi - lo + 1)) - 1})"
+            case ">>" if not wide and not isinstance(args[1][1], int):
+                s = f"({a[0]} >> _shift({a[1]}))"
+            case _:
+                try:
+                    s = _BATCH_SOURCE[op].format(*a)
+                except KeyError:
+                    raise ValueError(f"Cannot simulate operator {op}")
+        if op in _IN_RANGE:
+            return s
+        return self.normalize(s, t)
+
+    def select(self, c: str, a: str, b: str) -> str:
+        return f"_where({c}, {a}, {b})"
+
+    def cover(self, k: int, en: str, pred: str) -> None:
+        self.lines.append(f"    C[{k}] += {en} & {pred}")
+
+    def printf(self, en: str, entry: str) -> None:
+        k, c, *args = entry.split(", ")
+        self.lines.append(f"    e = _int({en})")
+        self.lines.append(
+            f"    if e.any(): L.append(({', '.join([k, c, 'e', *args])}))"
+        )
+
+    def check(self, en: str, pred: str, entry: str) -> None:
+        self.printf(f"{en} & (1 - {pred})", entry)
+        self.lines[-1] += "; f = 1"
+
+    def both(self, a: str, b: str) -> str:
+        return f"({a} & {b})"
+
+    def inverse(self, a: str) -> str:
+        return f"(1 - {a})"
+
+    def read(self, mem: str, addr: str, m: _Memory) -> str:
+        return f"_read({mem}, {addr}, {m.depth})"
+
+    def write(
+        self, name: str, m: _Memory, port: str, en: str, data: str, mask: str
+    ) -> None:
+        addr = self.local(f"{port}.addr")
+        sel = f"{en} & ({addr} < {m.depth})"
+        for s, _ in m.leaves:
+            x = f"{sel} & {self.local(f'{port}.{mask}{s}')}" if m.mask else sel
+            j = self.memories[(name, s)]
+            d = self.local(f"{port}.{data}{s}")
+            self.lines.append(f"    _write(M{j}, {addr}, {x}, {d})")
+
+    def latch(self, m: _Memory, port: str, en: str) -> None:
+        a = f"A{self.ports[port]}"
+        addr = self.local(f"{port}.addr")
+        if m.latency == 1:
+            self.lines.append(f"    {a}[0] = _where({en}, {addr}, {a}[0])")
+        elif m.latency:
+            self.lines.append(f"    {a}.append(_where({en}, {addr}, {a}[-1]))")
+            self.lines.append(f"    del {a}[0]")
+
+
+def _dtype(type: tuple):
+    return object if type[1] > _WIDE else np.int64
+
+
+class _BatchSimulator(_CompiledSimulator):
+    """Simulates lanes of a design by running its compiled program on
+    arrays. Inputs are poked with integers (same value in all lanes)
+    or arrays with one value per lane, and peek() returns arrays.
+    """
+
+    lanes: int
+    C: Any
+
+    def __init__(self, program: _Program, lanes: int):
+        super().__init__(program)
+        self.lanes = lanes
+        types = program.design.types
+        self.values = [
+            np.zeros(lanes, dtype=_dtype(types[k])) for k in program.slots
+        ]
+        memories = program.design.memories
+        self.M = []
+        for name, s in program.memories:
+            m = memories[name]
+            t = dict(m.leaves)[s]
+            self.M.append(np.zeros((m.depth, lanes), dtype=_dtype(t)))
+        self.A = []
+        for port in program.ports:
+            m = memories[port.rsplit(".", 1)[0]]
+            self.A.append([np.zeros(lanes, np.int64)] * m.latency)
+        self.C = np.zeros((len(program.design.covers), lanes), np.int64)
+
+    def _input(self, key: str, value: Any, type: tuple) -> Any:
+        if not isinstance(value, (int, np.ndarray)):
+            raise TypeError(f"Cannot poke {key} with {value}")
+        x = np.broadcast_to(np.asarray(value, dtype=_dtype(type)), self.lanes)
+        size = type[1]
+        mask = (1 << size) - 1
+        if type[0] == "sint":
+            half = 1 << (size - 1)
+            return ((x + half) & mask) - half
+        return x & mask
+
+    def value(self, key: str) -> Any:
+        return np.broadcast_to(super().value(key), self.lanes)
+
+    def coverage(self) -> dict[str, int]:
+        """Return number of cycles each cover point was hit, summed over
+        all lanes"""
+        return {
+            name: int(c.sum()) for name, c in zip(self.design.covers, self.C)
+        }
+
+    def printed(self, lane: Optional[int] = None) -> list[str]:
+        """Return output of the printf statements of lane so far, or of
+        all lanes, prefixed by lane number"""
+        lines = []
+        for e in self.log:
+            if self.design.statements[e[0]][0] != "printf":
+                continue
+            enabled = np.broadcast_to(e[2], self.lanes)
+            if lane is not None:
+                if enabled[lane]:
+                    lines.append(self._text(e, lane))
+                continue
+            for i in np.flatnonzero(enabled):
+                lines.append(f"{i}: {self._text(e, i)}")
+        return lines
+
+    def _text(self, entry: tuple, lane: Optional[int] = None) -> str:
+        """Return formatted message of log entry (k, cycle, enabled
+        lanes, *values) of lane, or of first enabled lane"""
+        k, _, enabled, *values = entry
+        prefix = ""
+        if lane is None:
+            lanes = np.flatnonzero(np.broadcast_to(enabled, self.lanes))
+            lane = int(lanes[0])
+            prefix = f"lane {', '.join(map(str, lanes))}: "
+        *_, fstr, args = self.design.statements[k]
+        values = [int(np.broadcast_to(v, self.lanes)[lane]) for v in values]
+        return prefix + _format(fstr, args, values)
+
+    def memory(self, name: str) -> Any:
+        """Return contents of memory, as dict from data leaf name (like
+        .a.b[2], empty for ground type memories) to array indexed by
+        address and lane"""
+        return {
+            s: self.M[j]
+            for (n, s), j in self.program.memories.items()
+            if n == name
+        }
+
+
+def batch_simulator(
+    name: str, lanes: int, db: Optional[DB] = None
+) -> _BatchSimulator:
+    """Return simulator of lanes independent instances of module with
+    given name (circuit::module), for instance for simulating many
+    random stimuli at once. Requires NumPy.
+    """
+    if np is None:
+        raise ImportError("Batch simulation requires numpy")
+    return _BatchSimulator(program(name, db, _BatchEmitter), lanes)
@@ -3,7 +3,7 @@
 from contextlib import contextmanager
 from enum import Enum
 from typing import Union, Tuple, Any, Type
-from ._db import MODULE, DB
+from ._db import MODULE, DB, first_member, validation_cache
 from ._hwtypes import (
     equal,
     clock,
@@ -481,7 +481,7 @@ class _StructVar(_Var):
                 "Cannot assign non-equivalent type "
                 f"{show_type(value.expr[0])} to {show_type(item.expr)}"
             )
-        self._builder._code.append(
+        self._builder._add(
             ("connect", (item.expr, (".", self.expr, name)), value.expr)
         )
 
@@ -520,7 +520,7 @@ class _ArrayVar(_Var):
                 "Cannot assign non-equivalent type "
                 f"{show_type(value.expr[0])} to {show_type(type.expr)}"
             )
-        self._builder._code.append(
+        self._builder._add(
             (
                 "connect",
                 (self._type.type.expr, ("[]", self.expr, idx.expr)),
@@ -576,7 +576,7 @@ class _InstanceVar(_Var):
                     "Cannot assign non-equivalent type "
                     f"{show_type(value.expr[0])} to {show_type(item[1])}"
                 )
-            self._builder._code.append(
+            self._builder._add(
                 ("connect", (item[1], (".", self.expr, name)), value.expr)
             )
             return
@@ -605,8 +605,9 @@ class _CodeBuilder:
     _data: dict[str, tuple]
     _code: list[tuple]
     _db: DB
+    _valid: dict[int, tuple]
 
-    _VARS = set(("_name", "_module", "_data", "_db", "_code"))
+    _VARS = set(("_name", "_module", "_data", "_db", "_code", "_valid"))
 
     def __init__(self, name: str, module: MODULE, db: DB):
         self._name = name
@@ -614,6 +615,12 @@ class _CodeBuilder:
         self._data = module["data"]
         self._db = db
         self._code = module["code"]
+        self._valid = validation_cache(db)
+
+    def _add(self, statement: tuple) -> None:
+        """Add statement, and mark module as modified"""
+        self._code.append(statement)
+        self._valid.pop(id(self._module), None)
 
     def __getattr__(self, name: str) -> _Var:
         if not (item := self._data.get(name)):
@@ -646,7 +653,7 @@ class _CodeBuilder:
                     "Cannot assign non-equivalent type "
                     f"{show_type(value.expr[0])} to {show_type(item[1])}"
                 )
-            self._code.append(("connect", (item[1], name), value.expr))
+            self._add(("connect", (item[1], name), value.expr))
         else:
             raise TypeError(f"Cannot assign to {kind} {name}")
 
@@ -684,8 +691,9 @@ class _CodeBuilder:
         try:
             yield None
         finally:
-            code.append(("when", _logic_value(expr).expr, tuple(self._code)))
+            stmt = ("when", _logic_value(expr).expr, tuple(self._code))
             self._code = code
+            self._add(stmt)
 
     @contextmanager
     def elif_stmt(self, expr: _IntExpr):
@@ -695,10 +703,9 @@ class _CodeBuilder:
         try:
             yield None
         finally:
-            code.append(
-                ("else-when", _logic_value(expr).expr, tuple(self._code))
-            )
+            stmt = ("else-when", _logic_value(expr).expr, tuple(self._code))
             self._code = code
+            self._add(stmt)
 
     @contextmanager
     def else_stmt(self):
@@ -708,8 +715,9 @@ class _CodeBuilder:
         try:
             yield None
         finally:
-            code.append(("else", tuple(self._code)))
+            stmt = ("else", tuple(self._code))
             self._code = code
+            self._add(stmt)
 
     def and_expr(self, *ops):
         ops2 = [_logic_value(x) for x in ops]
@@ -723,9 +731,8 @@ class _CodeBuilder:
         return _NotExpr(_logic_value(op))
 
     def _find_clk(self):
-        for n, v in self._module["data"].items():
-            if v[1] == ("clock", 1):
-                return self[n]
+        if name := first_member(self._db, self._module, "clock"):
+            return self[name]
         raise ValueError(f"Module {self._name} has no clock")
 
     def _fmt_stmt(self, kind: str, xargs) -> None:
@@ -748,10 +755,10 @@ class _CodeBuilder:
             case str(fmt), *pp if kind != "coverf":
                 params.append(fmt)
                 params += [x.expr for x in pp]
-                self._code.append((kind, *params))
+                self._add((kind, *params))
             case str(fmt), if kind == "coverf":
                 params.append(fmt)
-                self._code.append((kind, *params))
+                self._add((kind, *params))
             case _:
                 raise ValueError(f"Malformed {kind} statement: {xargs}")
 
@@ -1,8 +1,10 @@
 """Convert python code for code generation"""
 
 from ._ast import parse_func
+from ._builder import _ConstExpr
 import ast
-from typing import Tuple, Any, Dict, Callable
+from collections.abc import Mapping
+from typing import Tuple, Any, Dict, Callable, Optional
 
 
 def _member_func_call(var: str, memb: str, params: Tuple[Any, ...]):
@@ -38,7 +40,7 @@ class _Replacer(ast.NodeTransformer):
     and logical expressions (and/or/not) with function calls
     """
 
-    def __init__(self, var: str, module: dict):
+    def __init__(self, var: str, module: Mapping):
         super().__init__()
         self.var = var
         self.module = module
@@ -91,11 +93,195 @@ class _Replacer(ast.NodeTransformer):
         return node
 
 
-def _replace(tree: ast.AST, var: str, module: dict):
+def _replace(tree: ast.AST, var: str, module: Mapping):
     tree = ast.fix_missing_locations(_Replacer(var, module).visit(tree))
     return tree
 
 
+_IDX = "_hamp_idx"
+_const_nodes = (
+    ast.Constant,
+    ast.Name,
+    ast.Load,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.operator,
+    ast.unaryop,
+)
+
+
+def _const_int(node: ast.expr, consts: Dict[str, Any]) -> Optional[int]:
+    """Return value of integer expression only using constants,
+    or None if not a constant integer expression"""
+    for n in ast.walk(node):
+        if not isinstance(n, _const_nodes):
+            return None
+        if isinstance(n, ast.Name) and n.id not in consts:
+            return None
+    expr = ast.fix_missing_locations(ast.Expression(body=node))
+    try:
+        value = eval(compile(expr, "<index>", "eval"), {}, consts)
+    except Exception:
+        return None
+    return value if type(value) is int else None
+
+
+def _stores(nodes: list, name: str) -> bool:
+    """Return True if name is assigned in nodes, or in nested scopes"""
+    for node in nodes:
+        for n in ast.walk(node):
+            if isinstance(n, (ast.FunctionDef, ast.Lambda, ast.ClassDef)):
+                return True
+            if (
+                isinstance(n, ast.Name)
+                and n.id == name
+                and not isinstance(n.ctx, ast.Load)
+            ):
+                return True
+    return False
+
+
+class _IndexResolver(ast.NodeTransformer):
+    """Resolve array indexes of module members at conversion time.
+
+    Constant indexes, and loop variables of for-loops over constant
+    ranges, are replaced with lookups in a table of pre-built index
+    expressions. The range check is then done once here, and not on
+    each access.
+    """
+
+    def __init__(self, var: str, module: Mapping, consts: Dict[str, Any]):
+        super().__init__()
+        self.var = var
+        self.data = module["data"]
+        self.consts = consts
+        self.loops: Dict[str, range] = {}
+        self.size = 0
+        self.depth = 0
+
+    def visit_FunctionDef(self, node):
+        # Names in nested functions may shadow constants, leave them be
+        self.depth += 1
+        if self.depth == 1:
+            self.generic_visit(node)
+        self.depth -= 1
+        return node
+
+    def visit_Lambda(self, node):
+        return node
+
+    def _type(self, node: ast.AST) -> Optional[tuple]:
+        """Return hardware type of expression, if known"""
+        match node:
+            case ast.Attribute(value=ast.Name(id=var), attr=name) if (
+                var == self.var
+            ):
+                item = self.data.get(name)
+                if item and item[0] in ("input", "output", "wire", "register"):
+                    return item[1]
+            case ast.Attribute(value=value, attr=name):
+                t = self._type(value)
+                if t and t[0] == "struct":
+                    for f in t[1:]:
+                        if f[0] == name:
+                            return f[1]
+            case ast.Subscript(value=value, slice=idx) if self._index(idx):
+                t = self._type(value)
+                if t and t[0] == "array":
+                    return t[2]
+        return None
+
+    def _index(self, node: ast.AST) -> Optional[range]:
+        """Return range of possible values of index expression"""
+        match node:
+            case ast.Constant(value=int(i)) if type(i) is int:
+                return range(i, i + 1)
+            case ast.Name(id=name) if name in self.loops:
+                return self.loops[name]
+            case ast.Subscript(value=ast.Name(id=name), slice=idx) if (
+                name == _IDX
+            ):
+                return self._index(idx)
+        return None
+
+    def _range(self, node: ast.For) -> Optional[range]:
+        match node:
+            case ast.For(
+                target=ast.Name(),
+                iter=ast.Call(
+                    func=ast.Name(id="range"), args=args, keywords=[]
+                ),
+            ) if (
+                0 < len(args) <= 3 and self.consts.get("range", range) is range
+            ):
+                values = [
+                    v
+                    for a in args
+                    if (v := _const_int(a, self.consts)) is not None
+                ]
+                if len(values) == len(args):
+                    try:
+                        return range(*values)
+                    except ValueError:
+                        pass
+        return None
+
+    def visit_For(self, node):
+        r = self._range(node)
+        name = getattr(node.target, "id", "")
+        if r is None or _stores(node.body, name):
+            # Loop variable is not known to stay within the range
+            outer = self.loops.pop(name, None)
+            self.generic_visit(node)
+            if outer is not None:
+                self.loops[name] = outer
+            return node
+        outer = self.loops.get(name)
+        self.loops[name] = r
+        node.body = [self.visit(x) for x in node.body]
+        if outer is None:
+            del self.loops[name]
+        else:
+            self.loops[name] = outer
+        node.orelse = [self.visit(x) for x in node.orelse]
+        return node
+
+    def visit_Subscript(self, node):
+        self.generic_visit(node)
+        idx = self._index(node.slice)
+        if idx is None or not idx or isinstance(node.slice, ast.Subscript):
+            return node
+        t = self._type(node.value)
+        if t and t[0] == "array" and 0 <= min(idx) and max(idx) < t[1]:
+            self.size = max(self.size, max(idx) + 1)
+            node.slice = ast.Subscript(
+                value=ast.Name(id=_IDX, ctx=ast.Load()),
+                slice=node.slice,
+                ctx=ast.Load(),
+            )
+        return node
+
+
+def _resolve_indexes(
+    tree: ast.AST, var: str, module: Mapping, consts: Dict[str, Any]
+) -> Tuple[ast.AST, tuple]:
+    """Resolve array indexes, return tree and index expression table"""
+    resolver = _IndexResolver(var, module, consts)
+    tree = ast.fix_missing_locations(resolver.visit(tree))
+    table = _index_table(resolver.size) if resolver.size else ()
+    return tree, table
+
+
+_index_exprs: list[_ConstExpr] = []
+
+
+def _index_table(size: int) -> tuple:
+    """Return table of unsigned constant index expressions 0..size-1"""
+    for i in range(len(_index_exprs), size):
+        _index_exprs.append(_ConstExpr(i, False))
+    return tuple(_index_exprs[:size])
+
+
 def _cell_contentes(cell):
     try:
         return cell.cell_contents
@@ -120,16 +306,34 @@ def _restore_empty_lines(source, empty_lines):
     return "\n".join(lines)
 
 
-def convert(func: Callable, module: dict) -> Tuple[Callable, str]:
+def symbols(func: Callable) -> Dict[str, Any]:
+    """Return the global and closure variables of function, as bound
+    now"""
+    return {**func.__globals__, **_closure_locals(func)}
+
+
+def convert(
+    func: Callable, module: Mapping, syms: Optional[Dict[str, Any]] = None
+) -> Tuple[Callable, str]:
     """Convert function to code generator, and return converted function
 
     If statements with hardware expressions are replaced with
     if_stmt/elif_stmt/else_stmt with-statements.
 
     and/or/not eppressions are replaced with and_expr/or_expr/no_expr calls.
+
+    Array indexes that are constant, or loop variables of for-loops
+    over constant ranges, are resolved at conversion time.
+
+    Global and closure variables are taken from syms if given (see
+    symbols()), otherwise from their current bindings.
     """
     tree, empty_lines = parse_func(func)
     var = func.__code__.co_varnames[0]
+    syms = dict(syms) if syms is not None else symbols(func)
+    local = set(func.__code__.co_varnames) | set(func.__code__.co_cellvars)
+    consts = {k: v for k, v in syms.items() if k not in local}
+    tree, indexes = _resolve_indexes(tree, var, module, consts)
     dtree = _replace(tree, var, module)
     srccode = _restore_empty_lines(ast.unparse(dtree), empty_lines)
     # Remove @xx.code decorator:
@@ -139,7 +343,8 @@ def convert(func: Callable, module: dict) -> Tuple[Callable, str]:
     file = func.__code__.co_filename
     line = func.__code__.co_firstlineno + 1
     code = compile(srccode, file, "exec")
-    syms: Dict[str, Any] = {**func.__globals__, **_closure_locals(func)}
+    if indexes:
+        syms[_IDX] = indexes
     exec(code, syms)
     newfunc = syms[func.__name__]
     newfunc.__code__ = newfunc.__code__.replace(co_firstlineno=line)
@@ -4,7 +4,11 @@ Stores module data
 """
 
 import re
-from typing import Union, TypedDict, Optional
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from contextvars import ContextVar
+from copy import deepcopy
+from typing import Union, TypedDict, NamedTuple, Optional, Callable, Any
 
 TL = tuple
 DB = dict[str, dict]
@@ -12,27 +16,375 @@ VAL = Union[str, tuple, int]
 VAR = Union[str, tuple]
 VARS = dict[str, tuple]
 DATA = dict[str, TL]
-NL = list[str]
+NAMES = Union[list[str], dict[str, None]]
 ATTR = dict[str, Union[str, int, dict, list]]
 
 
 class MODULE(TypedDict):
-    input: list[str]
-    output: list[str]
-    wire: list[str]
-    register: list[str]
-    instance: list[str]
-    attribute: list[str]
+    input: NAMES
+    output: NAMES
+    wire: NAMES
+    register: NAMES
+    instance: NAMES
+    attribute: NAMES
     data: dict[str, tuple]
     code: list[tuple]
 
 
-default: DB = {"circuits": {}}
+class _Database(dict):
+    """Database dict.
+
+    Besides the data (in the intermediate data format), it carries
+    derived data that is not part of the format, like pending code and
+    indexes. The derived data is not copied or pickled with the data.
+    """
+
+    extra: dict[str, Any]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.extra = {}
+
+    def __reduce__(self):
+        return (_Database, (dict(self),))
 
 
 def create() -> DB:
     """Create empty DB"""
-    return {"circuits": {}}
+    return _Database(circuits={})
+
+
+default: DB = create()
+
+
+def extra(db: DB, key: str, factory: Callable[[], Any]) -> Any:
+    """Return derived data stored under key in db, created by calling
+    factory if not present.
+    A database that is a plain dict cannot store derived data, so
+    new data is created on each call.
+    """
+    store = getattr(db, "extra", None)
+    if store is None:
+        return factory()
+    if (x := store.get(key)) is None:
+        x = store[key] = factory()
+    return x
+
+
+class _TypeIndex:
+    """Index of the ports, wires and registers of a module by type kind
+    (uint, clock, reset etc.), in order of definition"""
+
+    module: MODULE
+    kinds: dict[str, dict[str, int]]
+    seq: int
+
+    def __init__(self, module: MODULE):
+        self.module = module
+        self.kinds = {}
+        self.seq = 0
+        for name, item in module["data"].items():
+            self.add(name, item)
+
+    def add(self, name: str, item: tuple) -> None:
+        if item[0] in _typed_kinds:
+            self.kinds.setdefault(item[1][0], {})[name] = self.seq
+            self.seq += 1
+
+    def remove(self, name: str, item: tuple) -> None:
+        if item[0] in _typed_kinds:
+            self.kinds.get(item[1][0], {}).pop(name, None)
+
+    def first(self, kinds: tuple[str, ...]) -> Optional[str]:
+        """Return name of first member with type of any of given kinds"""
+        found = None
+        seq = self.seq
+        for kind in kinds:
+            for name, s in self.kinds.get(kind, {}).items():
+                if s < seq:
+                    found, seq = name, s
+                break
+        return found
+
+
+_typed_kinds = ("input", "output", "wire", "register")
+
+
+def _type_indexes(db: DB) -> dict[int, _TypeIndex]:
+    return extra(db, "types", dict)
+
+
+def member_added(db: DB, module: MODULE, name: str) -> None:
+    """Update indexes after a member has been added to module"""
+    item = module["data"][name]
+    if (idx := _type_indexes(db).get(id(module))) is not None:
+        idx.add(name, item)
+    _instances_changed(db, module, item)
+    modified(db, module, item[0] in ("input", "output"))
+
+
+def member_removed(db: DB, module: MODULE, name: str, item: tuple) -> None:
+    """Update indexes after a member has been removed from module"""
+    if (idx := _type_indexes(db).get(id(module))) is not None:
+        idx.remove(name, item)
+    _instances_changed(db, module, item)
+    modified(db, module, item[0] in ("input", "output"))
+
+
+NODE = tuple[str, str]
+
+
+class _Hierarchy:
+    """Instance hierarchy of the modules of a database, with the number
+    of instances of each child in each parent.
+    A module is (re-)indexed when it is first visited after it was added,
+    replaced, or had instances added or removed. The parents of modules
+    are kept up to date by indexing all modules once, and then only
+    the modules that were added (see module_added()) or had instances
+    added or removed since.
+    """
+
+    db: DB
+    modules: dict[NODE, MODULE]
+    nodes: dict[int, NODE]
+    sizes: dict[NODE, int]
+    _children: dict[NODE, dict[NODE, int]]
+    _parents: dict[NODE, dict[NODE, int]]
+    stale: set[int]
+    added: set[NODE]
+    synced: bool
+
+    def __init__(self, db: DB):
+        self.db = db
+        self.modules = {}
+        self.nodes = {}
+        self.sizes = {}
+        self._children = {}
+        self._parents = {}
+        self.stale = set()
+        self.added = set()
+        self.synced = False
+
+    def children(self, node: NODE) -> dict[NODE, int]:
+        """Return modules instantiated by module, with instance counts"""
+        cn, mn = node
+        m = self.db["circuits"].get(cn, {}).get(mn)
+        if (
+            self.modules.get(node) is not m
+            or id(m) in self.stale
+            or self.sizes[node] != len(m["instance"])  # type: ignore
+        ):
+            self._remove(node)
+            if m is None:
+                return {}
+            self._add(node, m)
+            self.stale.discard(id(m))
+        return self._children[node]
+
+    def parents(self, node: NODE) -> dict[NODE, int]:
+        """Return modules instantiating module, with instance counts"""
+        self._update()
+        # Parents may have been removed or replaced
+        for parent in list(self._parents.get(node, ())):
+            self.children(parent)
+        return self._parents.get(node, {})
+
+    def _update(self) -> None:
+        """Index all modules the first time, then the added modules and
+        those with added or removed instances"""
+        if not self.synced:
+            self._sync()
+            self.synced = True
+            self.added.clear()
+            return
+        for node in self.added:
+            self.children(node)
+        self.added.clear()
+        for i in list(self.stale):
+            if (n := self.nodes.get(i)) is not None:
+                self.children(n)
+        # The remaining are of modules not indexed
+        self.stale.clear()
+
+    def _sync(self) -> None:
+        """Index all modules"""
+        for node in list(self.modules):
+            self.children(node)
+        for cn, modules in self.db["circuits"].items():
+            for mn in modules:
+                self.children((cn, mn))
+
+    def _add(self, node: NODE, module: MODULE) -> None:
+        self.modules[node] = module
+        self.nodes[id(module)] = node
+        self.sizes[node] = len(module["instance"])
+        children = self._children[node] = {}
+        for child in instances(module):
+            children[child] = children.get(child, 0) + 1
+        for child, n in children.items():
+            self._parents.setdefault(child, {})[node] = n
+
+    def _remove(self, node: NODE) -> None:
+        if (m := self.modules.pop(node, None)) is None:
+            return
+        if self.nodes.get(id(m)) == node:
+            del self.nodes[id(m)]
+        del self.sizes[node]
+        for child in self._children.pop(node):
+            del self._parents[child][node]
+
+    def reachable(self, *tops: NODE) -> list[NODE]:
+        """Return the given modules and all modules instantiated by them,
+        directly or indirectly, in depth first order"""
+        found: dict[NODE, None] = {}
+        todo = list(reversed(tops))
+        while todo:
+            node = todo.pop()
+            if node not in found:
+                found[node] = None
+                todo.extend(reversed(self.children(node)))
+        return list(found)
+
+    def topological(self, *tops: NODE) -> list[NODE]:
+        """Return modules (reachable from tops, or all modules), with all
+        children before their parents"""
+        if not tops:
+            self._sync()
+            tops = tuple(self.modules)
+        order: dict[NODE, None] = {}
+        visiting = set()
+        for top in tops:
+            if top in order:
+                continue
+            todo = [(top, iter(self.children(top)))]
+            visiting.add(top)
+            while todo:
+                node, children = todo[-1]
+                for child in children:
+                    if child not in order and child not in visiting:
+                        visiting.add(child)
+                        todo.append((child, iter(self.children(child))))
+                        break
+                else:
+                    todo.pop()
+                    order[node] = None
+        return list(order)
+
+    def instance_counts(self, top: NODE) -> dict[NODE, int]:
+        """Return number of instances of each module in the hierarchy
+        below top, counting top as one"""
+        counts = {top: 1}
+        for node in reversed(self.topological(top)):
+            n = counts[node]
+            for child, k in self.children(node).items():
+                counts[child] = counts.get(child, 0) + n * k
+        return counts
+
+
+def hierarchy(db: DB) -> _Hierarchy:
+    """Return instance hierarchy of db.
+    The hierarchy is kept in db and updated when modules or instances
+    are added or removed.
+    """
+    return extra(db, "hierarchy", lambda: _Hierarchy(db))
+
+
+def module_added(db: DB, circuit: str, module: str) -> None:
+    """Update indexes after a module has been added to db.
+    This is done by create_module() and the module API, but needs to be
+    called if a module is added by other means.
+    """
+    h = getattr(db, "extra", {}).get("hierarchy")
+    if h is not None and h.synced:
+        h.added.add((circuit, module))
+
+
+def _instances_changed(db: DB, module: MODULE, item: tuple) -> None:
+    if item[0] == "instance":
+        h = getattr(db, "extra", {}).get("hierarchy")
+        if h is not None:
+            h.stale.add(id(module))
+
+
+def validation_cache(db: DB) -> dict[int, tuple]:
+    """Return validation cache of db, with an entry for each module
+    validated since it was last modified, keyed on module id"""
+    return extra(db, "valid", dict)
+
+
+def _port_versions(db: DB) -> dict[int, int]:
+    return extra(db, "ports", dict)
+
+
+def modified(db: DB, module: MODULE, ports: bool = False) -> None:
+    """Mark module as modified, so that it is checked by the next
+    incremental validation. If ports is True, its ports were changed,
+    and modules instantiating it are checked as well.
+    This is done by the module API and code builder, but needs to be
+    called if the module data is changed by other means.
+    """
+    validation_cache(db).pop(id(module), None)
+    if ports:
+        versions = _port_versions(db)
+        versions[id(module)] = versions.get(id(module), 0) + 1
+
+
+def first_member(db: DB, module: MODULE, *kinds: str) -> Optional[str]:
+    """Return name of first port, wire or register of module with a
+    type of any of the given kinds, or None if there is none.
+    Uses an index of the module members kept in db, which is rebuilt
+    if found to be out of date.
+    """
+    indexes = _type_indexes(db)
+    if (idx := indexes.get(id(module))) is not None:
+        name = idx.first(kinds)
+        item = module["data"].get(name) if name else None
+        if item and item[0] in _typed_kinds and item[1][0] in kinds:
+            return name
+    # Members may have been added or removed by other means:
+    idx = indexes[id(module)] = _TypeIndex(module)
+    return idx.first(kinds)
+
+
+def instances(module: MODULE) -> list[tuple[str, str]]:
+    """Return (circuit, module) names of modules instantiated by module"""
+    data = module["data"]
+    return [data[name][1][1:3] for name in module["instance"]]
+
+
+KINDS = ("input", "output", "wire", "register", "instance", "attribute")
+
+
+def ordered(module: MODULE) -> MODULE:
+    """Convert name lists of module to insertion ordered dicts
+    (with None values), in place, unless already done. Return module.
+    Dicts make adding and removing names O(1).
+    """
+    for kind in KINDS:
+        names = module.get(kind)
+        if isinstance(names, list):
+            module[kind] = dict.fromkeys(names)  # type: ignore
+    return module
+
+
+def export(db: DB) -> DB:
+    """Return db in the documented data format, with lists of names.
+    Data and code are shared with db, not copied.
+    """
+    return {
+        "circuits": {
+            cn: {mn: _export_module(m) for mn, m in modules.items()}
+            for cn, modules in db["circuits"].items()
+        }
+    }
+
+
+def _export_module(module: MODULE) -> MODULE:
+    m: Any = dict(module)
+    for kind in KINDS:
+        if (names := m.get(kind)) is not None:
+            m[kind] = list(names)
+    return m
 
 
 def create_module(db: DB, circuit: str, module: str) -> MODULE:
@@ -42,97 +394,334 @@ def create_module(db: DB, circuit: str, module: str) -> MODULE:
         raise NameError(f"Module {circuit}::{module} already defined")
     m: MODULE
     circ[module] = m = {
-        "input": [],
-        "output": [],
-        "wire": [],
-        "register": [],
-        "instance": [],
-        "attribute": [],
+        "input": {},
+        "output": {},
+        "wire": {},
+        "register": {},
+        "instance": {},
+        "attribute": {},
         "data": {},
         "code": [],
     }
+    module_added(db, circuit, module)
     return m
 
 
-def validate(db: DB) -> None:
-    """Validate that db is a valid modules database"""
+def copy_module(module: MODULE) -> MODULE:
+    """Return copy of module.
+    The name lists, data dict and code list are copied, while the
+    (immutable) data item and statement tuples are shared with the
+    original. Attribute values, which can be modified in place, are
+    copied.
+    """
+    src: Any = module
+    m: Any = {k: v.copy() for k, v in src.items()}
+    data = m["data"]
+    for name, item in data.items():
+        if isinstance(item[-1], (dict, list)):
+            data[name] = (*item[:-1], deepcopy(item[-1]))
+    return m
+
+
+class Diagnostic(NamedTuple):
+    """Validation problem found by diagnose()
+
+    path locates the problem within the module: (kind, name) for members,
+    ("code", index, ...) for statements, with one index per nesting level.
+    """
+
+    circuit: str
+    module: str
+    path: tuple[Union[str, int], ...]
+    message: str
+
+
+class _Collector:
+    """Collects validation problems, located by circuit and module, or
+    raises the first one if not collecting. Also holds the types
+    validated during the validation and the counts of type checks."""
+
+    diagnostics: Optional[list[Diagnostic]]
+    location: tuple[str, str]
+    types: dict[tuple, None]
+    ids: dict[int, tuple]
+    checks: dict[str, int]
+
+    def __init__(self, collect: bool = False):
+        self.diagnostics = [] if collect else None
+        self.location = ("", "")
+        self.types = {}
+        self.ids = {}
+        self.checks = {"validated": 0, "saved": 0}
+
+    def report(self, e: ValueError, *path: Union[str, int]) -> None:
+        """Record validation error when collecting diagnostics, otherwise
+        raise it"""
+        if self.diagnostics is None:
+            raise e
+        self.diagnostics.append(Diagnostic(*self.location, path, str(e)))
+
+    def count(self) -> int:
+        return len(self.diagnostics or ())
+
+
+def diagnose(db: DB, jobs: int = 1) -> list[Diagnostic]:
+    """Validate db like validate(), but return all problems found instead
+    of raising ValueError for the first one"""
+    out = _Collector(collect=True)
+    _validate(db, False, jobs, out)
+    return out.diagnostics  # type: ignore[return-value]
+
+
+def validate(db: DB, incremental: bool = False, jobs: int = 1) -> None:
+    """Validate that db is a valid modules database
+
+    If incremental is True, modules that were validated by an earlier
+    incremental validation are only checked again if they, or the ports
+    of modules they instantiate, have been modified since (see
+    modified()).
+
+    If jobs is larger than 1, modules are validated in parallel by that
+    many processes, and the errors found in all modules are reported.
+
+    Each distinct type is only validated once, type_checks counts the
+    validated types and the checks that were saved by the last validate()
+    or diagnose() call.
+
+    Pending code of lazy modules is elaborated first.
+    """
+    _validate(db, incremental, jobs, _Collector())
+
+
+def _validate(db: DB, incremental: bool, jobs: int, out: _Collector) -> None:
+    from ._module import elaborate  # Imports this module
+
+    elaborate(db=db)
+    token = _collector.set(out)
+    try:
+        _validate_db(db, incremental, jobs, out)
+    finally:
+        _collector.reset(token)
+        type_checks.update(out.checks)
+
+
+def _validate_db(
+    db: DB, incremental: bool, jobs: int, out: _Collector
+) -> None:
+    cache = validation_cache(db) if incremental else None
+    todo: list[tuple[str, str, MODULE]] = []
+
+    def check(circuit: str, name: str, module: MODULE) -> None:
+        if cache is not None and _validated(module, db, cache):
+            return
+        if jobs > 1:
+            todo.append((circuit, name, module))
+            return
+        out.location = (circuit, name)
+        errors = out.count()
+        _validate_module(name, module, db, out)
+        if cache is not None and errors == out.count():
+            cache[id(module)] = (module, _dependencies(module, db))
+
     match db:
-        case {"circuits": dict(x), **kw}:
+        case {"circuits": Mapping() as x, **kw}:
             if kw:
-                raise ValueError(
-                    "Malformed database, expecting only circuits key"
+                out.report(
+                    ValueError(
+                        "Malformed database, expecting only circuits key"
+                    )
                 )
             for c in x.items():
                 match c:
-                    case (str(name), dict(modules)):
-                        _validate_circuit(name, modules, db)
+                    case (str(name), Mapping() as modules):
+                        _validate_circuit(name, modules, check, out)
                     case _:
-                        raise ValueError(f"Malformed circuit entry: {c}")
+                        out.location = ("", "")
+                        out.report(ValueError(f"Malformed circuit entry: {c}"))
         case _:
-            raise ValueError("Malformed database, expecting only circuits key")
+            out.report(
+                ValueError("Malformed database, expecting only circuits key")
+            )
+    if todo:
+        _validate_parallel(todo, db, jobs, cache, out)
 
 
-def _validate_circuit(name: str, modules: DB, db: DB) -> None:
+def _validate_circuit(
+    circuit: str,
+    modules: Mapping,
+    check: Callable[[str, str, MODULE], None],
+    out: _Collector,
+) -> None:
     """Validate circuit entry"""
     for m in modules.items():
         match m:
             case (str(name), dict(items)):
-                _validate_module(name, items, db)
+                check(circuit, name, items)  # type: ignore[arg-type]
             case _:
-                raise ValueError(
-                    f"Malformed module entry in circuit {name}: {m}"
+                out.location = (circuit, "")
+                out.report(
+                    ValueError(
+                        f"Malformed module entry in circuit {circuit}: {m}"
+                    )
                 )
 
 
-def _validate_module(name: str, items: DB, db: DB) -> None:
+def _validate_parallel(
+    todo: list[tuple[str, str, MODULE]],
+    db: DB,
+    jobs: int,
+    cache: Optional[dict],
+    out: _Collector,
+) -> None:
+    """Validate modules using a pool of jobs processes.
+    Each module is sent along with the ports of the modules it
+    instantiates.
+    """
+    tasks = [(cn, mn, m, _port_db(m, db)) for cn, mn, m in todo]
+    chunksize = max(1, len(tasks) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(_validate_task, tasks, chunksize=chunksize))
+    errors = []
+    for (_, _, module), (diagnostics, counts) in zip(todo, results):
+        for k, n in counts.items():
+            out.checks[k] += n
+        if diagnostics:
+            errors.extend(diagnostics)
+        elif cache is not None:
+            cache[id(module)] = (module, _dependencies(module, db))
+    if out.diagnostics is not None:
+        out.diagnostics.extend(errors)
+    elif errors:
+        raise ValueError("\n".join(d.message for d in errors))
+
+
+def _validate_task(
+    task: tuple[str, str, MODULE, DB],
+) -> tuple[list[Diagnostic], dict[str, int]]:
+    """Validate module, return the problems found and the type checks"""
+    circuit, name, module, db = task
+    out = _Collector(collect=True)
+    out.location = (circuit, name)
+    token = _collector.set(out)
+    try:
+        _validate_module(name, module, db, out)
+    finally:
+        _collector.reset(token)
+    return out.diagnostics, out.checks  # type: ignore[return-value]
+
+
+def _port_db(module: MODULE, db: DB) -> DB:
+    """Return database with the ports of modules instantiated by module"""
+    circuits: DB = {}
+    data = module.get("data", {})
+    for name in module.get("instance", ()):
+        match data.get(name):
+            case ("instance", ("instance", str(cn), str(mn)), *_):
+                try:
+                    m = db["circuits"][cn][mn]
+                except KeyError:
+                    continue
+                # Ports without data are left out of data, and reported
+                # by the validation of the instance
+                inputs, outputs = m.get("input", ()), m.get("output", ())
+                pdata = m.get("data", {})
+                circuits.setdefault(cn, {})[mn] = {
+                    "input": list(inputs),
+                    "output": list(outputs),
+                    "data": {
+                        p: pdata[p] for p in (*inputs, *outputs) if p in pdata
+                    },
+                }
+    return {"circuits": circuits}
+
+
+def _dependencies(module: MODULE, db: DB) -> tuple:
+    """Return instantiated modules and their port versions"""
+    versions = _port_versions(db)
+    deps = []
+    for cn, mn in set(instances(module)):
+        m = db["circuits"][cn][mn]
+        deps.append((cn, mn, m, versions.get(id(m), 0)))
+    return tuple(deps)
+
+
+def _validated(module: MODULE, db: DB, cache: dict) -> bool:
+    """Return True if module is validated and unmodified, and the ports of
+    the modules it instantiates are unmodified"""
+    entry = cache.get(id(module))
+    if entry is None or entry[0] is not module:
+        return False
+    versions = _port_versions(db)
+    circuits = db["circuits"]
+    for cn, mn, m, version in entry[1]:
+        if circuits.get(cn, {}).get(mn) is not m:
+            return False
+        if versions.get(id(m), 0) != version:
+            return False
+    return True
+
+
+def _validate_module(
+    name: str, items: MODULE, db: DB, out: _Collector
+) -> None:
     """Validate module entry"""
 
-    vars = {"module": name}
+    vars: dict[str, Any] = {"module": name}
     data = items["data"]
     data_cnt = 0
     for m in items.items():
         match m:
             case ("data", dict(_)):
                 pass
-            case ("input", list(ports)):
-                _validate_data(name, "input", ports, data, vars)
+            case ("input", list() | dict() as ports):
+                _validate_data(name, "input", ports, data, vars, out)
                 data_cnt += len(ports)
-            case ("output", list(ports)):
-                _validate_data(name, "output", ports, data, vars)
+            case ("output", list() | dict() as ports):
+                _validate_data(name, "output", ports, data, vars, out)
                 data_cnt += len(ports)
-            case ("wire", list(wires)):
-                _validate_data(name, "wire", wires, data, vars)
+            case ("wire", list() | dict() as wires):
+                _validate_data(name, "wire", wires, data, vars, out)
                 data_cnt += len(wires)
-            case ("register", list(registers)):
-                _validate_registers(name, registers, data, vars)
+            case ("register", list() | dict() as registers):
+                _validate_registers(name, registers, data, vars, out)
                 data_cnt += len(registers)
-            case ("instance", list(instances)):
-                _validate_instances(name, instances, data, vars, db)
+            case ("instance", list() | dict() as instances):
+                _validate_instances(name, instances, data, vars, db, out)
                 data_cnt += len(instances)
             case ("code", list(statements)):
-                _validate_code(name, statements, vars)
-            case ("attribute", list(attributes)):
-                _validate_module_attributes(name, attributes, data)
+                _validate_code(name, statements, vars, out, ("code",))
+            case ("attribute", list() | dict() as attributes):
+                _validate_module_attributes(name, attributes, data, out)
                 data_cnt += len(attributes)
             case _:
-                raise ValueError(f"Malformed item in module {name}: {m}")
+                out.report(
+                    ValueError(f"Malformed item in module {name}: {m}"),
+                    str(m[0]),
+                )
     if data_cnt != len(data):
-        raise ValueError(
-            f"Malformed data section in module {name}: {data_cnt} {len(data)}"
+        out.report(
+            ValueError(
+                f"Malformed data section in module {name}: "
+                f"{data_cnt} {len(data)}"
+            ),
+            "data",
         )
 
 
-def _validate_module_attributes(name, attributes, data) -> None:
+def _validate_module_attributes(name, attributes, data, out) -> None:
     for aname in attributes:
-        _validate_name(aname)
-        a = data[aname]
-        match a:
-            case ("attribute", value):
-                _validate_attribute_value(value)
-            case _:
-                raise ValueError(
-                    f"Malformed attribute entry in module {name}: {a}"
-                )
+        try:
+            _validate_name(aname)
+            a = data.get(aname)
+            match a:
+                case ("attribute", value):
+                    _validate_attribute_value(value)
+                case _:
+                    raise ValueError(
+                        f"Malformed attribute entry in module {name}: {a}"
+                    )
+        except ValueError as e:
+            out.report(e, "attribute", aname)
 
 
 def _validate_attributes(*attributes: ATTR) -> None:
@@ -168,20 +757,28 @@ def _validate_attribute_value(v):
 
 
 def _validate_data(
-    name: str, kind: str, names: NL, data: DATA, vars: VARS
+    name: str,
+    kind: str,
+    names: NAMES,
+    data: DATA,
+    vars: VARS,
+    out: _Collector,
 ) -> None:
     for pname in names:
-        _validate_name(pname)
-        p = data[pname]
-        match p:
-            case (str(k), type, *attributes) if k == kind:
-                _validate_type(type)
-                _validate_attributes(*attributes)
-                vars[pname] = (type, kind, attributes or {})
-            case _:
-                raise ValueError(
-                    f"Malformed {kind} entry in module {name}: {p}"
-                )
+        try:
+            _validate_name(pname)
+            p = data.get(pname)
+            match p:
+                case (str(k), type, *attributes) if k == kind:
+                    _validate_type(type)
+                    _validate_attributes(*attributes)
+                    vars[pname] = (type, kind, attributes or {})
+                case _:
+                    raise ValueError(
+                        f"Malformed {kind} entry in module {name}: {p}"
+                    )
+        except ValueError as e:
+            out.report(e, kind, pname)
 
 
 _clk_t = ("clock", 1)
@@ -189,122 +786,162 @@ _rst_types = (("reset", 1), ("async_reset", 1), ("uint", 1))
 
 
 def _validate_registers(
-    name: str, registers: NL, data: DATA, vars: VARS
+    name: str, registers: NAMES, data: DATA, vars: VARS, out: _Collector
 ) -> None:
     for rname in registers:
-        _validate_name(rname)
-        r = data[rname]
-        match r:
-            case ("register", type, str(clk), 0, *attributes):
-                _validate_type(type)
-                _validate_var(_clk_t, clk, vars)
-                _validate_attributes(*attributes)
-                vars[rname] = (type, "register", attributes or {}, clk, 0)
-            case ("register", type, str(clk), (str(rst), value), *attributes):
-                _validate_type(type)
-                _validate_var(_clk_t, clk, vars)
-                if rst not in vars:
-                    raise ValueError(
-                        f"Reset signal {rst} not defined in module {name}"
+        try:
+            _validate_name(rname)
+            r = data.get(rname)
+            match r:
+                case ("register", type, str(clk), 0, *attributes):
+                    _validate_type(type)
+                    _validate_var(_clk_t, clk, vars)
+                    _validate_attributes(*attributes)
+                    vars[rname] = (type, "register", attributes or {}, clk, 0)
+                case (
+                    "register",
+                    type,
+                    str(clk),
+                    (str(rst), value),
+                    *attributes,
+                ):
+                    _validate_type(type)
+                    _validate_var(_clk_t, clk, vars)
+                    if rst not in vars:
+                        raise ValueError(
+                            f"Reset signal {rst} not defined in module {name}"
+                        )
+                    for rst_type in _rst_types:
+                        try:
+                            _validate_var(rst_type, rst, vars)
+                            break
+                        except ValueError:
+                            pass
+                    else:
+                        raise ValueError(
+                            f"Bad register reset type: {vars[rst][0]}"
+                        )
+                    _validate_value(type, value, vars)
+                    _validate_attributes(*attributes)
+                    vars[rname] = (
+                        type,
+                        "register",
+                        attributes or {},
+                        clk,
+                        (rst, value),
                     )
-                for rst_type in _rst_types:
-                    try:
-                        _validate_var(rst_type, rst, vars)
-                        break
-                    except ValueError:
-                        pass
-                else:
+                case _:
                     raise ValueError(
-                        f"Bad register reset type: {vars[rst][0]}"
+                        f"Malformed register entry in module {name}: {r}"
                     )
-                _validate_value(type, value, vars)
-                _validate_attributes(*attributes)
-                vars[rname] = (
-                    type,
-                    "register",
-                    attributes or {},
-                    clk,
-                    (rst, value),
-                )
-            case _:
-                raise ValueError(
-                    f"Malformed register entry in module {name}: {r}"
-                )
+        except ValueError as e:
+            out.report(e, "register", rname)
 
 
-def _portmap(module):
-    return {
-        **{n: (module["data"][n][1], "input") for n in module["input"]},
-        **{n: (module["data"][n][1], "output") for n in module["output"]},
-    }
+def _portmap(module) -> tuple[dict[str, tuple], list[str]]:
+    """Return port types and directions of module, and the names of the
+    ports with missing or malformed data"""
+    data = module.get("data", {})
+    ports, bad = {}, []
+    for kind in ("input", "output"):
+        for n in module.get(kind, ()):
+            match data.get(n):
+                case (k, type, *_) if k == kind:
+                    ports[n] = (type, kind)
+                case _:
+                    bad.append(n)
+    return ports, bad
 
 
 def _validate_instances(
-    name: str, instances: NL, data: DATA, vars: VARS, db: DB
+    name: str,
+    instances: NAMES,
+    data: DATA,
+    vars: VARS,
+    db: DB,
+    out: _Collector,
 ) -> None:
     for iname in instances:
-        _validate_name(iname)
-        i = data[iname]
-        match i:
-            case ("instance", ("instance", str(cn), str(mn)), *attributes):
-                _validate_attributes(*attributes)
-                try:
-                    m = db["circuits"][cn][mn]
-                except KeyError:
-                    raise ValueError(f"No module named {cn}::{mn} found")
-                vars[iname] = ("instance", cn, mn, _portmap(m))
-            case _:
-                raise ValueError(
-                    f"Malformed instance entry in module {name}: {i}"
-                )
+        try:
+            _validate_name(iname)
+            i = data.get(iname)
+            match i:
+                case ("instance", ("instance", str(cn), str(mn)), *attributes):
+                    _validate_attributes(*attributes)
+                    try:
+                        m = db["circuits"][cn][mn]
+                    except KeyError:
+                        raise ValueError(f"No module named {cn}::{mn} found")
+                    ports, bad = _portmap(m)
+                    vars[iname] = ("instance", cn, mn, ports)
+                    if bad:
+                        raise ValueError(
+                            f"Module {cn}::{mn} has malformed ports: "
+                            f"{', '.join(bad)}"
+                        )
+                case _:
+                    raise ValueError(
+                        f"Malformed instance entry in module {name}: {i}"
+                    )
+        except ValueError as e:
+            out.report(e, "instance", iname)
 
 
-def _validate_code(name: str, statements: list[tuple], vars: VARS) -> None:
+def _validate_code(
+    name: str,
+    statements: list[tuple],
+    vars: VARS,
+    out: _Collector,
+    path: tuple[Union[str, int], ...] = ("code",),
+) -> None:
     t1: tuple
     t2: tuple
     val: VAL
     var: VAR
-    for statement in statements:
-        match statement:
-            case ("connect", (t1, var), (t2, val), *attributes):
-                _validate_type(t1)
-                _validate_var(t1, var, vars)
-                _validate_value(t2, val, vars)
-                _validate_attributes(*attributes)
-            case ("when", (("uint", 1), val), stmnts, *attributes):
-                _validate_value(("uint", 1), val, vars)
-                _validate_code(name, stmnts, vars)
-                _validate_attributes(*attributes)
-            case ("else-when", (("uint", 1), val), stmnts, *attributes):
-                _validate_value(("uint", 1), val, vars)
-                _validate_code(name, stmnts, vars)
-                _validate_attributes(*attributes)
-            case ("else", stmnts, *attributes):
-                _validate_code(name, stmnts, vars)
-                _validate_attributes(*attributes)
-            case ("printf", str(clk), (("uint", 1), en), str(fstr), *args):
-                _validate_fmt("printf", clk, en, fstr, args, None, vars)
-            case (
-                "assertf",
-                str(clk),
-                (("uint", 1), pred),
-                (("uint", 1), en),
-                str(fstr),
-                *args,
-            ):
-                _validate_fmt("assertf", clk, en, fstr, args, pred, vars)
-            case (
-                "coverf",
-                str(clk),
-                (("uint", 1), pred),
-                (("uint", 1), en),
-                str(fstr),
-            ):
-                _validate_fmt("coverf", clk, en, fstr, [], pred, vars)
-            case _:
-                raise ValueError(
-                    f"Malformed statement in module {name}: {statement}"
-                )
+    for idx, statement in enumerate(statements):
+        try:
+            match statement:
+                case ("connect", (t1, var), (t2, val), *attributes):
+                    _validate_type(t1)
+                    _validate_var(t1, var, vars)
+                    _validate_value(t2, val, vars)
+                    _validate_attributes(*attributes)
+                case ("when", (("uint", 1), val), stmnts, *attributes):
+                    _validate_value(("uint", 1), val, vars)
+                    _validate_code(name, stmnts, vars, out, (*path, idx))
+                    _validate_attributes(*attributes)
+                case ("else-when", (("uint", 1), val), stmnts, *attributes):
+                    _validate_value(("uint", 1), val, vars)
+                    _validate_code(name, stmnts, vars, out, (*path, idx))
+                    _validate_attributes(*attributes)
+                case ("else", stmnts, *attributes):
+                    _validate_code(name, stmnts, vars, out, (*path, idx))
+                    _validate_attributes(*attributes)
+                case ("printf", str(clk), (("uint", 1), en), str(fstr), *args):
+                    _validate_fmt("printf", clk, en, fstr, args, None, vars)
+                case (
+                    "assertf",
+                    str(clk),
+                    (("uint", 1), pred),
+                    (("uint", 1), en),
+                    str(fstr),
+                    *args,
+                ):
+                    _validate_fmt("assertf", clk, en, fstr, args, pred, vars)
+                case (
+                    "coverf",
+                    str(clk),
+                    (("uint", 1), pred),
+                    (("uint", 1), en),
+                    str(fstr),
+                ):
+                    _validate_fmt("coverf", clk, en, fstr, [], pred, vars)
+                case _:
+                    raise ValueError(
+                        f"Malformed statement in module {name}: {statement}"
+                    )
+        except ValueError as e:
+            out.report(e, *path, idx)
 
 
 _arg_ph = re.compile(r"%[bdx]")
@@ -338,7 +975,56 @@ def _validate_fmt(
         )
 
 
+# Collector of the validation running in this thread
+_collector: ContextVar[Optional[_Collector]] = ContextVar(
+    "_collector", default=None
+)
+type_checks = {"validated": 0, "saved": 0}
+
+
 def _validate_type(type: tuple) -> None:
+    """Validate type, at most once per distinct type during validate().
+    Types are looked up by identity first, and otherwise by a key that
+    holds the classes of their numbers, as bools and floats compare
+    equal to ints."""
+    out = _collector.get()
+    if out is None:
+        _check_type(type)
+        return
+    if out.ids.get(id(type)) is type:
+        out.checks["saved"] += 1
+        return
+    try:
+        key = _type_key(type)
+        known = key in out.types
+    except TypeError:
+        _check_type(type)
+        return
+    if known:
+        out.checks["saved"] += 1
+    else:
+        _check_type(type)
+        out.types[key] = None
+        out.checks["validated"] += 1
+    out.ids[id(type)] = type
+
+
+def _type_key(t: tuple) -> tuple:
+    """Return memo key of type t"""
+    return tuple(
+        _type_key(x) if isinstance(x, tuple) else (x.__class__, x) for x in t
+    )
+
+
+def _exact(t: tuple) -> bool:
+    """Return True if the numbers of type t are ints, not bools or
+    floats"""
+    return all(isinstance(x, (str, tuple)) or type(x) is int for x in t)
+
+
+def _check_type(type: tuple) -> None:
+    if isinstance(type, tuple) and not _exact(type):
+        raise ValueError(f"Malformed type: {type}")
     match type:
         case ("uint", int(bits)):
             if not (bits >= 0):
@@ -353,7 +1039,7 @@ def _validate_type(type: tuple) -> None:
         case ("struct", *fields):
             for f in fields:
                 match f:
-                    case (str(_), type, 0) | (str(_), type, 1):
+                    case (str(_), type, 0 | 1) if _exact(f):
                         _validate_type(type)
                     case _:
                         raise ValueError(f"Malformed struct field {f}")
@@ -394,7 +1080,7 @@ def _validate_var(type: tuple, value, vars: VARS) -> None:
         case (".", (("struct", *f), v), str(field)):
             t = ("struct", *f)
             _validate_type(t)
-            if field not in _struct_fields(f):
+            if field not in _struct_fields(t[1:]):
                 raise ValueError(f"Struct {f} has no field {field}")
             _validate_var(t, v, vars)
         case ("[]", (("array", int(size), t), v), (("uint", int(b)), i)):
@@ -412,11 +1098,16 @@ def _validate_value(type: tuple, value, vars: VARS) -> None:
     _validate_type(type)
     tname = type[0]
     is_int = tname in ("uint", "sint")
+    is_ground = is_int or tname in ("clock", "reset", "async_reset")
     match value:
         case int(x) if is_int:
             pass
         case (".", *_) | ("[]", *_) | str(_):
             _validate_var(type, value, vars)
+        case ("mux", (("uint", 1), c), (t1, v1), (t2, v2)) if is_ground:
+            _validate_value(("uint", 1), c, vars)
+            _validate_value(t1, v1, vars)
+            _validate_value(t2, v2, vars)
         case (str(_), *args) if is_int:
             # TODO: check op?
             for arg in args:
@@ -0,0 +1,169 @@
+"""
+Dead code elimination
+Removes wires and registers whose values are never used, and the
+connects driving them
+"""
+
+from typing import Any, Optional, Sequence
+
+from ._db import DB, MODULE, default, member_removed, ordered
+from ._flatten import root_name
+from ._module import elaborate
+
+
+def _reads(value: Any, out: set[str]) -> None:
+    """Add names of members read by (raw) value to out"""
+    match value:
+        case str(name):
+            out.add(name)
+        case (str(_), *args):
+            for x in args:
+                if isinstance(x, tuple):
+                    _reads(x[1], out)
+        case dict(fields):
+            for v in fields.values():
+                _reads(v, out)
+        case list(items):
+            for v in items:
+                _reads(v, out)
+
+
+def _target_reads(var: Any, out: set[str]) -> None:
+    """Add names of members read by the indexes of target to out"""
+    match var:
+        case (".", (_, v), _):
+            _target_reads(v, out)
+        case ("[]", (_, v), (_, idx)):
+            _target_reads(v, out)
+            _reads(idx, out)
+
+
+class _Uses:
+    """Use/def information of module: the members each member depends
+    on, and the members used by printf/assertf/coverf statements"""
+
+    deps: dict[str, set[str]]
+    used: set[str]
+
+    def __init__(self, module: MODULE):
+        self.deps = {}
+        self.used = set()
+        self.block(module["code"], frozenset())
+        data = module["data"]
+        for name in module["register"]:
+            _, _, clk, rst, *_ = data[name]
+            d = self.deps.setdefault(name, set())
+            d.add(clk)
+            if rst:
+                d.add(rst[0])
+                _reads(rst[1], d)
+
+    def block(self, code: Sequence[tuple], cond: frozenset[str]) -> None:
+        # Names read by the conditions of the current when chain
+        chain: set[str] = set()
+        for statement in code:
+            match statement:
+                case ("connect", (_, var), (_, value), *_):
+                    d = self.deps.setdefault(root_name(var), set())
+                    d |= cond
+                    _target_reads(var, d)
+                    _reads(value, d)
+                case ("when" | "else-when" as kind, (_, c), body, *_):
+                    if kind == "when":
+                        chain = set()
+                    _reads(c, chain)
+                    self.block(body, cond | chain)
+                case ("else", body, *_):
+                    self.block(body, cond | chain)
+                case (_, clk, *args):
+                    self.used |= cond
+                    self.used.add(clk)
+                    for a in args:
+                        if isinstance(a, tuple):
+                            _reads(a[1], self.used)
+
+    def live(self, roots: set[str]) -> set[str]:
+        """Return names of the members roots depend on, and roots"""
+        live = set()
+        todo = list(roots)
+        while todo:
+            name = todo.pop()
+            if name not in live:
+                live.add(name)
+                todo += self.deps.get(name, ())
+        return live
+
+
+def _body(statement: tuple) -> tuple:
+    return statement[1 if statement[0] == "else" else 2]
+
+
+def _prune(code: Sequence[tuple], dead: set[str]) -> list[tuple]:
+    """Return code without connects to dead members, and without the
+    when chain branches that become empty at the end of chains"""
+    out: list[tuple] = []
+    chain: list[tuple] = []
+
+    def end_chain():
+        while chain and not _body(chain[-1]):
+            chain.pop()
+        out.extend(chain)
+        chain.clear()
+
+    for statement in code:
+        match statement:
+            case ("connect", (_, var), *_):
+                end_chain()
+                if root_name(var) not in dead:
+                    out.append(statement)
+            case ("when" | "else-when" as kind, c, body, *attrs):
+                if kind == "when":
+                    end_chain()
+                chain.append((kind, c, tuple(_prune(body, dead)), *attrs))
+            case ("else", body, *attrs):
+                chain.append(("else", tuple(_prune(body, dead)), *attrs))
+            case _:
+                end_chain()
+                out.append(statement)
+    end_chain()
+    return out
+
+
+def remove_unused(
+    *circuits: str, db: Optional[DB] = None
+) -> dict[str, list[str]]:
+    """Remove the wires and registers that are not used, directly or
+    indirectly, by outputs, instances or printf/assertf/coverf
+    statements from the modules of the given circuits (all circuits if
+    none is given), along with the connects driving them.
+    Use default database if none is specified.
+
+    Return the names of the removed wires and registers, as a dict from
+    module name (circuit::module).
+    """
+    db = db or default
+    elaborate(*circuits, db=db)
+    circ = db["circuits"]
+    removed = {}
+    for cn in circuits or circ:
+        for mn, module in circ[cn].items():
+            if dead := _remove_unused(db, module):
+                removed[f"{cn}::{mn}"] = dead
+    return removed
+
+
+def _remove_unused(db: DB, module: MODULE) -> list[str]:
+    uses = _Uses(module)
+    roots = {*module["output"], *module["instance"], *uses.used}
+    live = uses.live(roots)
+    dead = [n for n in (*module["wire"], *module["register"]) if n not in live]
+    if not dead:
+        return dead
+    module["code"] = _prune(module["code"], set(dead))
+    ordered(module)
+    data = module["data"]
+    for name in dead:
+        item = data.pop(name)
+        del module[item[0]][name]  # type: ignore
+        member_removed(db, module, name, item)
+    return dead
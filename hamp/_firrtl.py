@@ -5,7 +5,8 @@ from typing import Optional
 import os
 from subprocess import run
 from contextlib import chdir
-from ._db import DB, default
+from ._db import DB, default, hierarchy
+from ._module import elaborate
 
 
 def _op1(name, argc=1, parc=0):
@@ -54,6 +55,7 @@ _op_to_func = {
     "cat": _op2("cat"),
     "pad": _op2("pad", 1, 1),
     "bits": _op3("bits", 1, 2),
+    "mux": _op3("mux"),
     ".": ("{e[0]}.{e[1]}", 1, 1),
     "[]": ("{e[0]}[{e[1]}]", 2, 0),
     "uint": _int("UInt"),
@@ -168,6 +170,8 @@ def _statements(
     code: list[tuple], lines: list[str], consts: list[tuple]
 ) -> None:
     def f(code, indent=""):
+        if not code:
+            lines.append(f"{indent}skip")
         for c in code:
             match c:
                 case ("when", expr, statements):
@@ -272,32 +276,52 @@ def _module(cname: str, mname: str, db: DB, lines: list[str]) -> None:
     lines.append("")
 
 
-def _circuit(name: str, db: DB, lines: list[str]) -> None:
+def _circuit(name: str, modules: list[str], db: DB, lines: list[str]) -> None:
     if name == "mem":
         return
     lines.append(f"circuit {name} :")
-    modules = db["circuits"][name]
     for mname in modules:
         _module(name, mname, db, lines)
 
 
+def _reachable(circuits: tuple[str, ...], db: DB) -> dict[str, list[str]]:
+    """Return the modules of each circuit that are reachable from its
+    public top module (all modules if it has none)"""
+    circ = db["circuits"]
+    tops = [(c, c) for c in circuits if c in circ[c]]
+    found = set(hierarchy(db).reachable(*tops))
+    return {
+        c: [mn for mn in circ[c] if (c, mn) in found or (c, c) not in found]
+        for c in circuits
+    }
+
+
 def firrtl(
     *circuits: str,
     db: Optional[DB] = None,
     name: Optional[str] = None,
     odir: str = ".",
+    prune: bool = True,
 ) -> None:
     """
     Generate FIRRTL code for given database and circuits.
     Generate FIRRTL for all circuits if none is specified.
     Use default database if none is specified.
+    If prune is True, modules that are not reachable from the public
+    top module of their circuit are left out.
+    Pending code of lazy modules is elaborated first.
     """
     lines = [_preamble()]
     db = db or default
-    circuits = circuits or db["circuits"].keys()
+    circuits = circuits or tuple(db["circuits"].keys())
     name = name or circuits[0]
+    if prune:
+        emit = _reachable(circuits, db)
+    else:
+        emit = {c: list(db["circuits"][c]) for c in circuits}
+    elaborate(db=db, modules=[(c, m) for c in circuits for m in emit[c]])
     for circ in circuits:
-        _circuit(circ, db, lines)
+        _circuit(circ, emit[circ], db, lines)
     with chdir(odir):
         with open(f"{name}.fir", "w") as fh:
             fh.write("\n".join(lines))
@@ -308,14 +332,15 @@ def verilog(
     db: Optional[DB] = None,
     name: Optional[str] = None,
     odir: str = ".",
+    prune: bool = True,
 ) -> None:
     """
     Generate FIRRTL, and then run firtool to convert it to Verilog
     """
     db = db or default
-    circuits = circuits or list(db["circuits"].keys())
+    circuits = circuits or tuple(db["circuits"])
     name = name or circuits[0]
-    firrtl(*circuits, db=db, name=name, odir=odir)
+    firrtl(*circuits, db=db, name=name, odir=odir, prune=prune)
     with chdir(odir):
         firtool = os.environ.get("FIRTOOL") or "firtool"
         args = [firtool, "--verilog", f"-o={name}.v", f"{name}.fir"]
@@ -0,0 +1,252 @@
+"""
+When flattening
+Resolves the last connect semantics of module code into a single
+driving expression for each ground type target
+"""
+
+from collections import ChainMap
+from typing import Optional
+
+from ._db import DB, MODULE, default, modified
+from ._module import elaborate
+
+_U1 = ("uint", 1)
+
+DRIVERS = dict[str, tuple[tuple, tuple]]
+
+
+def leaf_key(var) -> str:
+    """Return name of variable with constant indexes, like a.b[2].c"""
+    match var:
+        case str(name):
+            return name
+        case (".", (_, v), str(field)):
+            return f"{leaf_key(v)}.{field}"
+        case ("[]", (_, v), (_, int(i))):
+            return f"{leaf_key(v)}[{i}]"
+    raise ValueError(f"Not a constant variable: {var}")
+
+
+def root_name(var) -> str:
+    """Return name of module member variable refers to"""
+    while not isinstance(var, str):
+        var = var[1][1]
+    return var
+
+
+def split(target: tuple, value: tuple, out: list[tuple]) -> None:
+    """Split connect of value to target into connects of ground types,
+    appended to out as (target, value) pairs.
+    Flipped struct fields are connected in the opposite direction.
+    """
+    tt = target[0]
+    match tt[0]:
+        case "struct":
+            vfields = {f[0]: f[1] for f in value[0][1:]}
+            for name, ftype, flip in tt[1:]:
+                t = (ftype, (".", target, name))
+                v = _field(value, name, vfields[name])
+                if not flip:
+                    split(t, v, out)
+                elif not isinstance(v[1], (int, dict, list)):
+                    split(v, t, out)
+        case "array":
+            size, etype = tt[1:]
+            itype = ("uint", max(1, (size - 1).bit_length()))
+            for i in range(size):
+                t = (etype, ("[]", target, (itype, i)))
+                split(t, _element(value, i, (itype, i)), out)
+        case _:
+            out.append((target, value))
+
+
+def _field(value: tuple, name: str, type: tuple) -> tuple:
+    v = value[1]
+    if isinstance(v, dict):
+        return (type, v.get(name, 0))
+    if isinstance(v, int):
+        return (type, v)
+    return (type, (".", value, name))
+
+
+def _element(value: tuple, i: int, idx: tuple) -> tuple:
+    type, v = value[0][2], value[1]
+    if isinstance(v, list):
+        return (type, v[i] if i < len(v) else 0)
+    if isinstance(v, int):
+        return (type, v)
+    return (type, ("[]", value, idx))
+
+
+def targets(var: tuple) -> list[tuple[Optional[tuple], tuple]]:
+    """Return the variables with constant indexes that variable (with
+    dynamic indexes) can refer to, as (condition, variable) pairs.
+    The condition is None if the variable only has constant indexes.
+    """
+    type, v = var
+    match v:
+        case str(_):
+            return [(None, var)]
+        case (".", inner, str(field)):
+            return [(c, (type, (".", x, field))) for c, x in targets(inner)]
+        case ("[]", inner, idx):
+            found = targets(inner)
+            if isinstance(idx[1], int):
+                return [(c, (type, ("[]", x, idx))) for c, x in found]
+            size = inner[0][1]
+            itype = ("uint", max(1, (size - 1).bit_length()))
+            limit = 1 << idx[0][1]
+            return [
+                (
+                    and_expr(c, (_U1, ("==", idx, (idx[0], i)))),
+                    (type, ("[]", x, (itype, i))),
+                )
+                for c, x in found
+                for i in range(min(size, limit))
+            ]
+    raise ValueError(f"Malformed variable: {v}")
+
+
+def and_expr(c1: Optional[tuple], c2: tuple) -> tuple:
+    if c1 is None:
+        return c2
+    return (_U1, ("&", c1, c2))
+
+
+def not_expr(c: tuple) -> tuple:
+    return (_U1, ("not", c))
+
+
+def mux_expr(type: tuple, cond: tuple, a: tuple, b: tuple) -> tuple:
+    if a is b:
+        return a
+    return (type, ("mux", cond, a, b))
+
+
+class _Flattener:
+    """Flattens the code of a module"""
+
+    data: dict[str, tuple]
+    statements: list[tuple]
+
+    def __init__(self, module: MODULE):
+        self.data = module["data"]
+        self.statements = []
+
+    def default(self, target: tuple) -> tuple[tuple, tuple]:
+        """Return (target, value) of register that is not connected,
+        which keeps its value. Raise ValueError for other targets."""
+        kind = self.data[root_name(target[1])][0]
+        if kind == "register":
+            return target, target
+        raise ValueError(
+            f"{kind.capitalize()} target {leaf_key(target[1])} is not "
+            "connected on all paths"
+        )
+
+    def block(self, code, env: ChainMap, cond: Optional[tuple]) -> None:
+        i = 0
+        while i < len(code):
+            statement = code[i]
+            i += 1
+            match statement:
+                case ("connect", target, value, *_):
+                    pairs: list[tuple] = []
+                    split(target, value, pairs)
+                    for t, v in pairs:
+                        self.connect(t, v, env)
+                case ("when", c, body, *_):
+                    chain = [(c, body)]
+                    while i < len(code) and code[i][0] == "else-when":
+                        chain.append(code[i][1:3])
+                        i += 1
+                    default = None
+                    if i < len(code) and code[i][0] == "else":
+                        default = code[i][1]
+                        i += 1
+                    self.when(chain, default, env, cond)
+                case ("printf", clk, en, *args):
+                    en = and_expr(cond, en)
+                    self.statements.append(("printf", clk, en, *args))
+                case (("assertf" | "coverf") as kind, clk, pred, en, *args):
+                    en = and_expr(cond, en)
+                    self.statements.append((kind, clk, pred, en, *args))
+                case _:
+                    raise ValueError(f"Malformed statement: {statement}")
+
+    def connect(self, target: tuple, value: tuple, env: ChainMap) -> None:
+        for c, t in targets(target):
+            key = leaf_key(t[1])
+            if c is None:
+                env[key] = (t, value)
+            else:
+                old = env.get(key) or self.default(t)
+                env[key] = (old[0], mux_expr(t[0], c, value, old[1]))
+
+    def when(
+        self,
+        chain: list[tuple],
+        default: Optional[tuple],
+        env: ChainMap,
+        cond: Optional[tuple],
+    ) -> None:
+        c, body = chain[0]
+        env_t = env.new_child()
+        self.block(body, env_t, and_expr(cond, c))
+        env_f = env.new_child()
+        cond_f = and_expr(cond, not_expr(c))
+        if len(chain) > 1:
+            self.when(chain[1:], default, env_f, cond_f)
+        elif default is not None:
+            self.block(default, env_f, cond_f)
+        for key in dict.fromkeys([*env_t.maps[0], *env_f.maps[0]]):
+            t = env_t.get(key)
+            f = env_f.get(key)
+            target = (t or f)[0]  # type: ignore[index]
+            t = t or self.default(target)
+            f = f or self.default(target)
+            env[key] = (target, mux_expr(target[0], c, t[1], f[1]))
+
+
+def flatten_code(module: MODULE) -> tuple[DRIVERS, list[tuple]]:
+    """Resolve the last connect semantics of the code of module.
+
+    Return the ground type targets that are connected, as a dict from
+    target name (like a.b[2].c) to (target, value), where value is a
+    single expression using muxes for when/else conditions and dynamic
+    indexes. Registers that are not connected on all paths keep their
+    value, for other such targets ValueError is raised.
+    Also return the printf/assertf/coverf statements, with conditions
+    included in their enables.
+    """
+    flat = _Flattener(module)
+    drivers: DRIVERS = {}
+    flat.block(module["code"], ChainMap(drivers), None)
+    return drivers, flat.statements
+
+
+def flat_code(module: MODULE) -> list[tuple]:
+    """Return the code of module in flattened form: one connect for
+    each ground type target that is connected, of its single driving
+    expression, followed by the printf/assertf/coverf statements"""
+    drivers, statements = flatten_code(module)
+    connects = [("connect", t, v) for t, v in drivers.values()]
+    return [*connects, *statements]
+
+
+def flatten(*circuits: str, db: Optional[DB] = None) -> None:
+    """Replace the code of the modules in the given circuits (all
+    circuits if none is given) with flattened code, see flat_code().
+    Downstream passes, FIRRTL generation and simulation then do not
+    need to handle when blocks and last connect semantics.
+    Use default database if none is specified.
+    """
+    db = db or default
+    elaborate(*circuits, db=db)
+    circ = db["circuits"]
+    for cn in circuits or circ:
+        for module in circ[cn].values():
+            code = flat_code(module)
+            if code != module["code"]:
+                module["code"] = code
+                modified(db, module)
@@ -2,15 +2,28 @@
 Code for the module class and associated features.
 """
 
-from typing import Callable, Union, Dict, Iterator, Optional
+from weakref import WeakValueDictionary
+from typing import Any, Callable, Union, Dict, Iterable, Iterator, Optional
 from ._hwtypes import (
     _HWType,
     bitsize,
 )
-from ._db import default, DB, create_module
-from ._convert import convert
+from ._db import (
+    default,
+    DB,
+    MODULE,
+    create_module,
+    copy_module,
+    extra,
+    instances,
+    ordered,
+    first_member,
+    member_added,
+    member_removed,
+    module_added,
+)
+from ._convert import convert, symbols
 from ._builder import _CodeBuilder
-from copy import deepcopy
 
 
 AttrData = Union[str, int, dict, list]
@@ -77,6 +90,30 @@ class _ModuleMember:
         raise TypeError(f"Cannot get value of {self.kind}")
 
 
+# Pending code functions of lazy modules, with the global and closure
+# variables they had when added
+LazyCode = dict[int, tuple[MODULE, list[tuple[Callable, dict[str, Any]]]]]
+
+
+def _lazy_code(db: DB) -> LazyCode:
+    """Return pending code of lazy modules in db, keyed on module id"""
+    return extra(db, "lazy", dict)
+
+
+# Databases with lazy modules, keyed on id
+_lazy_dbs: "WeakValueDictionary[int, DB]" = WeakValueDictionary()
+
+
+def pending(module: MODULE) -> bool:
+    """Return True if module is lazy and has code that is not yet
+    elaborated"""
+    for db in list(_lazy_dbs.values()):
+        p = _lazy_code(db).get(id(module))
+        if p is not None and p[0] is module:
+            return True
+    return False
+
+
 class _Module:
     """Represent a module when describing hardware.
     A module encapsulates a unit that can have
@@ -89,7 +126,7 @@ class _Module:
 
     db: DB
     name: str
-    module: dict
+    module: MODULE
     bld: _CodeBuilder
 
     def __init__(self, name: str, db: DB):
@@ -103,6 +140,7 @@ class _Module:
             self.module = db["circuits"][cn][mn]
         except KeyError:
             raise NameError(f"Module {name} not found in database")
+        ordered(self.module)
         self.bld = _CodeBuilder(self.name, self.module, self.db)
 
     def __call__(self, **attributes: AttrData) -> _ModuleMemberSetter:
@@ -111,7 +149,7 @@ class _Module:
 
         def cb(m, name):
             mod = m.module
-            mod["instance"].append(name)
+            mod["instance"][name] = None
             mod["data"][name] = (
                 "instance",
                 ("instance", circ, modname),
@@ -138,6 +176,7 @@ class _Module:
                 "delete first to redefine"
             )
         value.cb(self, name)
+        member_added(self.db, self.module, name)
 
     def __delattr__(self, name: str) -> None:
         """Delete member from this module"""
@@ -147,8 +186,9 @@ class _Module:
         except KeyError:
             raise AttributeError(f"Module {self.name} has no member {name}")
         kind = entry[0]
-        self.module[kind].remove(name)
+        del self.module[kind][name]  # type: ignore
         del data[name]
+        member_removed(self.db, self.module, name, entry)
 
     def __getattr__(self, name: str) -> Union[_ModuleMember, "_Module"]:
         """Return member of this module"""
@@ -194,8 +234,12 @@ class _Module:
         try:
             circ[cn][mn]
         except KeyError:
-            mod = deepcopy(self.module)
+            mod = copy_module(self.module)
             circ.setdefault(cn, {})[mn] = mod
+            module_added(self.db, cn, mn)
+            lazy = _lazy_code(self.db)
+            if (pending := lazy.get(id(self.module))) is not None:
+                lazy[id(mod)] = (mod, list(pending[1]))
             return _Module(new_name, self.db)
         raise NameError(f"Module {cn}::{mn} already defined")
 
@@ -212,7 +256,14 @@ class _Module:
 
         Can also be called directly:
         a_module.code(a_function)
+
+        If the module is lazy, the function is not converted and executed
+        until the module is elaborated (see elaborate()), but uses the
+        values its global and closure variables have now.
         """
+        if (pending := _lazy_code(self.db).get(id(self.module))) is not None:
+            pending[1].append((function, symbols(function)))
+            return None
         func, text = convert(function, self.module)
         # print(text)
         func(self.bld)
@@ -236,20 +287,69 @@ class _Module:
 NULL_DATA_MEMBER = _ModuleMember("null", ["null"], {})
 
 
-def module(name: str, db: Optional[DB] = None):
+def module(name: str, db: Optional[DB] = None, lazy: bool = False):
     """
     Create a new module with given name.
     Return module API object.
     Use supplied database, or default if not given
+
+    If lazy is True, code added to the module is recorded, and only
+    converted and executed when the module is elaborated, which is done
+    by firrtl() for modules reachable from the generated circuits.
+    Lazy modules require a database created with create().
     """
     if "::" not in name:
         name = f"{name}::{name}"
     db = db or default
+    if lazy and getattr(db, "extra", None) is None:
+        raise TypeError(
+            "Lazy modules require a database created with create()"
+        )
     cn, mn = name.split("::", 1)
-    create_module(db, cn, mn)
+    m = create_module(db, cn, mn)
+    if lazy:
+        _lazy_code(db)[id(m)] = (m, [])
+        _lazy_dbs[id(db)] = db
     return _Module(name, db)
 
 
+def elaborate(
+    *circuits: str,
+    db: Optional[DB] = None,
+    modules: Iterable[tuple[str, str]] = (),
+) -> None:
+    """
+    Convert and execute pending code of lazy modules in the given
+    circuits, and of lazy modules instantiated from them (directly
+    or indirectly).
+    Elaborate all circuits if none is specified.
+    If modules ((circuit, module) names) are given, elaborate these
+    instead of the modules of the circuits.
+    Use default database if none is specified.
+    """
+    db = db or default
+    lazy = _lazy_code(db)
+    if not lazy:
+        return
+    circ = db["circuits"]
+    todo = list(modules) or [
+        (cn, mn) for cn in circuits or circ for mn in circ[cn]
+    ]
+    seen = set(todo)
+    while todo:
+        cn, mn = todo.pop()
+        mod = circ[cn][mn]
+        if (pending := lazy.pop(id(mod), None)) is not None:
+            bld = _Module(f"{cn}::{mn}", db).bld
+            for function, syms in pending[1]:
+                func, text = convert(function, mod, syms)
+                func(bld)
+        for x in instances(mod):
+            if x not in seen:
+                seen.add(x)
+                todo.append(x)
+
+
 # TODO: Add function to get existing module
 
 
@@ -258,7 +358,7 @@ def input(type: _HWType, **attributes: AttrData) -> _ModuleMemberSetter:
 
     def cb(m, name):
         mod = m.module
-        mod["input"].append(name)
+        mod["input"][name] = None
         mod["data"][name] = ("input", type.expr, attributes)
 
     return _ModuleMemberSetter(cb)
@@ -269,7 +369,7 @@ def output(type: _HWType, **attributes: AttrData) -> _ModuleMemberSetter:
 
     def cb(m, name):
         mod = m.module
-        mod["output"].append(name)
+        mod["output"][name] = None
         mod["data"][name] = ("output", type.expr, attributes)
 
     return _ModuleMemberSetter(cb)
@@ -280,23 +380,21 @@ def wire(type: _HWType, **attributes: AttrData) -> _ModuleMemberSetter:
 
     def cb(m, name):
         mod = m.module
-        mod["wire"].append(name)
+        mod["wire"][name] = None
         mod["data"][name] = ("wire", type.expr, attributes)
 
     return _ModuleMemberSetter(cb)
 
 
 def _find_clock(module: _Module) -> str:
-    for name, item in module.module["data"].items():
-        if item[1] == ("clock", 1):
-            return name
+    if name := first_member(module.db, module.module, "clock"):
+        return name
     raise ValueError(f"No clock defined in module {module.name}")
 
 
 def _find_reset(module: _Module) -> str:
-    for name, item in module.module["data"].items():
-        if item[1] in (("reset", 1), ("async_reset", 1)):
-            return name
+    if name := first_member(module.db, module.module, "reset", "async_reset"):
+        return name
     raise ValueError(f"No reset defined in module {module.name}")
 
 
@@ -318,7 +416,7 @@ def register(
 
     def cb(m, name):
         mod = m.module
-        mod["register"].append(name)
+        mod["register"][name] = None
         if clock is NULL_DATA_MEMBER:
             clk = _find_clock(m)
         else:
@@ -343,27 +441,32 @@ def attribute(value: AttrData) -> _ModuleMemberSetter:
 
     def cb(m, name):
         mod = m.module
-        mod["attribute"].append(name)
+        mod["attribute"][name] = None
         mod["data"][name] = ("attribute", value)
 
     return _ModuleMemberSetter(cb)
 
 
 def unique(name: str, db: Optional[DB] = None) -> str:
-    """Generate unique module name based on given base name"""
+    """Generate unique module name based on given base name.
+    The base name is used if free, else the base name with a number
+    appended (name_1, name_2, ...). A per base name counter is kept in
+    the database, so that numbers are not probed from 1 each time.
+    Numbers below the counter that are freed are not reused.
+    """
     db = db or default
     if "::" not in name:
         name = f"{name}::{name}"
-    idx = 0
     cn, mn = name.split("::", 1)
-    new_mn = mn
-    while True:
-        try:
-            db["circuits"][cn][new_mn]
-            idx += 1
-            new_mn = f"{mn}_{idx}"
-        except KeyError:
-            return f"{cn}::{new_mn}"
+    modules = db["circuits"].get(cn, {})
+    if mn not in modules:
+        return f"{cn}::{mn}"
+    counters = extra(db, "unique", dict)
+    idx = counters.get((cn, mn), 1)
+    while f"{mn}_{idx}" in modules:
+        idx += 1
+    counters[(cn, mn)] = idx
+    return f"{cn}::{mn}_{idx}"
 
 
 def instance(name: str, **attributes: AttrData) -> _ModuleMemberSetter:
@@ -391,7 +494,7 @@ def instance(name: str, **attributes: AttrData) -> _ModuleMemberSetter:
                 continue
         else:
             raise NameError(f"No module named {modname} defined")
-        mod["instance"].append(name)
+        mod["instance"][name] = None
         mod["data"][name] = ("instance", ("instance", circ, mn), attributes)
 
     return _ModuleMemberSetter(cb)
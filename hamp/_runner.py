@@ -0,0 +1,84 @@
+"""
+Sharded simulation
+Runs many simulation tests of a design in a pool of processes
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from os import cpu_count
+from typing import Any, Callable, Iterable, NamedTuple, Optional
+
+from ._db import DB
+from ._sim import _CompiledSimulator, _Simulator, design, program
+
+TEST = Callable[[_Simulator, Any], Any]
+
+
+class Results(NamedTuple):
+    """Results of the tests, in order of the test cases, and the number
+    of cycles each cover point was hit, summed over all tests"""
+
+    results: list[Any]
+    coverage: dict[str, int]
+
+
+# Simulator factory and test function of worker process
+_worker: Optional[tuple[Callable[[], _Simulator], TEST]] = None
+
+
+def _init(factory: Callable[[], _Simulator], test: TEST) -> None:
+    global _worker
+    _worker = (factory, test)
+
+
+def _run(case: Any) -> tuple[Any, list[int]]:
+    """Run test case on new simulator, return result and cover point
+    counters"""
+    factory, test = _worker  # type: ignore[misc]
+    sim = factory()
+    result = test(sim, case)
+    return result, list(sim.coverage().values())
+
+
+def run_sharded(
+    name: str,
+    test: TEST,
+    cases: Iterable[Any],
+    db: Optional[DB] = None,
+    jobs: Optional[int] = None,
+    backend: str = "compile",
+) -> Results:
+    """Run test(sim, case) for each test case, like a random seed, with
+    a new simulator of module with given name (circuit::module) for each
+    case. Use supplied database, or default if not given.
+
+    The tests are sharded across jobs processes (default the number of
+    CPUs). The design is compiled once, and sent once to each process.
+    test must be picklable, for instance a module level function, and
+    so must its results.
+    """
+    factory: Callable[[], _Simulator]
+    if backend == "compile":
+        p = program(name, db)
+        factory, covers = partial(_CompiledSimulator, p), p.design.covers
+    elif backend == "interpret":
+        d = design(name, db)
+        factory, covers = partial(_Simulator, d), d.covers
+    else:
+        raise ValueError(f"Unknown simulation backend: {backend}")
+    cases = list(cases)
+    jobs = jobs or cpu_count() or 1
+    if jobs == 1:
+        _init(factory, test)
+        done = list(map(_run, cases))
+    else:
+        chunksize = max(1, len(cases) // (jobs * 4))
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init, initargs=(factory, test)
+        ) as pool:
+            done = list(pool.map(_run, cases, chunksize=chunksize))
+    coverage = dict.fromkeys(covers, 0)
+    for _, counters in done:
+        for n, c in zip(covers, counters):
+            coverage[n] += c
+    return Results([r for r, _ in done], coverage)
@@ -0,0 +1,299 @@
+"""
+Serialization of databases to files
+"""
+
+import json
+import marshal
+import mmap
+import sys
+from collections import OrderedDict
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import Any, Iterator
+
+from ._db import DB, MODULE, _Database, _export_module, create, validate
+from ._module import elaborate
+
+MAGIC = b"HAMPDB\x02"
+MAPPED_MAGIC = b"HAMPMM\x02"
+
+# The binary files are written with marshal, whose format may change
+# between Python versions, so the version writing the file follows the
+# magic bytes
+_PYTHON = f"{sys.version_info[0]}.{sys.version_info[1]}".encode().ljust(8)
+_HEADER = len(MAGIC) + len(_PYTHON)
+
+
+def _check_header(head: bytes, magic: bytes, kind: str, path: str) -> None:
+    if not head.startswith(magic):
+        raise ValueError(f"Not a {kind} file: {path}")
+    python = bytes(head[len(magic) : _HEADER])
+    if python != _PYTHON:
+        raise ValueError(
+            f"File {path} was written by Python {python.decode().strip()}, "
+            f"and cannot be read by Python {_PYTHON.decode().strip()}"
+        )
+
+
+def save(db: DB, path: str) -> None:
+    """Save database to file in compact binary format.
+
+    Equal types, expressions and strings are stored once and referenced
+    wherever they are used. Pending code of lazy modules is elaborated
+    first. The file can only be loaded by the Python version (major and
+    minor) that saved it.
+    """
+    elaborate(db=db)
+    data = _Interner().intern(dict(db))
+    with open(path, "wb") as fh:
+        fh.write(MAGIC + _PYTHON)
+        marshal.dump(data, fh, 4)
+
+
+def load(path: str) -> DB:
+    """Load database saved by save(), with the same Python version"""
+    with open(path, "rb") as fh:
+        data = fh.read()
+    _check_header(data[:_HEADER], MAGIC, "hamp database", path)
+    return _Database(marshal.loads(memoryview(data)[_HEADER:]))
+
+
+def save_mapped(db: DB, path: str) -> None:
+    """Save database to file in a module indexed binary format, for use
+    with open_mapped().
+
+    The file starts with a header holding the offset of the index, then
+    each module is stored on its own, and last comes the index with the
+    offset and size of each module.
+    Pending code of lazy modules is elaborated first. The file can only
+    be opened by the Python version (major and minor) that saved it.
+    """
+    elaborate(db=db)
+    interner = _Interner()
+    index: dict[str, dict[str, tuple[int, int]]] = {}
+    with open(path, "wb") as fh:
+        fh.write(MAPPED_MAGIC + _PYTHON)
+        fh.write(bytes(8))
+        offset = _HEADER + 8
+        for cn, modules in db["circuits"].items():
+            entries = index[cn] = {}
+            for mn, module in modules.items():
+                data = marshal.dumps(interner.intern(module), 4)
+                fh.write(data)
+                entries[mn] = (offset, len(data))
+                offset += len(data)
+        marshal.dump(index, fh, 4)
+        fh.seek(_HEADER)
+        fh.write(offset.to_bytes(8, "little"))
+
+
+def open_mapped(path: str, cache: int = 1024) -> DB:
+    """Open database saved by save_mapped() as a read-only database.
+
+    The file is memory mapped, and modules are only loaded when
+    accessed. At most cache loaded modules are kept, the least recently
+    used are dropped first. Changes to loaded modules are not saved.
+    """
+    with open(path, "rb") as fh:
+        head = fh.read(_HEADER)
+        _check_header(head, MAPPED_MAGIC, "mapped hamp database", path)
+        data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    start = _HEADER
+    offset = int.from_bytes(data[start : start + 8], "little")
+    index = marshal.loads(data[offset:])
+    modules = _ModuleCache(data, cache)
+    circuits = {
+        cn: _MappedCircuit(entries, modules) for cn, entries in index.items()
+    }
+    return _Database(circuits=MappingProxyType(circuits))
+
+
+class _ModuleCache:
+    """Loads modules from mapped file, keeping the most recently used"""
+
+    data: mmap.mmap
+    size: int
+    modules: OrderedDict[tuple[int, int], MODULE]
+
+    def __init__(self, data: mmap.mmap, size: int):
+        self.data = data
+        self.size = size
+        self.modules = OrderedDict()
+
+    def load(self, entry: tuple[int, int]) -> MODULE:
+        modules = self.modules
+        if (m := modules.get(entry)) is not None:
+            modules.move_to_end(entry)
+            return m
+        offset, size = entry
+        m = modules[entry] = marshal.loads(self.data[offset : offset + size])
+        if len(modules) > self.size:
+            modules.popitem(last=False)
+        return m
+
+
+class _MappedCircuit(Mapping):
+    """Read-only circuit of mapped database"""
+
+    def __init__(self, index: dict[str, tuple[int, int]], cache: _ModuleCache):
+        self._index = index
+        self._cache = cache
+
+    def __getitem__(self, name: str) -> MODULE:
+        return self._cache.load(self._index[name])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._index
+
+
+def save_ndjson(db: DB, path: str) -> None:
+    """Save database as newline delimited JSON, one module per line.
+
+    Each line is a JSON array [circuit, module, MODULE], with the names
+    of MODULE as lists, as returned by export(). Tuples are JSON
+    arrays, dicts are JSON objects, and lists are JSON objects with the
+    single key "*" (not a valid name) holding an array.
+    Pending code of lazy modules is elaborated first.
+    """
+    elaborate(db=db)
+    encode = json.JSONEncoder(
+        check_circular=False, separators=(",", ":")
+    ).encode
+    with open(path, "w") as fh:
+        for cn, modules in db["circuits"].items():
+            for mn, module in modules.items():
+                m = _ToJSON().convert(_export_module(module))
+                fh.write(encode((cn, mn, m)))
+                fh.write("\n")
+
+
+def load_ndjson(path: str) -> DB:
+    """Load database saved by save_ndjson(), one module at a time.
+    The loaded database is validated.
+    """
+    db = create()
+    circuits = db["circuits"]
+    decode = json.JSONDecoder(object_hook=_object_from_json).decode
+    with open(path) as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            match decode(line):
+                case [str(cn), str(mn), dict(module)]:
+                    modules = circuits.setdefault(cn, {})
+                    modules[mn] = _from_json(module)
+                case _:
+                    raise ValueError(f"Malformed module line: {line[:80]}")
+    validate(db)
+    return db
+
+
+class _ToJSON:
+    """Converts lists to {"*": list}, keeping tuples without lists or
+    dicts, which are most of them."""
+
+    seen: dict[int, tuple[tuple, tuple]]
+
+    def __init__(self):
+        self.seen = {}
+
+    def convert(self, x: Any) -> Any:
+        cls = type(x)
+        if cls is tuple:
+            if (r := self.seen.get(id(x))) is None:
+                t = tuple([self.convert(y) for y in x])
+                if all(a is b for a, b in zip(t, x)):
+                    t = x
+                r = self.seen[id(x)] = x, t
+            return r[1]
+        if cls is list:
+            return {"*": [self.convert(y) for y in x]}
+        if cls is dict:
+            return {k: self.convert(v) for k, v in x.items()}
+        return x
+
+
+class _JSONList(list):
+    """List decoded from {"*": list}"""
+
+
+def _object_from_json(x: dict) -> Any:
+    if len(x) == 1 and type(items := x.get("*")) is list:
+        return _JSONList(items)
+    return x
+
+
+_LEAVES = frozenset((str, int, float, bool, type(None)))
+
+
+def _from_json(x: Any) -> Any:
+    """Convert arrays to tuples and {"*": list} to lists"""
+    cls = type(x)
+    if cls is list:
+        return tuple([y if type(y) in _LEAVES else _from_json(y) for y in x])
+    if cls is _JSONList:
+        return [y if type(y) in _LEAVES else _from_json(y) for y in x]
+    if cls is dict:
+        return {
+            k: v if type(v) in _LEAVES else _from_json(v) for k, v in x.items()
+        }
+    return x
+
+
+class _Interner:
+    """Replaces equal tuples and strings with a single shared object.
+    marshal then writes shared objects once, and refers to them
+    wherever they are used again.
+
+    Only tuples of strings, integers and such tuples are shared, since
+    for instance 1 and True are equal but must be kept apart.
+    """
+
+    pool: dict[Any, Any]
+    seen: dict[int, tuple[tuple, bool]]
+
+    def __init__(self):
+        self.pool = {}
+        self.seen = {}
+
+    def intern(self, x: Any) -> Any:
+        """Return x with shareable parts interned"""
+        cls = type(x)
+        if cls is tuple:
+            return self._tuple(x)[0]
+        if cls is str:
+            return self.pool.setdefault(x, x)
+        if cls is list:
+            return [self.intern(y) for y in x]
+        if cls is dict:
+            return {self.intern(k): self.intern(v) for k, v in x.items()}
+        return x
+
+    def _tuple(self, x: tuple) -> tuple[tuple, bool]:
+        """Return interned tuple and whether it can be shared"""
+        if r := self.seen.get(id(x)):
+            return r
+        pool = self.pool
+        shared = True
+        items = []
+        for y in x:
+            cls = type(y)
+            if cls is str:
+                y = pool.setdefault(y, y)
+            elif cls is tuple:
+                y, ok = self._tuple(y)
+                shared = shared and ok
+            elif cls is not int:
+                y = self.intern(y)
+                shared = False
+            items.append(y)
+        t = tuple(items)
+        r = (pool.setdefault(t, t) if shared else t), shared
+        self.seen[id(x)] = r
+        return r
@@ -0,0 +1,1114 @@
+"""
+Simulation
+Cycle based simulation of modules in the database
+"""
+
+import re
+from collections import OrderedDict
+from hashlib import sha256
+from typing import Any, Callable, NamedTuple, Optional
+
+from ._db import DB, MODULE, default, hierarchy
+from ._store import module_hash
+from ._flatten import flatten_code, leaf_key, split, targets
+from ._module import elaborate
+
+
+class _Register(NamedTuple):
+    clock: str
+    reset: Optional[str]
+    value: tuple
+    asynchronous: bool
+    next: Optional[tuple]
+
+
+class _Memory(NamedTuple):
+    depth: int
+    leaves: tuple[tuple[str, tuple], ...]
+    readers: tuple[str, ...]
+    writers: tuple[str, ...]
+    readwriters: tuple[str, ...]
+    mask: bool
+    latency: int
+
+
+class _Design:
+    """Design flattened to ground type signals, named by their
+    hierarchical names, like inst.a.b[2].
+    Signals are top module inputs, registers, memory read data, or
+    driven by an expression (using hierarchical names).
+    Statements are printf and assertf statements, as
+    (kind, pred, en, prefix, fstr, args) with pred None for printf.
+    """
+
+    name: str
+    types: dict[str, tuple]
+    inputs: dict[str, None]
+    drivers: dict[str, tuple]
+    registers: dict[str, _Register]
+    memories: dict[str, _Memory]
+    reads: dict[str, tuple[str, str, str]]
+    statements: list[tuple]
+    covers: dict[str, tuple[tuple, tuple]]
+
+    def __init__(self, name: str):
+        self.name = name
+        self.types = {}
+        self.inputs = {}
+        self.drivers = {}
+        self.registers = {}
+        self.memories = {}
+        self.reads = {}
+        self.statements = []
+        self.covers = {}
+
+
+class _Elaborator:
+    """Builds design from module hierarchy"""
+
+    def __init__(self, db: DB, design: _Design):
+        self.circuits = db["circuits"]
+        self.design = design
+        self.flat: dict[int, tuple] = {}
+
+    def module(self, cn: str, mn: str, prefix: str, top: bool) -> None:
+        d = self.design
+        m = self.circuits[cn][mn]
+        data = m["data"]
+        for name in m["input"]:
+            self.signal(prefix + name, data[name][1], top, False)
+        for name in m["output"]:
+            self.signal(prefix + name, data[name][1], top, True)
+        for name in (*m["wire"], *m["register"]):
+            self.signal(prefix + name, data[name][1], False, False)
+        for name in m["instance"]:
+            icn, imn = data[name][1][1:3]
+            im = self.circuits[icn][imn]
+            if "_ismem" in im["data"]:
+                self.memory(prefix + name, im)
+            else:
+                self.module(icn, imn, f"{prefix}{name}.", False)
+        drivers, statements = self.flatten(m)
+        g = _Globalizer(prefix)
+        for key, (_, value) in drivers.items():
+            d.drivers[prefix + key] = g.expr(value)
+        for name in m["register"]:
+            _, type, clk, rst, *_ = data[name]
+            pairs: list[tuple] = []
+            split((type, name), (type, rst[1] if rst else 0), pairs)
+            reset = prefix + rst[0] if rst else None
+            kind = rst and data[rst[0]][1][0]
+            for t, v in pairs:
+                key = prefix + leaf_key(t[1])
+                d.registers[key] = _Register(
+                    prefix + clk,
+                    reset,
+                    g.expr(v),
+                    kind in ("reset", "async_reset"),
+                    d.drivers.pop(key, None),
+                )
+        for s in statements:
+            s = (s[0], prefix + s[1], *[_stmt_arg(g, x) for x in s[2:]])
+            match s:
+                case ("coverf", _, pred, en, fstr, *_):
+                    d.covers[_unique(d.covers, prefix + fstr)] = (pred, en)
+                case ("printf", _, en, fstr, *args):
+                    p = ("printf", None, en, prefix, fstr, tuple(args))
+                    d.statements.append(p)
+                case ("assertf", _, pred, en, fstr, *args):
+                    a = ("assertf", pred, en, prefix, fstr, tuple(args))
+                    d.statements.append(a)
+
+    def flatten(self, m: MODULE) -> tuple:
+        if (r := self.flat.get(id(m))) is None:
+            r = self.flat[id(m)] = flatten_code(m)
+        return r
+
+    def signal(self, name: str, type: tuple, top: bool, out: bool) -> None:
+        self.design.types[name] = type
+        match type:
+            case ("struct", *fields):
+                for fname, ftype, flip in fields:
+                    self.signal(f"{name}.{fname}", ftype, top, out ^ flip)
+            case ("array", size, etype):
+                for i in range(size):
+                    self.signal(f"{name}[{i}]", etype, top, out)
+            case _:
+                if top and not out:
+                    self.design.inputs[name] = None
+
+    def memory(self, name: str, m: MODULE) -> None:
+        d = self.design
+        data = m["data"]
+        attr = {k: data[k][1] for k in m["attribute"]}
+        for port in m["input"]:
+            self.signal(f"{name}.{port}", data[port][1], False, False)
+        leaves = tuple(_leaves("", attr["_type"]))
+        fields = {f[0] for port in m["input"] for f in data[port][1][1:]}
+        mem = d.memories[name] = _Memory(
+            attr["_depth"],
+            leaves,
+            tuple(f"{name}.{p}" for p in attr["_readers"]),
+            tuple(f"{name}.{p}" for p in attr["_writers"]),
+            tuple(f"{name}.{p}" for p in attr["_readwriters"]),
+            "mask" in fields or "wmask" in fields,
+            attr.get("_rlat", 1),
+        )
+        for port, field in (
+            *((p, "data") for p in mem.readers),
+            *((p, "rdata") for p in mem.readwriters),
+        ):
+            for suffix, _ in leaves:
+                d.reads[f"{port}.{field}{suffix}"] = (name, port, suffix)
+
+
+def _leaves(name: str, type: tuple):
+    """Yield (name, type) of ground type leaves of type"""
+    match type:
+        case ("struct", *fields):
+            for fname, ftype, _ in fields:
+                yield from _leaves(f"{name}.{fname}", ftype)
+        case ("array", size, etype):
+            for i in range(size):
+                yield from _leaves(f"{name}[{i}]", etype)
+        case _:
+            yield name, type
+
+
+def _unique(names: dict[str, Any], name: str) -> str:
+    """Return name, with a number added if already in names"""
+    k = 1
+    unique = name
+    while unique in names:
+        k += 1
+        unique = f"{name} #{k}"
+    return unique
+
+
+def _stmt_arg(g: "_Globalizer", x: Any) -> Any:
+    return g.expr(x) if isinstance(x, tuple) else x
+
+
+class _Globalizer:
+    """Converts module expressions to design expressions: variables
+    are replaced by hierarchical names, and dynamic indexes by muxes"""
+
+    prefix: str
+    memo: dict[int, tuple[tuple, tuple]]
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.memo = {}
+
+    def expr(self, e: tuple) -> tuple:
+        t, v = e
+        if isinstance(v, int):
+            return e
+        if isinstance(v, str):
+            return (t, self.prefix + v)
+        if (r := self.memo.get(id(e))) is not None:
+            return r[1]
+        if v[0] in (".", "[]"):
+            x = self.var(e)
+        else:
+            x = (t, (v[0], *[self.expr(a) for a in v[1:]]))
+        self.memo[id(e)] = (e, x)
+        return x
+
+    def var(self, e: tuple) -> tuple:
+        t = e[0]
+        r: Optional[tuple] = None
+        for c, x in reversed(targets(e)):
+            v = (t, self.prefix + leaf_key(x[1]))
+            r = v if r is None else (t, ("mux", self.expr(c), v, r))
+        assert r is not None
+        return r
+
+
+def _lookup(name: str, db: DB) -> tuple[str, str]:
+    """Return (circuit, module) names of module, elaborated"""
+    if "::" not in name:
+        name = f"{name}::{name}"
+    cn, mn = name.split("::", 1)
+    if mn not in db["circuits"].get(cn, {}):
+        raise NameError(f"No module named {name} defined")
+    elaborate(db=db, modules=[(cn, mn)])
+    return cn, mn
+
+
+def design(name: str, db: Optional[DB] = None) -> _Design:
+    """Return design of module with given name (circuit::module),
+    flattened for simulation"""
+    db = db or default
+    cn, mn = _lookup(name, db)
+    return _design(db, cn, mn)
+
+
+def _design(db: DB, cn: str, mn: str) -> _Design:
+    d = _Design(f"{cn}::{mn}")
+    _Elaborator(db, d).module(cn, mn, "", True)
+    return d
+
+
+def normalize(value: int, type: tuple) -> int:
+    """Return value wrapped to the width of type"""
+    size = type[1]
+    if not size:
+        return value
+    value &= (1 << size) - 1
+    if type[0] == "sint" and value >> (size - 1):
+        value -= 1 << size
+    return value
+
+
+def _div(a: int, b: int) -> int:
+    if b == 0:
+        return 0
+    q = abs(a) // abs(b)
+    return -q if (a < 0) != (b < 0) else q
+
+
+def _rem(a: int, b: int) -> int:
+    if b == 0:
+        return 0
+    r = abs(a) % abs(b)
+    return -r if a < 0 else r
+
+
+def _mask(e: tuple) -> int:
+    return (1 << e[0][1]) - 1
+
+
+_OPS = {
+    # op -> function of argument values and argument expressions
+    "+": lambda x, a: x[0] + x[1],
+    "-": lambda x, a: x[0] - x[1],
+    "*": lambda x, a: x[0] * x[1],
+    "//": lambda x, a: _div(x[0], x[1]),
+    "%": lambda x, a: _rem(x[0], x[1]),
+    "==": lambda x, a: int(x[0] == x[1]),
+    "!=": lambda x, a: int(x[0] != x[1]),
+    ">": lambda x, a: int(x[0] > x[1]),
+    ">=": lambda x, a: int(x[0] >= x[1]),
+    "<": lambda x, a: int(x[0] < x[1]),
+    "<=": lambda x, a: int(x[0] <= x[1]),
+    ">>": lambda x, a: x[0] >> x[1],
+    "<<": lambda x, a: x[0] << x[1],
+    "&": lambda x, a: x[0] & x[1],
+    "|": lambda x, a: x[0] | x[1],
+    "^": lambda x, a: x[0] ^ x[1],
+    "and": lambda x, a: x[0] & x[1],
+    "or": lambda x, a: x[0] | x[1],
+    "~": lambda x, a: ~x[0],
+    "not": lambda x, a: ~x[0],
+    "neg": lambda x, a: -x[0],
+    "andr": lambda x, a: int(x[0] & _mask(a[0]) == _mask(a[0])),
+    "orr": lambda x, a: int(x[0] & _mask(a[0]) != 0),
+    "xorr": lambda x, a: (x[0] & _mask(a[0])).bit_count() & 1,
+    "cat": lambda x, a: ((x[0] & _mask(a[0])) << a[1][0][1])
+    | (x[1] & _mask(a[1])),
+    "pad": lambda x, a: x[0],
+    "bits": lambda x, a: (x[0] >> x[2]) & ((1 << (x[1] - x[2] + 1)) - 1),
+    "cvt": lambda x, a: x[0],
+    "as_uint": lambda x, a: x[0],
+    "as_sint": lambda x, a: normalize(x[0], ("sint", a[0][0][1])),
+    "as_clock": lambda x, a: x[0],
+    "as_async_reset": lambda x, a: x[0],
+}
+
+
+_SPEC = re.compile("%([bdxc%])")
+
+
+def _format(fstr: str, args: tuple, values: Any) -> str:
+    """Return printf format string with the format specifiers replaced
+    by the values of args. Like in Verilog, %b and %x values are padded
+    with zeros to the width of the argument."""
+    found = iter(zip(args, values))
+
+    def spec(match: re.Match) -> str:
+        c = match[1]
+        if c == "%":
+            return "%"
+        (t, _), v = next(found)
+        if c == "d":
+            return str(v)
+        w = t[1]
+        v &= (1 << w) - 1
+        if c == "c":
+            return chr(v)
+        return format(v, f"0{(w + 3) // 4 if c == 'x' else w}{c}")
+
+    return _SPEC.sub(spec, fstr)
+
+
+def coverage_report(coverage: dict[str, int]) -> str:
+    """Return report of cover point hit counts, as returned by the
+    coverage() method of simulators, or by run_sharded()"""
+    lines = [f"{n:10} {name}" for name, n in coverage.items()]
+    hit = sum(1 for n in coverage.values() if n)
+    lines.append(f"{hit} of {len(coverage)} cover points hit")
+    return "\n".join(lines)
+
+
+class _Simulator:
+    """Simulates a design by interpreting its expressions.
+
+    All registers and memories are clocked by the same clock, stepped
+    by step(). Values of signed signals are negative integers when the
+    sign bit is set.
+    Enabled printf statements are logged, and formatted by printed().
+    Enabled assertf statements with false predicates are logged and
+    raise AssertionError at the end of the cycle.
+    """
+
+    design: _Design
+    cycle: int
+    state: dict[str, int]
+    memories: dict[str, dict[str, list[int]]]
+    addresses: dict[str, list[int]]
+    counters: list[int]
+    log: list[tuple]
+    tracers: list[Any]
+    cache: dict[str, int]
+    busy: set[str]
+
+    def __init__(self, design: _Design):
+        self.design = design
+        self.cycle = 0
+        self.state = dict.fromkeys([*design.inputs, *design.registers], 0)
+        self.memories = {
+            name: {s: [0] * m.depth for s, _ in m.leaves}
+            for name, m in design.memories.items()
+        }
+        self.addresses = {
+            port: [0] * m.latency
+            for m in design.memories.values()
+            for port in (*m.readers, *m.readwriters)
+        }
+        self.counters = [0] * len(design.covers)
+        self.log = []
+        self.tracers = []
+        self.cache = {}
+        self.busy = set()
+
+    def poke(self, name: str, value: Any) -> None:
+        """Set value of top module input.
+        Struct values are dicts and array values lists, like literals
+        in code.
+        """
+        type = self._type(name)
+        pairs: list[tuple] = []
+        split((type, name), (type, value), pairs)
+        for t, v in pairs:
+            key = leaf_key(t[1])
+            if key not in self.design.inputs:
+                raise TypeError(f"Cannot poke {key}, not an input")
+            self._set(key, self._input(key, v[1], t[0]))
+
+    def peek(self, name: str) -> Any:
+        """Return value of signal.
+        Struct values are returned as dicts and array values as lists.
+        """
+        match self._type(name):
+            case ("struct", *fields):
+                return {f[0]: self.peek(f"{name}.{f[0]}") for f in fields}
+            case ("array", size, _):
+                return [self.peek(f"{name}[{i}]") for i in range(size)]
+        return self.value(name)
+
+    def step(self, n: int = 1) -> None:
+        """Advance simulation n clock cycles"""
+        if not self.tracers:
+            self._run(n)
+            return
+        for _ in range(n):
+            for t in self.tracers:
+                t.sample()
+            self._run(1)
+
+    def _run(self, n: int) -> None:
+        for _ in range(n):
+            self._step()
+
+    def coverage(self) -> dict[str, int]:
+        """Return number of cycles each cover point (coverf statement)
+        was enabled and its predicate true, by hierarchical name of the
+        cover point (instance path and message)"""
+        return dict(zip(self.design.covers, self.counters))
+
+    def printed(self) -> list[str]:
+        """Return output of the printf statements so far"""
+        statements = self.design.statements
+        return [
+            self._text(e) for e in self.log if statements[e[0]][0] == "printf"
+        ]
+
+    def _text(self, entry: tuple) -> str:
+        """Return formatted message of log entry (k, cycle, *values)"""
+        *_, fstr, args = self.design.statements[entry[0]]
+        return _format(fstr, args, entry[2:])
+
+    def _fail(self, cycle: int) -> None:
+        """Raise AssertionError for the assertions that failed in cycle"""
+        messages = []
+        for e in self.log:
+            kind, _, _, prefix, *_ = self.design.statements[e[0]]
+            if e[1] == cycle and kind == "assertf":
+                where = f" in {prefix[:-1]}" if prefix else ""
+                messages.append(
+                    f"Assertion failed{where} in cycle {cycle}: "
+                    f"{self._text(e)}"
+                )
+        raise AssertionError("\n".join(messages))
+
+    def _input(self, key: str, value: Any, type: tuple) -> Any:
+        """Return value to set input to"""
+        if not isinstance(value, int):
+            raise TypeError(f"Cannot poke {key} with {value}")
+        return normalize(value, type)
+
+    def _set(self, key: str, value: int) -> None:
+        self.state[key] = value
+        self.cache.clear()
+
+    def _type(self, name: str) -> tuple:
+        try:
+            return self.design.types[name]
+        except KeyError:
+            raise KeyError(f"No signal named {name} in {self.design.name}")
+
+    def value(self, key: str) -> int:
+        """Return value of ground type signal"""
+        v = self.cache.get(key)
+        if v is None:
+            v = self.cache[key] = self._compute(key)
+        return v
+
+    def _compute(self, key: str) -> int:
+        d = self.design
+        if (r := d.registers.get(key)) is not None:
+            if r.asynchronous and self.value(r.reset):  # type: ignore
+                v = normalize(self.eval(r.value), d.types[key])
+                self.state[key] = v
+            return self.state[key]
+        if key in d.inputs:
+            return self.state[key]
+        if (m := d.reads.get(key)) is not None:
+            name, port, suffix = m
+            return self._read(name, port, suffix)
+        if (e := d.drivers.get(key)) is not None:
+            if key in self.busy:
+                raise ValueError(f"Combinational loop through {key}")
+            self.busy.add(key)
+            try:
+                return normalize(self.eval(e), d.types[key])
+            finally:
+                self.busy.discard(key)
+        return 0
+
+    def _read(self, name: str, port: str, suffix: str) -> int:
+        mem = self.design.memories[name]
+        if mem.latency:
+            addr = self.addresses[port][0]
+        else:
+            addr = self.value(f"{port}.addr")
+        if addr < mem.depth:
+            return self.memories[name][suffix][addr]
+        return 0
+
+    def eval(self, e: tuple) -> int:
+        """Return value of expression"""
+        t, v = e
+        if type(v) is int:
+            return v
+        if type(v) is str:
+            return self.value(v)
+        op = v[0]
+        if op == "mux":
+            return self.eval(v[2] if self.eval(v[1]) else v[3])
+        args = v[1:]
+        try:
+            f = _OPS[op]
+        except KeyError:
+            raise ValueError(f"Cannot simulate operator {op}")
+        return normalize(f([self.eval(a) for a in args], args), t)
+
+    def _step(self) -> None:
+        d = self.design
+        value = self.value
+        state: dict[str, int] = {}
+        for key, r in d.registers.items():
+            if r.reset is not None and value(r.reset):
+                v = self.eval(r.value)
+            elif r.next is not None:
+                v = self.eval(r.next)
+            else:
+                continue
+            state[key] = normalize(v, d.types[key])
+        writes: list[tuple[list[int], int, int]] = []
+        addresses: dict[str, int] = {}
+        for name, m in d.memories.items():
+            data = self.memories[name]
+            ports = [(p, "data", "mask", 1) for p in m.writers]
+            for p in m.readwriters:
+                wmode = value(f"{p}.wmode")
+                ports.append((p, "wdata", "wmask", wmode))
+                if not wmode:
+                    ports.append((p, "", "", 0))
+            for p, dname, mname, write in ports:
+                if not value(f"{p}.en"):
+                    continue
+                addr = value(f"{p}.addr")
+                if not write:
+                    addresses[p] = addr
+                    continue
+                if addr >= m.depth:
+                    continue
+                for s, t in m.leaves:
+                    if m.mask and not value(f"{p}.{mname}{s}"):
+                        continue
+                    v = normalize(value(f"{p}.{dname}{s}"), t)
+                    writes.append((data[s], addr, v))
+            for p in m.readers:
+                if value(f"{p}.en"):
+                    addresses[p] = value(f"{p}.addr")
+        for i, (pred, en) in enumerate(d.covers.values()):
+            if self.eval(en) and self.eval(pred):
+                self.counters[i] += 1
+        failed = False
+        for k, (_, pred, en, _, _, args) in enumerate(d.statements):
+            if self.eval(en) and (pred is None or not self.eval(pred)):
+                self.log.append((k, self.cycle, *map(self.eval, args)))
+                failed = failed or pred is not None
+        self.state.update(state)
+        for mem, addr, v in writes:
+            mem[addr] = v
+        for p, pipe in self.addresses.items():
+            if pipe:
+                pipe.append(addresses.get(p, pipe[-1]))
+                del pipe[0]
+        self.cache.clear()
+        self.cycle += 1
+        if failed:
+            self._fail(self.cycle - 1)
+
+
+_SOURCE = {
+    # op -> Python source, of argument sources
+    "+": "({0} + {1})",
+    "-": "({0} - {1})",
+    "*": "({0} * {1})",
+    "//": "_div({0}, {1})",
+    "%": "_rem({0}, {1})",
+    "==": "int({0} == {1})",
+    "!=": "int({0} != {1})",
+    ">": "int({0} > {1})",
+    ">=": "int({0} >= {1})",
+    "<": "int({0} < {1})",
+    "<=": "int({0} <= {1})",
+    ">>": "({0} >> {1})",
+    "<<": "({0} << {1})",
+    "&": "({0} & {1})",
+    "|": "({0} | {1})",
+    "^": "({0} ^ {1})",
+    "and": "({0} & {1})",
+    "or": "({0} | {1})",
+    "~": "(~{0})",
+    "not": "(~{0})",
+    "neg": "(-{0})",
+    "pad": "{0}",
+    "cvt": "{0}",
+    "as_uint": "{0}",
+    "as_sint": "{0}",
+    "as_clock": "{0}",
+    "as_async_reset": "{0}",
+}
+
+# Operators with results that are always in range of their types
+_IN_RANGE = {
+    *("==", "!=", ">", ">=", "<", "<="),
+    *("andr", "orr", "xorr", "bits", "pad", "cvt"),
+}
+
+# Expressions nested deeper are assigned to temporaries
+_MAX_DEPTH = 32
+
+
+class _Emitter:
+    """Generates Python source of the functions simulating a design:
+    eval_comb(v, M, A) computes the values of all signals, and
+    step(v, M, A, C, L, c) advances clock cycle c.
+    v holds the values of the signals, M the contents of the memories
+    (one list per memory and data leaf), A the read address pipelines
+    of the memory read ports and C the counters of the cover points.
+    Enabled printf statements and failed assertf statements are
+    appended to the log L, and step() returns true if an assertion
+    failed.
+    """
+
+    design: _Design
+    index: dict[str, int]
+    memories: dict[tuple[str, str], int]
+    ports: dict[str, int]
+    lines: list[str]
+    temps: dict[int, str]
+    shared: set[int]
+
+    # Names used by the generated code
+    namespace: dict[str, Any] = {"_div": _div, "_rem": _rem}
+
+    def __init__(self, design: _Design):
+        self.design = design
+        ground = [k for k, t in design.types.items() if t[0] in _GROUND]
+        self.index = {k: i for i, k in enumerate(ground)}
+        self.memories = {}
+        self.ports = {}
+        for name, m in design.memories.items():
+            for s, _ in m.leaves:
+                self.memories[(name, s)] = len(self.memories)
+            for p in (*m.readers, *m.readwriters):
+                self.ports[p] = len(self.ports)
+        self.shared = self._shared()
+        self.order = self._order()
+        self.lines = []
+        self.temps = {}
+
+    def source(self) -> str:
+        """Return source of eval_comb() and step()"""
+        self._function("eval_comb", "v, M, A")
+        self.lines.append(f"    v[:] = ({self.values()})")
+        comb = self.lines
+        self._function("step", "v, M, A, C, L, c")
+        self.update()
+        return "\n".join([*comb, "", *self.lines, ""])
+
+    def _function(self, name: str, params: str) -> None:
+        self.lines = [f"def {name}({params}):"]
+        self.temps = {}
+        if self.memories:
+            self.lines.append(
+                f"    {''.join(f'M{i}, ' for i in self.memories.values())}= M"
+            )
+        if self.ports:
+            self.lines.append(
+                f"    {''.join(f'A{i}, ' for i in self.ports.values())}= A"
+            )
+        for key in self.order:
+            s = self.signal(key)
+            self.lines.append(f"    {self.local(key)} = {s}")
+
+    def values(self) -> str:
+        return ", ".join(self.local(k) for k in self.index) + ","
+
+    def local(self, key: str) -> str:
+        return f"x{self.index[key]}"
+
+    def signal(self, key: str) -> str:
+        """Return source of value of signal"""
+        d = self.design
+        i = self.index[key]
+        if (r := d.registers.get(key)) is not None:
+            if r.asynchronous:
+                rv = self.value(r.value, d.types[key])
+                reset = self.local(r.reset)  # type: ignore[arg-type]
+                return self.select(reset, rv, f"v[{i}]")
+            return f"v[{i}]"
+        if key in d.inputs:
+            return f"v[{i}]"
+        if (x := d.reads.get(key)) is not None:
+            name, port, suffix = x
+            m = d.memories[name]
+            if m.latency:
+                addr = f"A{self.ports[port]}[0]"
+            else:
+                addr = self.local(f"{port}.addr")
+            return self.read(f"M{self.memories[(name, suffix)]}", addr, m)
+        if (e := d.drivers.get(key)) is not None:
+            return self.value(e, d.types[key])
+        return self.const(0)
+
+    def update(self) -> None:
+        """Add statements updating registers, memories and cover point
+        counters, and executing printf and assertf statements"""
+        d = self.design
+        local = self.local
+        commits = []
+        for key, r in d.registers.items():
+            t = d.types[key]
+            n = None if r.next is None else self.value(r.next, t)
+            if r.reset is not None:
+                rv = self.value(r.value, t)
+                n = self.select(local(r.reset), rv, n or local(key))
+            if n is not None:
+                i = self.index[key]
+                self.lines.append(f"    n{i} = {n}")
+                commits.append(f"    v[{i}] = n{i}")
+        for name, m in d.memories.items():
+            for p in m.writers:
+                self.write(name, m, p, local(f"{p}.en"), "data", "mask")
+            for p in m.readwriters:
+                en = self.both(local(f"{p}.en"), local(f"{p}.wmode"))
+                self.write(name, m, p, en, "wdata", "wmask")
+            for p in m.readers:
+                self.latch(m, p, local(f"{p}.en"))
+            for p in m.readwriters:
+                wmode = self.inverse(local(f"{p}.wmode"))
+                self.latch(m, p, self.both(local(f"{p}.en"), wmode))
+        for k, (pred, enable) in enumerate(d.covers.values()):
+            self.cover(k, self.expr(enable), self.expr(pred))
+        checks = any(s[1] is not None for s in d.statements)
+        if checks:
+            self.lines.append("    f = 0")
+        for k, (_, pred, en, _, _, args) in enumerate(d.statements):
+            entry = ", ".join([str(k), "c", *map(self.expr, args)])
+            if pred is None:
+                self.printf(self.expr(en), entry)
+            else:
+                self.check(self.expr(en), self.expr(pred), entry)
+        self.lines += commits
+        if checks:
+            self.lines.append("    return f")
+
+    def write(
+        self, name: str, m: _Memory, port: str, en: str, data: str, mask: str
+    ) -> None:
+        addr = self.local(f"{port}.addr")
+        self.lines.append(f"    if {en} and {addr} < {m.depth}:")
+        for s, _ in m.leaves:
+            store = (
+                f"M{self.memories[(name, s)]}[{addr}] = "
+                f"{self.local(f'{port}.{data}{s}')}"
+            )
+            if m.mask:
+                store = f"if {self.local(f'{port}.{mask}{s}')}: {store}"
+            self.lines.append(f"        {store}")
+
+    def latch(self, m: _Memory, port: str, en: str) -> None:
+        a = f"A{self.ports[port]}"
+        addr = self.local(f"{port}.addr")
+        if m.latency == 1:
+            self.lines.append(f"    if {en}: {a}[0] = {addr}")
+        elif m.latency:
+            self.lines.append(f"    {a}.append({addr} if {en} else {a}[-1])")
+            self.lines.append(f"    del {a}[0]")
+
+    def value(self, e: tuple, type: tuple) -> str:
+        """Return source of expression, normalized to type"""
+        t, v = e
+        if isinstance(v, int):
+            return self.const(normalize(v, type))
+        s = self.expr(e)
+        if t == type and (isinstance(v, str) or v[0] != "mux"):
+            return s
+        return self.normalize(s, type)
+
+    def expr(self, e: tuple, depth: int = 0) -> str:
+        """Return source of expression"""
+        t, v = e
+        if isinstance(v, int):
+            return self.const(v)
+        if isinstance(v, str):
+            return self.local(v)
+        if (name := self.temps.get(id(e))) is not None:
+            return name
+        if id(e) in self.shared or depth > _MAX_DEPTH:
+            name = self.temps[id(e)] = f"t{len(self.temps)}"
+            s = self.op(t, v[0], v[1:], 0)
+            self.lines.append(f"    {name} = {s}")
+            return name
+        return self.op(t, v[0], v[1:], depth)
+
+    def op(self, t: tuple, op: str, args: tuple, depth: int) -> str:
+        """Return source of operator expression"""
+        a = [self.expr(x, depth + 1) for x in args]
+        match op:
+            case "mux":
+                return self.select(*a)
+            case "andr":
+                m = _mask(args[0])
+                return f"int(({a[0]} & {m}) == {m})"
+            case "orr":
+                return f"int(({a[0]} & {_mask(args[0])}) != 0)"
+            case "xorr":
+                return f"(({a[0]} & {_mask(args[0])}).bit_count() & 1)"
+            case "cat":
+                m0, m1, w1 = _mask(args[0]), _mask(args[1]), args[1][0][1]
+                s = f"((({a[0]} & {m0}) << {w1}) | ({a[1]} & {m1}))"
+            case "bits":
+                hi, lo = args[1][1], args[2][1]
+                return f"(({a[0]} >> {lo}) & {(1 << (hi - lo + 1)) - 1})"
+            case _:
+                try:
+                    s = _SOURCE[op].format(*a)
+                except KeyError:
+                    raise ValueError(f"Cannot simulate operator {op}")
+        if op in _IN_RANGE:
+            return s
+        return self.normalize(s, t)
+
+    def cover(self, k: int, en: str, pred: str) -> None:
+        cond = pred if en == "1" else f"{en} and {pred}"
+        self.lines.append(f"    if {cond}: C[{k}] += 1")
+
+    def printf(self, en: str, entry: str) -> None:
+        self.lines.append(f"    if {en}: L.append(({entry}))")
+
+    def check(self, en: str, pred: str, entry: str) -> None:
+        cond = f"not {pred}" if en == "1" else f"{en} and not {pred}"
+        self.lines.append(f"    if {cond}:")
+        self.lines.append(f"        L.append(({entry}))")
+        self.lines.append("        f = 1")
+
+    def both(self, a: str, b: str) -> str:
+        return f"{a} and {b}"
+
+    def inverse(self, a: str) -> str:
+        return f"not {a}"
+
+    def const(self, value: int) -> str:
+        return repr(value)
+
+    def select(self, c: str, a: str, b: str) -> str:
+        return f"({a} if {c} else {b})"
+
+    def read(self, mem: str, addr: str, m: _Memory) -> str:
+        return f"({mem}[{addr}] if {addr} < {m.depth} else 0)"
+
+    def normalize(self, s: str, type: tuple) -> str:
+        size = type[1]
+        if not size:
+            return s
+        mask = (1 << size) - 1
+        if type[0] == "sint":
+            half = 1 << (size - 1)
+            return f"((({s}) + {half} & {mask}) - {half})"
+        return f"({s} & {mask})"
+
+    def _expressions(self):
+        d = self.design
+        yield from d.drivers.values()
+        for r in d.registers.values():
+            yield r.value
+            if r.next is not None:
+                yield r.next
+        for pred, en in d.covers.values():
+            yield pred
+            yield en
+        for _, pred, en, _, _, args in d.statements:
+            if pred is not None:
+                yield pred
+            yield en
+            yield from args
+
+    def _shared(self) -> set[int]:
+        """Return ids of operator expressions used more than once"""
+        seen: set[int] = set()
+        shared: set[int] = set()
+
+        def visit(e):
+            v = e[1]
+            if isinstance(v, (int, str)):
+                return
+            if id(e) in seen:
+                shared.add(id(e))
+                return
+            seen.add(id(e))
+            for x in v[1:]:
+                visit(x)
+
+        for e in self._expressions():
+            visit(e)
+        return shared
+
+    def _dependencies(self, key: str) -> list[str]:
+        d = self.design
+        if (r := d.registers.get(key)) is not None:
+            if r.asynchronous:
+                return [r.reset, *_signals(r.value)]  # type: ignore
+            return []
+        if (x := d.reads.get(key)) is not None:
+            if d.memories[x[0]].latency:
+                return []
+            return [f"{x[1]}.addr"]
+        if (e := d.drivers.get(key)) is not None:
+            return _signals(e)
+        return []
+
+    def _order(self) -> list[str]:
+        """Return signals in evaluation order"""
+        order: list[str] = []
+        state: dict[str, int] = {}
+        for root in self.index:
+            if root in state:
+                continue
+            state[root] = 1
+            stack = [(root, iter(self._dependencies(root)))]
+            while stack:
+                key, deps = stack[-1]
+                for dep in deps:
+                    s = state.get(dep)
+                    if s is None:
+                        state[dep] = 1
+                        stack.append((dep, iter(self._dependencies(dep))))
+                        break
+                    if s == 1:
+                        raise ValueError(f"Combinational loop through {dep}")
+                else:
+                    stack.pop()
+                    state[key] = 2
+                    order.append(key)
+        return order
+
+
+_GROUND = ("uint", "sint", "clock", "reset", "async_reset")
+
+
+def _signals(e: tuple) -> list[str]:
+    """Return names of signals used in expression"""
+    found: dict[str, None] = {}
+    seen: set[int] = set()
+    todo = [e]
+    while todo:
+        x = todo.pop()
+        v = x[1]
+        if isinstance(v, str):
+            found[v] = None
+        elif isinstance(v, tuple) and id(x) not in seen:
+            seen.add(id(x))
+            todo += v[1:]
+    return list(found)
+
+
+class _Program(NamedTuple):
+    design: _Design
+    emitter: type[_Emitter]
+    slots: dict[str, int]
+    memories: dict[tuple[str, str], int]
+    ports: dict[str, int]
+    eval_comb: Callable
+    step: Callable
+    source: str
+
+    def __reduce__(self):
+        # The generated functions cannot be pickled, so programs are
+        # sent (to worker processes) as source and loaded again
+        d, e, i, m, p, *_, s = self
+        return _load, (d, e, i, m, p, s)
+
+
+def _compile(design: _Design, emitter: type[_Emitter]) -> _Program:
+    em = emitter(design)
+    return _load(design, emitter, em.index, em.memories, em.ports, em.source())
+
+
+def _load(
+    design: _Design,
+    emitter: type[_Emitter],
+    index: dict[str, int],
+    memories: dict[tuple[str, str], int],
+    ports: dict[str, int],
+    source: str,
+) -> _Program:
+    namespace = dict(emitter.namespace)
+    exec(compile(source, f"<hamp {design.name}>", "exec"), namespace)
+    return _Program(
+        design,
+        emitter,
+        index,
+        memories,
+        ports,
+        namespace["eval_comb"],
+        namespace["step"],
+        source,
+    )
+
+
+_programs: OrderedDict[str, _Program] = OrderedDict()
+_PROGRAMS = 32
+
+
+def program(
+    name: str, db: Optional[DB] = None, emitter: type[_Emitter] = _Emitter
+) -> _Program:
+    """Return compiled simulation program of module with given name,
+    generated by emitter.
+    Programs are cached by the structural hashes of the modules in the
+    hierarchy, so unchanged designs are only compiled once.
+    """
+    db = db or default
+    cn, mn = _lookup(name, db)
+    circuits = db["circuits"]
+    h = sha256(f"{emitter.__module__}.{emitter.__name__}:{cn}::{mn}".encode())
+    for c, m in hierarchy(db).reachable((cn, mn)):
+        h.update(f"{c}::{m}:{module_hash(circuits[c][m])};".encode())
+    key = h.hexdigest()
+    if (p := _programs.get(key)) is not None:
+        _programs.move_to_end(key)
+        return p
+    p = _programs[key] = _compile(_design(db, cn, mn), emitter)
+    if len(_programs) > _PROGRAMS:
+        _programs.popitem(last=False)
+    return p
+
+
+class _CompiledSimulator(_Simulator):
+    """Simulates a design by running its compiled program"""
+
+    program: _Program
+    values: list[int]
+    dirty: bool
+
+    def __init__(self, program: _Program):
+        super().__init__(program.design)
+        self.program = program
+        self.values = [0] * len(program.slots)
+        self.M = [self.memories[n][s] for n, s in program.memories]
+        self.A = [self.addresses[p] for p in program.ports]
+        self.C = self.counters
+        self.dirty = True
+
+    def _set(self, key: str, value: int) -> None:
+        self.values[self.program.slots[key]] = value
+        self.dirty = True
+
+    def value(self, key: str) -> int:
+        if self.dirty:
+            self.program.eval_comb(self.values, self.M, self.A)
+            self.dirty = False
+        return self.values[self.program.slots[key]]
+
+    def _run(self, n: int) -> None:
+        step, v, M, A = self.program.step, self.values, self.M, self.A
+        C, L = self.C, self.log
+        for c in range(self.cycle, self.cycle + n):
+            if step(v, M, A, C, L, c):
+                self.cycle = c + 1
+                self.dirty = True
+                self._fail(c)
+        self.cycle += n
+        self.dirty = True
+
+
+def simulator(
+    name: str, db: Optional[DB] = None, backend: str = "compile"
+) -> _Simulator:
+    """Return simulator of module with given name (circuit::module).
+    Use supplied database, or default if not given.
+
+    Set inputs with poke(), advance clock cycles with step(), and read
+    outputs and other signals with peek(), for instance:
+
+        sim = simulator("counter")
+        sim.poke("en", 1)
+        sim.step(10)
+        assert sim.peek("out") == 10
+
+    The design is compiled to Python code, unless backend is
+    "interpret", which interprets the design expressions instead.
+    """
+    if backend == "compile":
+        return _CompiledSimulator(program(name, db))
+    if backend == "interpret":
+        return _Simulator(design(name, db))
+    raise ValueError(f"Unknown simulation backend: {backend}")
@@ -0,0 +1,248 @@
+"""
+Simplification
+Propagates constants and simplifies the expressions of module code
+"""
+
+from typing import Any, Optional, Sequence
+
+from ._db import DB, MODULE, default, modified
+from ._flatten import root_name
+from ._module import elaborate
+from ._sim import _OPS, normalize
+
+_INTS = ("uint", "sint")
+
+
+def _const(e: tuple) -> Optional[int]:
+    v = e[1]
+    return v if isinstance(v, int) else None
+
+
+def _param(n: int) -> tuple:
+    return (("uint", 0), n)
+
+
+def _fit(e: tuple, type: tuple) -> Optional[tuple]:
+    """Return expression e as expression of type, padded if narrower,
+    or None if it cannot be done without changing its value"""
+    t, v = e
+    if t == type:
+        return e
+    if type[0] not in _INTS or t[0] != type[0]:
+        return None
+    if isinstance(v, int):
+        return (type, normalize(v, type))
+    if 0 < t[1] <= type[1]:
+        return (type, ("pad", e, _param(type[1])))
+    return None
+
+
+def _rule(t: tuple, op: str, args: list) -> Optional[tuple]:
+    """Return simplified expression of type t of op applied to args,
+    or None if no rule applies"""
+    values = [_const(a) if isinstance(a, tuple) else None for a in args]
+    if op == "mux":
+        c, a, b = args
+        if values[0] is not None:
+            return _fit(a if values[0] else b, t)
+        return _fit(a, t) if a == b else None
+    if t[0] not in _INTS:
+        return None
+    if op in _OPS and None not in values:
+        return (t, normalize(_OPS[op](values, args), t))
+    zero = (t, 0)
+    match op, values:
+        case ("+" | "|" | "^" | "or", [0, _]) | ("*" | "and", [1, _]):
+            return _fit(args[1], t)
+        case ("+" | "-" | "|" | "^" | "or" | "<<" | ">>", [_, 0]) | (
+            "*" | "//" | "and",
+            [_, 1],
+        ):
+            return _fit(args[0], t)
+        case ("&" | "*" | "and", [0, _] | [_, 0]):
+            return zero
+        case ("or", [1, _] | [_, 1]):
+            return (t, 1)
+    ones = (1 << t[1]) - 1 if t[0] == "uint" and t[1] else None
+    match op, values:
+        case "&", [int(v), _] if v == ones:
+            return _fit(args[1], t)
+        case "&", [_, int(v)] if v == ones:
+            return _fit(args[0], t)
+    x = args[0]
+    w = x[0][1]
+    match op, values:
+        case "<<", [None, int(k)] if x[0][0] == "uint" and w:
+            return _fit((("uint", w + k), ("cat", x, (("uint", k), 0))), t)
+        case ">>", [None, int(k)] if x[0][0] == "uint" and w:
+            if k >= w:
+                return zero
+            bits = [x, _param(w - 1), _param(k)]
+            r = _rule(("uint", w - k), "bits", bits)
+            return _fit(r or (("uint", w - k), ("bits", *bits)), t)
+    match op, x[1]:
+        case "not", ("not", y):
+            return _fit(y, t)
+        case "bits", ("bits", y, (_, int(_)), (_, int(lo))):
+            h, low = values[1] + lo, values[2] + lo  # type: ignore
+            return (t, ("bits", y, _param(h), _param(low)))
+        case "bits", _ if x[0] == t and values[1:] == [t[1] - 1, 0]:
+            return x
+        case "pad", ("pad", y, (_, int(n))):
+            return (t, ("pad", y, _param(max(n, values[1]))))  # type: ignore
+        case "pad", _ if x[0] == t:
+            return x
+    return None
+
+
+class _Simplifier:
+    """Simplifies expressions, replacing reads of constant signals by
+    their values"""
+
+    consts: dict[str, int]
+    memo: dict[int, tuple[tuple, tuple]]
+
+    def __init__(self, consts: dict[str, int]):
+        self.consts = consts
+        self.memo = {}
+
+    def code(self, code: Sequence[tuple]) -> Sequence[tuple]:
+        """Return simplified code, or code itself if unchanged.
+        Changed when and else bodies are tuples."""
+        out = [self.statement(s) for s in code]
+        if all(a is b for a, b in zip(out, code)):
+            return code
+        return out
+
+    def statement(self, s: tuple) -> tuple:
+        """Return simplified statement, or s itself if unchanged"""
+        new: tuple
+        match s:
+            case ("connect", target, value, *attrs):
+                new = ("connect", self.target(target), self.expr(value))
+            case ("when" | "else-when" as kind, c, body, *attrs):
+                new = (kind, self.expr(c), self._body(body))
+            case ("else", body, *attrs):
+                new = ("else", self._body(body))
+            case (kind, clk, *args):
+                new = (kind, clk, *[self._arg(a) for a in args])
+                attrs = []
+            case _:
+                return s
+        if all(a is b for a, b in zip(new[1:], s[1:])):
+            return s
+        return (*new, *attrs)
+
+    def _body(self, body: Sequence[tuple]) -> Sequence[tuple]:
+        new = self.code(body)
+        return body if new is body else tuple(new)
+
+    def target(self, e: tuple) -> tuple:
+        """Return target with its dynamic indexes simplified"""
+        t, v = e
+        match v:
+            case (".", inner, field):
+                new = self.target(inner)
+                if new is not inner:
+                    return (t, (".", new, field))
+            case ("[]", inner, idx):
+                new, i = self.target(inner), self.expr(idx)
+                if new is not inner or i is not idx:
+                    return (t, ("[]", new, i))
+        return e
+
+    def _arg(self, a: Any) -> Any:
+        return self.expr(a) if isinstance(a, tuple) else a
+
+    def expr(self, e: tuple) -> tuple:
+        if (m := self.memo.get(id(e))) is not None and m[0] is e:
+            return m[1]
+        r = self._expr(e)
+        self.memo[id(e)] = (e, r)
+        return r
+
+    def _expr(self, e: tuple) -> tuple:
+        t, v = e
+        match v:
+            case str(name):
+                if (c := self.consts.get(name)) is not None:
+                    return (t, c)
+            case (str(op), *args):
+                new = [self._arg(a) for a in args]
+                if (r := _rule(t, op, new)) is not None:
+                    return r
+                if any(a is not b for a, b in zip(args, new)):
+                    return (t, (op, *new))
+        return e
+
+
+def _constants(module: MODULE, code: Sequence[tuple]) -> dict[str, int]:
+    """Return values of the wires connected to a constant only, and of
+    the registers connected only to themselves or their reset value"""
+    drivers: dict[str, list[tuple[bool, tuple]]] = {}
+
+    def visit(code: Sequence[tuple], top: bool) -> None:
+        for s in code:
+            match s:
+                case ("connect", (_, var), value, *_):
+                    d = drivers.setdefault(root_name(var), [])
+                    d.append((top and isinstance(var, str), value))
+                case ("when" | "else-when", _, body, *_) | ("else", body, *_):
+                    visit(body, False)
+
+    visit(code, True)
+    data = module["data"]
+    consts = {}
+    for name in module["wire"]:
+        t = data[name][1]
+        match drivers.get(name):
+            case [(True, (_, int(v)))] if t[0] in _INTS:
+                consts[name] = normalize(v, t)
+    for name in module["register"]:
+        _, t, _, rst, *_ = data[name]
+        if t[0] not in _INTS or not rst or not isinstance(rst[1], int):
+            continue
+        v = normalize(rst[1], t)
+        if all(
+            simple
+            and (x == name or isinstance(x, int) and normalize(x, t) == v)
+            for simple, (_, x) in drivers.get(name, [])
+        ):
+            consts[name] = v
+    return consts
+
+
+def simplify(*circuits: str, db: Optional[DB] = None) -> None:
+    """Propagate constants and simplify the expressions of the code of
+    the modules in the given circuits (all circuits if none is given).
+    Use default database if none is specified.
+
+    Reads of wires connected (once) to a constant, and of registers
+    only connected to themselves or their (constant) reset value, are
+    replaced by the constant. Operators on constants are computed, and
+    algebraic identities like x & 0 = 0, x + 0 = x, bits of bits, pad of
+    pad, and muxes with constant conditions are applied. Unsigned
+    shifts by constants are replaced by cat and bits. Results keep
+    the type of the original expression, using pad where needed.
+    Connects to the constant wires and registers are kept, they can be
+    removed by remove_unused().
+    """
+    db = db or default
+    elaborate(*circuits, db=db)
+    circ = db["circuits"]
+    for cn in circuits or circ:
+        for module in circ[cn].values():
+            _simplify(db, module)
+
+
+def _simplify(db: DB, module: MODULE) -> None:
+    consts: dict[str, int] = {}
+    while True:
+        code = _Simplifier(consts).code(module["code"])
+        found = _constants(module, code)
+        if found == consts:
+            break
+        consts = found
+    if code is not module["code"]:
+        module["code"] = list(code)
+        modified(db, module)
@@ -0,0 +1,194 @@
+"""
+Persistent module store
+Keeps modules in an SQLite database file, one row per module
+"""
+
+import json
+import sqlite3
+from hashlib import sha256
+from typing import Optional
+
+from ._db import DB, MODULE, create, create_module, _export_module
+from ._module import elaborate, pending
+from ._serialize import _from_json, _object_from_json, _ToJSON
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS modules (
+    circuit TEXT NOT NULL,
+    module TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (circuit, module)
+)
+"""
+
+# Version of the store format, kept in the SQLite user_version
+_VERSION = 1
+
+_encode = json.JSONEncoder(check_circular=False, separators=(",", ":")).encode
+_encode_sorted = json.JSONEncoder(
+    check_circular=False, separators=(",", ":"), sort_keys=True
+).encode
+_decode = json.JSONDecoder(object_hook=_object_from_json).decode
+
+
+def module_hash(module: MODULE) -> str:
+    """Return structural hash of module.
+    Modules with equal names, data and code have equal hashes.
+    """
+    return _hash(_export_module(module))
+
+
+class _Store:
+    """Modules stored in an SQLite database file.
+    Each row holds the module, in the JSON encoding of save_ndjson(),
+    and its structural hash.
+    """
+
+    con: sqlite3.Connection
+
+    def __init__(self, path: str):
+        self.con = sqlite3.connect(path)
+        (version,) = self.con.execute("PRAGMA user_version").fetchone()
+        (tables,) = self.con.execute(
+            "SELECT count(*) FROM sqlite_master WHERE name = 'modules'"
+        ).fetchone()
+        if tables and version != _VERSION:
+            self.con.close()
+            raise ValueError(f"Unsupported module store format: {path}")
+        with self.con:
+            self.con.execute(_SCHEMA)
+            self.con.execute(f"PRAGMA user_version = {_VERSION}")
+
+    def __enter__(self) -> "_Store":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.con.close()
+
+    def create_module(self, circuit: str, module: str) -> MODULE:
+        """Create empty module, store and return it"""
+        m = create_module(create(), circuit, module)
+        try:
+            with self.con:
+                e = _export_module(m)
+                self._insert(circuit, module, e, _hash(e))
+        except sqlite3.IntegrityError:
+            raise NameError(f"Module {circuit}::{module} already defined")
+        return m
+
+    def lookup(self, circuit: str, module: str) -> MODULE:
+        """Return stored module"""
+        row = self.con.execute(
+            "SELECT data FROM modules WHERE circuit = ? AND module = ?",
+            (circuit, module),
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"Module {circuit}::{module} not found in store")
+        return _from_json(_decode(row[0]))
+
+    def hash(self, circuit: str, module: str) -> Optional[str]:
+        """Return structural hash of stored module, None if not stored"""
+        row = self.con.execute(
+            "SELECT hash FROM modules WHERE circuit = ? AND module = ?",
+            (circuit, module),
+        ).fetchone()
+        return row and row[0]
+
+    def update(self, circuit: str, module: str, data: MODULE) -> bool:
+        """Store module, replacing any stored module with the same name.
+        Return False if an equal module was already stored.
+        Raise ValueError if module is lazy and not elaborated.
+        """
+        if pending(data):
+            raise ValueError(
+                f"Module {circuit}::{module} has pending code, "
+                "elaborate() it before storing"
+            )
+        with self.con:
+            return self._update(circuit, module, data)
+
+    def delete(self, circuit: str, module: str) -> None:
+        """Delete stored module"""
+        with self.con:
+            cur = self.con.execute(
+                "DELETE FROM modules WHERE circuit = ? AND module = ?",
+                (circuit, module),
+            )
+        if not cur.rowcount:
+            raise KeyError(f"Module {circuit}::{module} not found in store")
+
+    def modules(self, circuit: Optional[str] = None) -> list[tuple[str, str]]:
+        """Return (circuit, module) names of stored modules"""
+        if circuit is None:
+            rows = self.con.execute("SELECT circuit, module FROM modules")
+        else:
+            rows = self.con.execute(
+                "SELECT circuit, module FROM modules WHERE circuit = ?",
+                (circuit,),
+            )
+        return rows.fetchall()
+
+    def save(self, db: DB) -> int:
+        """Store all modules of db, return number of changed modules.
+        Pending code of lazy modules is elaborated first."""
+        elaborate(db=db)
+        changed = 0
+        with self.con:
+            for cn, modules in db["circuits"].items():
+                for mn, m in modules.items():
+                    changed += self._update(cn, mn, m)
+        return changed
+
+    def load(self, *circuits: str) -> DB:
+        """Return database with the stored modules of the given circuits,
+        or of all circuits if none is specified"""
+        db = create()
+        query = "SELECT circuit, module, data FROM modules"
+        if circuits:
+            query += f" WHERE circuit IN ({', '.join('?' * len(circuits))})"
+        for cn, mn, data in self.con.execute(query, circuits):
+            modules = db["circuits"].setdefault(cn, {})
+            modules[mn] = _from_json(_decode(data))
+        return db
+
+    def _update(self, circuit: str, module: str, data: MODULE) -> bool:
+        m = _export_module(data)
+        h = _hash(m)
+        if self.hash(circuit, module) == h:
+            return False
+        self._insert(circuit, module, m, h, "OR REPLACE")
+        return True
+
+    def _insert(
+        self,
+        circuit: str,
+        module: str,
+        data: MODULE,
+        h: Optional[str] = None,
+        mode: str = "",
+    ) -> None:
+        self.con.execute(
+            f"INSERT {mode} INTO modules VALUES (?, ?, ?, ?)",
+            (
+                circuit,
+                module,
+                h or _hash(data),
+                _encode(_ToJSON().convert(data)),
+            ),
+        )
+
+
+def _hash(module: MODULE) -> str:
+    """Return hash of the JSON encoding of module, with sorted dict keys
+    so that it does not depend on the order of data and attributes"""
+    text = _encode_sorted(_ToJSON().convert(module))
+    return sha256(text.encode()).hexdigest()
+
+
+def open_store(path: str) -> _Store:
+    """Open (or create) persistent module store in SQLite file"""
+    return _Store(path)
@@ -0,0 +1,183 @@
+"""
+Waveform tracing
+Writes value changes of simulated signals to VCD files
+"""
+
+import gzip
+import re
+from typing import Any, Callable, Iterable, Optional, TextIO, Union
+
+from ._sim import _Simulator
+
+_FIRST, _LAST = 33, 127
+
+
+def _ident(i: int) -> str:
+    """Return short VCD identifier code number i"""
+    s = ""
+    while True:
+        i, r = divmod(i, _LAST - _FIRST)
+        s += chr(_FIRST + r)
+        if not i:
+            return s
+        i -= 1
+
+
+def _pattern(signals: Iterable[str]) -> re.Pattern:
+    """Return regular expression matching any of the signal globs,
+    where * matches any characters and ? any one character"""
+    globs = [
+        re.escape(g).replace(r"\*", ".*").replace(r"\?", ".") for g in signals
+    ]
+    return re.compile("|".join(f"(?:{g})" for g in globs) + r"\Z")
+
+
+class _Tracer:
+    """Streams value changes of traced signals to a VCD file"""
+
+    sim: _Simulator
+    keys: list[str]
+    codes: list[str]
+    masks: list[int]
+    last: list[Optional[int]]
+    lane: Optional[int]
+    time: Optional[int]
+    fh: TextIO
+    chunks: list[str]
+    size: int
+    buffer: int
+
+    def __init__(
+        self,
+        sim: _Simulator,
+        fh: TextIO,
+        signals: Iterable[str],
+        timescale: str,
+        buffer: int,
+        lane: Optional[int],
+    ):
+        d = sim.design
+        match = _pattern(signals).match
+        keys = [
+            k
+            for k, t in d.types.items()
+            if t[0] in ("uint", "sint", "reset", "async_reset") and match(k)
+        ]
+        self.keys = sorted(keys, key=lambda k: k.split(".")[:-1])
+        self.codes = [_ident(i) for i in range(len(self.keys))]
+        self.masks = [(1 << d.types[k][1]) - 1 for k in self.keys]
+        self.last = [None] * len(self.keys)
+        self.sim = sim
+        self.lane = lane
+        self.time = None
+        self.fh = fh
+        self.chunks = []
+        self.size = 0
+        self.buffer = buffer
+        self._header(timescale)
+        sim.tracers.append(self)
+
+    def _header(self, timescale: str) -> None:
+        types = self.sim.design.types
+        lines = [f"$timescale {timescale} $end"]
+        scope: list[str] = []
+        for key, code in zip(self.keys, self.codes):
+            *path, name = key.split(".")
+            path = [self.sim.design.name.split("::")[-1], *path]
+            n = 0
+            while n < min(len(path), len(scope)) and path[n] == scope[n]:
+                n += 1
+            lines += ["$upscope $end"] * (len(scope) - n)
+            lines += [f"$scope module {p} $end" for p in path[n:]]
+            scope = path
+            lines.append(f"$var wire {types[key][1]} {code} {name} $end")
+        lines += ["$upscope $end"] * len(scope)
+        lines.append("$enddefinitions $end\n")
+        self._write("\n".join(lines))
+
+    def _write(self, s: str) -> None:
+        self.chunks.append(s)
+        self.size += len(s)
+        if self.size >= self.buffer:
+            self.flush()
+
+    def sample(self) -> None:
+        """Write the values of the traced signals that have changed,
+        at the current cycle"""
+        value: Callable[[str], Any] = self.sim.value
+        lane, last = self.lane, self.last
+        if lane is None:
+            values = [value(k) for k in self.keys]
+        else:
+            values = [int(value(k)[lane]) for k in self.keys]
+        changes = []
+        for i, (v, old) in enumerate(zip(values, last)):
+            if v != old:
+                last[i] = v
+                v &= self.masks[i]
+                if self.masks[i] == 1:
+                    changes.append(f"{v}{self.codes[i]}\n")
+                else:
+                    changes.append(f"b{v:b} {self.codes[i]}\n")
+        if changes:
+            t = self.sim.cycle
+            if t != self.time:
+                self.time = t
+                changes.insert(0, f"#{t}\n")
+            self._write("".join(changes))
+
+    def flush(self) -> None:
+        """Write buffered value changes to file"""
+        self.fh.write("".join(self.chunks))
+        self.chunks = []
+        self.size = 0
+
+    def close(self) -> None:
+        """Write values of the current cycle, stop tracing and close
+        file"""
+        if self in self.sim.tracers:
+            self.sim.tracers.remove(self)
+            self.sample()
+            self._write(f"#{self.sim.cycle + 1}\n")
+            self.flush()
+            self.fh.close()
+
+    def __enter__(self) -> "_Tracer":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+def trace(
+    sim: _Simulator,
+    path: str,
+    signals: Union[str, Iterable[str]] = "*",
+    compress: Optional[bool] = None,
+    timescale: str = "1ns",
+    buffer: int = 1 << 20,
+    lane: Optional[int] = None,
+) -> _Tracer:
+    """Trace signals of simulator to VCD file at path, until closed.
+
+    Trace signals with hierarchical names (like inst.a.b[2]) matching
+    any of the glob patterns in signals, where * matches any characters
+    and ? any one character. The values of each cycle are written when
+    the simulator steps, and only if they have changed. Writes are
+    buffered in blocks of buffer characters.
+    The file is gzip compressed if compress is true, or if compress
+    is None and path ends with .gz.
+    For batch simulators, lane selects the lane to trace (default 0).
+    """
+    if lane is None and hasattr(sim, "lanes"):
+        lane = 0
+    if isinstance(signals, str):
+        signals = [signals]
+    if compress is None:
+        compress = path.endswith(".gz")
+    fh: TextIO
+    if compress:
+        fh = gzip.open(path, "wt", compresslevel=6)  # type: ignore
+    else:
+        fh = open(path, "w")
+    return _Tracer(sim, fh, signals, timescale, buffer, lane)
@@ -0,0 +1,164 @@
+from hamp._module import module, input, output, register
+from hamp._hwtypes import uint, sint, u1, clock
+from hamp._db import _Database, create
+from ast import literal_eval
+from os.path import dirname, abspath
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from hamp._batch import batch_simulator  # noqa: E402
+
+
+_this = dirname(abspath(__file__))
+
+
+def _db(name):
+    with open(f"{_this}/{name}.db") as fh:
+        return _Database(literal_eval(fh.read()))
+
+
+def test_counter():
+    sim = batch_simulator("test", 4, db=_db("counter"))
+    sim.poke("rst", 1)
+    sim.step()
+    sim.poke("rst", 0)
+    sim.poke("en", np.array([0, 1, 1, 0]))
+    sim.step(3)
+    assert list(sim.peek("out")) == [0, 9, 9, 0]
+    sim.poke("en", 1)
+    sim.step(400)
+    assert list(sim.peek("out")) == [176, 185, 185, 176]
+
+
+def test_memory():
+    sim = batch_simulator("memories", 3, db=_db("memories"))
+    sim.poke("din", [{"a": np.array([1, 2, 3]), "b": -2}, {}])
+    sim.poke("addr", np.array([5, 6, 5]))
+    sim.poke("we", 1)
+    sim.step()
+    sim.poke("we", 0)
+    sim.poke("re", 1)
+    sim.poke("addr", 5)
+    sim.step()
+    assert list(sim.peek("dout[0].a")) == [1, 0, 3]
+    assert list(sim.peek("dout[0].b")) == [-2, 0, -2]
+    assert list(sim.memory("ram")[".a"][6]) == [0, 2, 0]
+
+
+def test_wide():
+    m = module("wide", db=create())
+    m.a = input(uint[60])
+    m.b = input(sint[40])
+    m.x = output(uint[120])
+    m.y = output(uint[4])
+    m.z = output(sint[41])
+
+    @m.code
+    def main(m):
+        m.x = m.a * m.a
+        m.y = (m.a * m.a)[119:116]
+        m.z = m.b // 3
+
+    sim = batch_simulator("wide", 2, db=m.db)
+    a = (1 << 60) - 1
+    sim.poke("a", np.array([a, 3], dtype=object))
+    sim.poke("b", np.array([-(1 << 39), 7]))
+    assert list(sim.peek("x")) == [a * a, 9]
+    assert list(sim.peek("y")) == [15, 0]
+    assert list(sim.peek("z")) == [-((1 << 39) // 3), 2]
+
+
+def test_coverage():
+    sim = batch_simulator("print", 3, db=_db("coverf"))
+    sim.poke("pred", 1)
+    sim.poke("en", np.array([1, 0, 1]))
+    sim.step(4)
+    assert sim.coverage() == {
+        "hello world1": 12,
+        "hello world2": 8,
+        "hello world3": 12,
+        "hello world4": 8,
+    }
+
+
+def test_trace(tmp_path):
+    from hamp._vcd import trace
+
+    sim = batch_simulator("test", 2, db=_db("counter"))
+    path = str(tmp_path / "lane.vcd")
+    with trace(sim, path, "out", lane=1):
+        sim.poke("en", np.array([0, 1]))
+        sim.step(2)
+    with open(path) as fh:
+        assert fh.read().endswith("#0\nb0 !\n#1\nb11 !\n#2\nb110 !\n#3\n")
+    with trace(sim, path, "out"):
+        sim.step()
+    with open(path) as fh:
+        assert fh.read().endswith("#2\nb0 !\n#4\n")
+
+
+def test_statements():
+    m = module("stmts", db=create())
+    m.clk = input(clock)
+    m.en = input(u1)
+    m.a = input(uint[4])
+    m.r = register(uint[4], m.clk)
+
+    @m.code
+    def main(m):
+        m.r = m.r + m.a
+        m.printf(m.en, "r=%d", m.r)
+        m.assertf(m.r < 10, "r=%d", m.r)
+
+    sim = batch_simulator("stmts", 3, db=m.db)
+    sim.poke("a", np.array([1, 2, 3]))
+    sim.poke("en", np.array([1, 0, 1]))
+    sim.step(2)
+    assert sim.printed() == ["0: r=0", "2: r=0", "0: r=1", "2: r=3"]
+    assert sim.printed(2) == ["r=0", "r=3"]
+    with pytest.raises(AssertionError, match="cycle 4: lane 2: r=12"):
+        sim.step(3)
+
+
+def test_widen():
+    m = module("widen", db=create())
+    m.a = input(uint[8])
+    m.b = input(uint[8])
+    m.c = input(sint[8])
+    m.x = output(uint[70])
+    m.y = output(sint[70])
+
+    @m.code
+    def main(m):
+        m.x = m.a + m.b
+        m.y = m.c
+
+    sim = batch_simulator("widen", 2, db=m.db)
+    sim.poke("a", np.array([255, 1]))
+    sim.poke("b", 255)
+    sim.poke("c", np.array([-128, 5]))
+    assert list(sim.peek("x")) == [510, 256]
+    assert list(sim.peek("y")) == [-128, 5]
+
+
+def test_ops():
+    from hamp._sim import simulator
+
+    db = _db("ops")
+    values = [
+        dict(a=200, b=100, c=-5, d=7),
+        dict(a=0, b=255, c=-128, d=127),
+        dict(a=3, b=3, c=0, d=-1),
+    ]
+    sim = batch_simulator("ops", len(values), db=db)
+    for k in values[0]:
+        sim.poke(k, np.array([v[k] for v in values]))
+    for lane, inputs in enumerate(values):
+        ref = simulator("ops", db=db)
+        for k, v in inputs.items():
+            ref.poke(k, v)
+        for out in ("x", "y", "z"):
+            for i in range(2):
+                name = f"{out}[{i}]"
+                assert sim.peek(name)[lane] == ref.peek(name), name
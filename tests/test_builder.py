@@ -67,10 +67,10 @@ def _setup():
     return b
 
 
-def test_module_builder():
+def test_module_builder(tmp_path):
     m, mi = _module()
 
-    with open("m.json", "w") as fh:
+    with open(tmp_path / "m.json", "w") as fh:
         pprint(m.db, stream=fh)
     validate(m.db)
 
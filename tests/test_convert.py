@@ -94,3 +94,63 @@ def test_and_or_not():
     """
         ).strip()
     )
+
+
+def test_constant_indexes():
+    m = module("test", db=create())
+    m.a = input(uint[2][4])
+    m.b = wire(uint[2][4][3])
+    n = 4
+
+    def foo(x):  # pragma: no cover
+        for i in range(n):
+            x.b[2][i] = x.a[i]
+        for i in range(n + 1):
+            if i < n:
+                x.b[0][i] = 0
+        for i in range(2):
+            i += 1
+            x.b[1][i] = x.a[3]
+
+    f, txt = convert(foo, m.module)
+    assert (
+        txt
+        == dedent(
+            """
+    def foo(x):
+        for i in range(n):
+            x.b[_hamp_idx[2]][_hamp_idx[i]] = x.a[_hamp_idx[i]]
+        for i in range(n + 1):
+            if i < n:
+                x.b[_hamp_idx[0]][i] = 0
+        for i in range(2):
+            i += 1
+            x.b[_hamp_idx[1]][i] = x.a[_hamp_idx[3]]
+    """
+        ).strip()
+    )
+    m.bld._code.clear()
+    f(m.bld)
+    assert len(m.bld._code) == 4 + 4 + 2
+    assert m.bld._code[3] == (
+        "connect",
+        (
+            ("uint", 2),
+            (
+                "[]",
+                (
+                    ("array", 4, ("uint", 2)),
+                    (
+                        "[]",
+                        (("array", 3, ("array", 4, ("uint", 2))), "b"),
+                        (("uint", 2), 2),
+                    ),
+                ),
+                (("uint", 2), 3),
+            ),
+        ),
+        (
+            ("uint", 2),
+            ("[]", (("array", 4, ("uint", 2)), "a"), (("uint", 2), 3)),
+        ),
+    )
@@ -1,6 +1,18 @@
 """Test data-base validation"""
 
-from hamp._db import validate, create, create_module
+from hamp._db import (
+    validate,
+    create,
+    create_module,
+    ordered,
+    export,
+    modified,
+    validation_cache,
+    type_checks,
+    diagnose,
+    Diagnostic,
+    hierarchy,
+)
 from pytest import raises
 
 
@@ -472,3 +484,259 @@ def test_printf_assertf_coverf():
             ("assertf", "clk", (u1, "p"), (u1, "x"), "z = %x/%d", (u1, "p")),
         ]
         validate(db)
+
+
+def test_ordered_and_export():
+    db = _create_db()
+    bar = db["circuits"]["foo"]["bar"]
+    assert ordered(bar) is bar
+    assert bar["input"] == dict.fromkeys(["pi", "clk", "rst1", "rst2"])
+    validate(db)
+    exp = export(db)
+    assert exp["circuits"]["foo"]["bar"]["input"] == [
+        "pi",
+        "clk",
+        "rst1",
+        "rst2",
+    ]
+    assert exp["circuits"]["foo"]["bar"]["data"] is bar["data"]
+    validate(exp)
+
+
+def test_validate_incremental():
+    from hamp._module import module, input, output
+    from hamp._hwtypes import uint
+
+    db = create()
+    sub = module("foo::sub", db=db)
+    sub.a = input(uint[2])
+    sub.b = output(uint[2])
+    top = module("foo", db=db)
+    top.s = sub()
+    top.bld.s.a = 1
+    cache = validation_cache(db)
+    validate(db, incremental=True)
+    assert set(cache) == {id(sub.module), id(top.module)}
+
+    # Direct changes are not seen, unless marked as modified
+    code = sub.module["code"]
+    code.append(("bluppa",))
+    validate(db, incremental=True)
+    modified(db, sub.module)
+    with raises(ValueError, match="Malformed statement in module sub"):
+        validate(db, incremental=True)
+    code.pop()
+    validate(db, incremental=True)
+
+    # Changes through the builder are seen
+    top.bld.s.a = 2
+    assert id(top.module) not in cache
+    validate(db, incremental=True)
+
+    # Port changes are seen by instantiating modules
+    del sub.a
+    assert id(top.module) in cache
+    with raises(ValueError, match="Module foo::sub has no port a"):
+        validate(db, incremental=True)
+    sub.a = input(uint[2])
+    validate(db, incremental=True)
+
+
+def test_validate_parallel():
+    from hamp._module import module, input, output
+    from hamp._hwtypes import uint
+
+    db = create()
+    sub = module("foo::sub", db=db)
+    sub.a = input(uint[2])
+    sub.b = output(uint[2])
+    top = module("foo", db=db)
+    top.s = sub()
+    top.bld.s.a = 1
+    validate(db, jobs=2)
+    cache = validation_cache(db)
+    validate(db, incremental=True, jobs=2)
+    assert set(cache) == {id(sub.module), id(top.module)}
+
+    # Errors in all modules are reported
+    sub.module["code"].append(("bluppa",))
+    modified(db, sub.module)
+    del sub.a
+    with raises(ValueError) as e:
+        validate(db, jobs=2)
+    assert "Malformed statement in module sub" in str(e.value)
+    assert "Module foo::sub has no port a" in str(e.value)
+
+    # Ports without data give the same error regardless of jobs
+    sub.module["data"].pop("b")
+    for jobs in (1, 2):
+        with raises(ValueError):
+            validate(db, jobs=jobs)
+    assert ("instance", "s") in [d.path for d in diagnose(db, jobs=2)]
+
+
+def test_validate_type_once():
+    db = create()
+    m = create_module(db, "foo", "bar")
+    t = ("struct", ("a", ("uint", 2), 0), ("b", ("array", 2, ("sint", 3)), 1))
+    for name in ("x", "y"):
+        m["input"][name] = None
+        m["data"][name] = ("input", t, {})
+    m["code"].append(("connect", (t, "y"), (t, "x")))
+    validate(db)
+    assert type_checks == {"validated": 4, "saved": 3}
+    validate(db)
+    assert type_checks == {"validated": 4, "saved": 3}
+    validate(db, jobs=2)
+    assert type_checks == {"validated": 4, "saved": 3}
+
+    # Equal types are taken from the memo
+    m["data"]["y"] = ("input", (*t,), {})
+    validate(db)
+    assert type_checks == {"validated": 4, "saved": 3}
+
+    # Numbers comparing equal to the widths of validated types are not
+    # taken from the memo
+    for bad in (("uint", 2.0), ("uint", True), ("array", 2, ("sint", 3.0))):
+        m["wire"]["z"] = None
+        m["data"]["z"] = ("wire", bad)
+        with raises(ValueError, match="Malformed type"):
+            validate(db)
+
+    # Concurrent validations have their own memos
+    from concurrent.futures import ThreadPoolExecutor
+
+    good = create()
+    g = create_module(good, "foo", "bar")
+    g["wire"]["z"] = None
+    g["data"]["z"] = ("wire", ("uint", 2))
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(diagnose, [db, good] * 8))
+    assert [len(d) for d in results] == [1, 0] * 8
+
+
+def test_diagnose():
+    db = create()
+    m = create_module(db, "foo", "bar")
+    m["input"]["1x"] = None
+    m["data"]["1x"] = ("input", ("uint", 1))
+    m["wire"]["w"] = None
+    m["data"]["w"] = ("wire", ("uint", -1))
+    m["wire"]["ok"] = None
+    m["data"]["ok"] = ("wire", ("uint", 2))
+    m["code"].append(("connect", (("uint", 2), "ok"), (("uint", 2), 1)))
+    m["code"].append(
+        ("when", (("uint", 1), 1), [("bluppa",), ("skip",)]),
+    )
+    create_module(db, "foo", "baz")["code"].append(("bluppa",))
+    db["circuits"]["foo"]["bad"] = []
+    assert diagnose(db) == [
+        Diagnostic("foo", "bar", ("input", "1x"), "Malformed name: 1x"),
+        Diagnostic("foo", "bar", ("wire", "w"), "Bad uint size: -1"),
+        Diagnostic(
+            "foo",
+            "bar",
+            ("code", 1, 0),
+            "Malformed statement in module bar: ('bluppa',)",
+        ),
+        Diagnostic(
+            "foo",
+            "bar",
+            ("code", 1, 1),
+            "Malformed statement in module bar: ('skip',)",
+        ),
+        Diagnostic(
+            "foo",
+            "baz",
+            ("code", 0),
+            "Malformed statement in module baz: ('bluppa',)",
+        ),
+        Diagnostic(
+            "foo", "", (), "Malformed module entry in circuit foo: ('bad', [])"
+        ),
+    ]
+    assert set(diagnose(db, jobs=2)) == set(diagnose(db))
+    with raises(ValueError, match="Malformed name: 1x"):
+        validate(db)
+
+
+def test_diagnose_instance_ports():
+    from concurrent.futures import ThreadPoolExecutor
+
+    db = create()
+    sub = create_module(db, "foo", "sub")
+    sub["input"]["a"] = None
+    top = create_module(db, "foo", "top")
+    top["instance"]["i"] = None
+    top["data"]["i"] = ("instance", ("instance", "foo", "sub"))
+    expected = Diagnostic(
+        "foo",
+        "top",
+        ("instance", "i"),
+        "Module foo::sub has malformed ports: a",
+    )
+    diagnostics = diagnose(db)
+    assert expected in diagnostics
+    with ThreadPoolExecutor(4) as pool:
+        for d in pool.map(diagnose, [db] * 8):
+            assert d == diagnostics
+
+
+def test_hierarchy():
+    from hamp._module import module, input
+    from hamp._hwtypes import u1
+
+    db = create()
+    leaf = module("foo::leaf", db=db)
+    leaf.a = input(u1)
+    mid = module("foo::mid", db=db)
+    mid.l1 = leaf()
+    mid.l2 = leaf()
+    top = module("foo", db=db)
+    top.m1 = mid()
+    top.m2 = mid()
+    top.lf = leaf()
+    unused_m = module("foo::unused", db=db)
+    unused_m.m = mid()
+
+    h = hierarchy(db)
+    foo, mid_, leaf_ = ("foo", "foo"), ("foo", "mid"), ("foo", "leaf")
+    unused = ("foo", "unused")
+    assert h.children(foo) == {mid_: 2, leaf_: 1}
+    assert h.parents(mid_) == {foo: 2, unused: 1}
+    assert h.reachable(foo) == [foo, mid_, leaf_]
+    assert h.topological(foo) == [leaf_, mid_, foo]
+    assert h.topological() == [leaf_, mid_, foo, unused]
+    assert h.instance_counts(foo) == {foo: 1, mid_: 2, leaf_: 5}
+
+    # Updated when instances are added or removed
+    del top.lf
+    assert hierarchy(db).children(foo) == {mid_: 2}
+    assert hierarchy(db).instance_counts(foo)[leaf_] == 4
+    top.u = unused_m()
+    assert hierarchy(db).children(foo) == {mid_: 2, unused: 1}
+    del db["circuits"]["foo"]["unused"]
+    assert hierarchy(db).children(unused) == {}
+    assert unused not in hierarchy(db).parents(mid_)
+
+    # Only added and changed modules are indexed again
+    other = module("bar::other", db=db)
+    other.m = mid()
+    top2 = top.clone("bar::top2")
+    h = hierarchy(db)
+    visited = []
+    children = h.children
+    h.children = lambda node: visited.append(node) or children(node)
+    assert h.parents(mid_) == {foo: 2, ("bar", "other"): 1, ("bar", "top2"): 2}
+    assert h.parents(leaf_) == {mid_: 2}
+    assert h.parents(foo) == {}
+    assert sorted(set(visited)) == [
+        ("bar", "other"),
+        ("bar", "top2"),
+        foo,
+        mid_,
+    ]
+    del top2.m1
+    visited.clear()
+    assert h.parents(mid_)[("bar", "top2")] == 1
+    assert set(visited) == {("bar", "top2"), foo, ("bar", "other")}
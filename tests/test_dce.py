@@ -0,0 +1,84 @@
+from hamp._dce import remove_unused
+from hamp._firrtl import firrtl
+from hamp._module import module, input, output, wire, register
+from hamp._hwtypes import uint, u1, clock
+from hamp._db import create, validate, export
+
+
+def test_remove_unused(tmp_path):
+    m = module("dce", db=create())
+    m.clk = input(clock)
+    m.en = input(u1)
+    m.a = input(uint[4])
+    m.x = output(uint[4])
+    m.used = wire(uint[4])
+    m.index = wire(uint[2])
+    m.arr = wire(uint[4][4])
+    m.shown = wire(uint[4])
+    m.dead1 = wire(uint[4])
+    m.dead2 = wire(uint[4])
+    m.count = register(uint[4], m.clk)
+
+    @m.code
+    def main(m):
+        m.used = m.a
+        m.index = m.a[1:0]
+        m.x = m.arr[1]
+        m.arr[m.index] = m.a
+        m.shown = m.a + 1
+        m.dead1 = m.a
+        m.dead2 = m.dead1 + m.used
+        m.count = m.count + m.dead2
+        if m.en:
+            m.dead1 = 3
+        else:
+            m.x = m.used
+        if m.index == 2:
+            m.dead2 = 1
+        elif m.en:
+            m.x = 2
+        m.printf("%d", m.shown)
+
+    assert remove_unused(db=m.db) == {"dce::dce": ["dead1", "dead2", "count"]}
+    assert list(m.module["wire"]) == ["used", "index", "arr", "shown"]
+    assert list(m.module["register"]) == []
+    code = m.module["code"]
+    assert [s[0] for s in code] == [
+        "connect",
+        "connect",
+        "connect",
+        "connect",
+        "connect",
+        "when",
+        "else",
+        "when",
+        "else-when",
+        "printf",
+    ]
+    assert code[5][2] == ()
+    assert isinstance(code[6][1], tuple)
+    validate(m.db)
+    firrtl(db=m.db, name="dce", odir=str(tmp_path))
+    with open(tmp_path / "dce.fir") as fh:
+        assert "    when en :\n        skip\n    else :\n" in fh.read()
+    assert remove_unused(db=m.db) == {}
+
+
+def test_exported():
+    m = module("dce", db=create())
+    m.a = input(uint[4])
+    m.x = output(uint[4])
+    m.w = wire(uint[4])
+    m.dead = wire(uint[4])
+
+    @m.code
+    def main(m):
+        m.w = m.a
+        m.dead = m.a
+        m.x = m.w
+
+    db = export(m.db)
+    assert db["circuits"]["dce"]["dce"]["wire"] == ["w", "dead"]
+    assert remove_unused(db=db) == {"dce::dce": ["dead"]}
+    assert list(db["circuits"]["dce"]["dce"]["wire"]) == ["w"]
+    validate(db)
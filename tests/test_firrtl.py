@@ -395,3 +395,47 @@ def test_assertf():
 
 def test_coverf():
     _test_predf("coverf", False)
+
+
+def test_lazy(tmp_path):
+    db = create()
+    m = module("lazy", db=db, lazy=True)
+    m.x = output(uint[2])
+
+    @m.code
+    def main(m):
+        m.x = 2
+
+    assert m.module["code"] == []
+    firrtl(db=db, odir=tmp_path)
+    with open(tmp_path / "lazy.fir") as fh:
+        assert "    x <= UInt<2>(2)" in fh.read()
+
+
+def test_prune(tmp_path):
+    db = create()
+    sub = module("top::sub", db=db)
+    sub.x = output(uint[2])
+    sub.bld.x = 1
+    unused = module("top::unused", db=db, lazy=True)
+    unused.x = output(uint[2])
+
+    @unused.code
+    def main(m):
+        m.x = 2
+
+    top = module("top", db=db)
+    top.x = output(uint[2])
+    top.s = sub()
+    top.bld.x = top.bld.s.x
+
+    firrtl(db=db, odir=tmp_path)
+    code = (tmp_path / "top.fir").read_text()
+    assert "module sub :" in code
+    assert "module unused :" not in code
+    assert unused.module["code"] == []
+
+    firrtl(db=db, odir=tmp_path, prune=False)
+    code = (tmp_path / "top.fir").read_text()
+    assert "module unused :" in code
+    assert unused.module["code"] != []
@@ -0,0 +1,110 @@
+from hamp._flatten import flatten, flat_code, leaf_key
+from hamp._firrtl import firrtl
+from hamp._module import module, input, output, wire, register
+from hamp._hwtypes import uint, sint, clock
+from hamp._db import create, validate, validation_cache
+from hamp._sim import simulator
+from itertools import product
+from pytest import raises
+
+
+def _when():
+    m = module("when", db=create())
+    m.clk = input(clock)
+    m.a = input(uint[4])
+    m.b = input(sint[4])
+    m.sel = input(uint[2])
+    m.x = output(uint[4])
+    m.y = output(sint[4])
+    m.w = wire(uint[4])
+    m.r = register(sint[4], m.clk)
+
+    @m.code
+    def main(m):
+        m.w = 1
+        if m.sel == 0:
+            m.x = m.a
+        elif m.sel == 1:
+            m.x = m.a + 1
+            m.w = 2
+        else:
+            m.x = m.w
+            if m.sel == 3:
+                m.r = m.b
+                m.printf("b=%d", m.b)
+        m.y = m.r
+
+    return m
+
+
+def _trace(db):
+    sim = simulator("when", db=db, backend="interpret")
+    out = []
+    for sel, a, b in product(range(4), (0, 15), (-3, 5)):
+        sim.poke("sel", sel)
+        sim.poke("a", a)
+        sim.poke("b", b)
+        out.append((sim.peek("x"), sim.peek("y")))
+        sim.step()
+    return out, sim.printed()
+
+
+def test_flatten(tmp_path):
+    m = _when()
+    expected = _trace(m.db)
+    code = flat_code(m.module)
+    assert [s[0] for s in code] == ["connect"] * 4 + ["printf"]
+    flatten(db=m.db)
+    assert m.module["code"] == code
+    validate(m.db)
+    assert _trace(m.db) == expected
+    firrtl(db=m.db, name="when", odir=str(tmp_path))
+    with open(tmp_path / "when.fir") as fh:
+        fir = fh.read()
+    assert "    w <= mux(eq(sel, UInt(0)), UInt<4>(1), mux(" in fir
+    assert "    when " not in fir
+
+
+def test_no_when():
+    m = module("nowhen", db=create())
+    m.a = input(uint[4])
+    m.b = input(uint[4])
+    m.x = output(uint[4][2])
+    m.y = wire(uint[4][2])
+
+    @m.code
+    def main(m):
+        m.x[0] = m.a
+        m.x = m.y
+        m.x[1] = m.b
+        m.y[0] = m.a
+        m.y[1] = m.a
+        m.y[1] = m.b
+
+    flatten(db=m.db)
+    code = m.module["code"]
+    assert [(leaf_key(s[1][1]), leaf_key(s[2][1])) for s in code] == [
+        ("x[0]", "y[0]"),
+        ("x[1]", "b"),
+        ("y[0]", "a"),
+        ("y[1]", "b"),
+    ]
+    validate(m.db, incremental=True)
+    flatten(db=m.db)
+    assert m.module["code"] is code
+    assert id(m.module) in validation_cache(m.db)
+
+
+def test_not_connected():
+    m = module("partial", db=create())
+    m.a = input(uint[4])
+    m.x = output(uint[4][2])
+
+    @m.code
+    def main(m):
+        m.x[0] = m.a
+        if m.a == 1:
+            m.x[1] = m.a
+
+    with raises(ValueError, match=r"Output target x\[1\] is not connected"):
+        flatten(db=m.db)
@@ -1,7 +1,7 @@
 from hamp._memory import memory, wmask_type
 from hamp._hwtypes import uint, sint
 from hamp._struct import struct
-from hamp._db import create
+from hamp._db import create, export
 
 
 def test_base_type_memory():
@@ -10,7 +10,7 @@ def test_base_type_memory():
         uint[8], 32, readers=["r"], writers=["w"], readwriters=["rw"], db=db
     )
 
-    assert db == {
+    assert export(db) == {
         "circuits": {
             "mem": {
                 "mem": {
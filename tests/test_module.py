@@ -1,6 +1,6 @@
 import hamp._module as mod
 from hamp._db import create
-from hamp._hwtypes import uint, sint, clock, reset, u1
+from hamp._hwtypes import uint, sint, clock, reset, async_reset, u1
 from hamp._struct import struct
 from pytest import raises
 
@@ -17,10 +17,22 @@ def test_clone_module():
     m = mod.module("name", db=create())
     m.x = mod.input(uint[1])
     m.y = mod.wire(uint[2])
-    m.clone("name2")
+    m.a = mod.attribute({"x": [1]})
+    m.bld.y = m.bld.x + 1
+    m2 = m.clone("name2")
     assert (
         m.db["circuits"]["name"]["name"] == m.db["circuits"]["name2"]["name2"]
     )
+    # Immutable parts are shared, mutable parts copied:
+    assert m2.module["data"]["y"][1] is m.module["data"]["y"][1]
+    assert m2.module["code"][0] is m.module["code"][0]
+    assert m2.module["code"] is not m.module["code"]
+    assert m2.module["wire"] is not m.module["wire"]
+    assert m2.module["data"]["x"][2] is not m.module["data"]["x"][2]
+    m2.a.value["x"].append(2)
+    assert m.a.value == {"x": [1]}
+    del m2["y"]
+    assert "y" in m
 
 
 def test_member_access_module():
@@ -142,6 +154,14 @@ def test_unique_module_name():
     mod.module("foo", db=db)
     m2 = mod.module(mod.unique("foo", db=db), db=db)
     assert m2.name == "foo::foo_1"
+    assert mod.unique("foo", db=db) == "foo::foo_2"
+    assert mod.unique("foo", db=db) == "foo::foo_2"
+    mod.module("foo::foo_2", db=db)
+    mod.module("foo::foo_3", db=db)
+    assert mod.unique("foo", db=db) == "foo::foo_4"
+    assert mod.unique("bar::foo", db=db) == "bar::foo"
+    del db["circuits"]["foo"]["foo"]
+    assert mod.unique("foo", db=db) == "foo::foo"
 
 
 def test_module_add_bad_type():
@@ -192,3 +212,90 @@ def test_attr_errors():
         del m["foo"]
     with raises(NameError, match="Module t1::t1 already defined"):
         m.clone("t1::t1")
+
+
+def test_lazy_module_code():
+    db = create()
+    calls = []
+    sub = mod.module("lib::sub", db=db, lazy=True)
+    sub.x = mod.output(uint[2])
+    unused = mod.module("other::unused", db=db, lazy=True)
+    unused.x = mod.output(uint[2])
+
+    @sub.code
+    def f(m):
+        calls.append("sub")
+        m.x = 1
+
+    @unused.code
+    def g(m):  # pragma: no cover
+        calls.append("unused")
+
+    m = mod.module("top", db=db)
+    m.s = sub()
+    s2 = sub.clone("lib::sub2")
+    assert calls == []
+    assert sub.module["code"] == []
+
+    mod.elaborate("top", db=db)
+    assert calls == ["sub"]
+    assert sub.module["code"] == [
+        ("connect", (("uint", 2), "x"), (("uint", 2), 1))
+    ]
+    assert s2.module["code"] == []
+    mod.elaborate(db=db)
+    assert calls == ["sub", "unused", "sub"]
+    assert s2.module["code"] == sub.module["code"]
+
+    # Code added after elaboration is executed directly
+    @sub.code
+    def h(m):
+        calls.append("sub again")
+
+    assert calls[-1] == "sub again"
+
+    # Lazy code sees the variables as they were when it was added
+    subs = []
+    for i in range(3):
+        s = mod.module(f"loop::m{i}", db=db, lazy=True)
+        s.x = mod.output(uint[2])
+
+        @s.code
+        def loop(m):
+            m.x = i
+
+        subs.append(s)
+    mod.elaborate("loop", db=db)
+    assert [s.module["code"][0][2][1] for s in subs] == [0, 1, 2]
+
+    # Plain dicts cannot hold the pending code
+    plain = {"circuits": {}}
+    with raises(TypeError, match="Lazy modules require a database"):
+        mod.module("lazy", db=plain, lazy=True)
+    assert plain == {"circuits": {}}
+
+
+def test_module_clock_reset_index():
+    m = mod.module("foo", db=create())
+    m.x = mod.wire(uint[2])
+    m.clk1 = mod.input(clock)
+    m.clk2 = mod.input(clock)
+    m.rst1 = mod.input(async_reset)
+    m.rst2 = mod.input(reset)
+    m.r1 = mod.register(uint[2], value=0)
+    assert (m.r1.clock, m.r1.reset) == ("clk1", "rst1")
+    del m.clk1
+    del m.rst1
+    m.r2 = mod.register(uint[2], value=0)
+    assert (m.r2.clock, m.r2.reset) == ("clk2", "rst2")
+    # Changes made directly to the data are picked up
+    data = m.module["data"]
+    del data["clk2"]
+    data["clk3"] = ("input", ("clock", 1), {})
+    m.r3 = mod.register(uint[2])
+    assert m.r3.clock == "clk3"
+    m.bld.printf("x")
+    assert m.module["code"][-1][1] == "clk3"
+    del data["clk3"]
+    with raises(ValueError, match="No clock defined in module foo"):
+        m.r4 = mod.register(uint[2])
@@ -0,0 +1,60 @@
+from hamp._runner import run_sharded
+from hamp._db import _Database
+from ast import literal_eval
+from os.path import dirname, abspath
+import pytest
+
+
+_this = dirname(abspath(__file__))
+
+
+def _db(name):
+    with open(f"{_this}/{name}.db") as fh:
+        return _Database(literal_eval(fh.read()))
+
+
+def _count(sim, n):
+    sim.poke("rst", 1)
+    sim.step()
+    sim.poke("rst", 0)
+    sim.poke("en", 1)
+    sim.step(n)
+    return sim.peek("out")
+
+
+def _cover(sim, n):
+    sim.poke("en", n & 1)
+    sim.poke("pred", 1)
+    sim.step(n)
+    return n
+
+
+@pytest.mark.parametrize("backend", ["compile", "interpret"])
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_results(backend, jobs):
+    r = run_sharded(
+        "test",
+        _count,
+        range(10),
+        db=_db("counter"),
+        jobs=jobs,
+        backend=backend,
+    )
+    assert r.results == [n * 3 for n in range(10)]
+    assert r.coverage == {}
+
+
+@pytest.mark.parametrize("backend", ["compile", "interpret"])
+def test_coverage(backend):
+    r = run_sharded(
+        "print", _cover, range(1, 6), db=_db("coverf"), jobs=2, backend=backend
+    )
+    assert r.results == [1, 2, 3, 4, 5]
+    assert r.coverage == {
+        "hello world1": 15,
+        "hello world2": 9,
+        "hello world3": 15,
+        "hello world4": 9,
+    }
+    with pytest.raises(ValueError):
+        run_sharded("print", _cover, [], db=_db("coverf"), backend="other")
@@ -0,0 +1,134 @@
+from hamp._serialize import (
+    save,
+    load,
+    save_mapped,
+    open_mapped,
+    save_ndjson,
+    load_ndjson,
+)
+from hamp._firrtl import firrtl
+from hamp._module import _Module
+from hamp._db import validate, export
+from ast import literal_eval
+from glob import glob
+from os.path import dirname, abspath
+from pytest import raises
+
+
+_this = dirname(abspath(__file__))
+
+
+def test_save_load(tmp_path):
+    for fname in glob(f"{_this}/*.db"):
+        with open(fname) as fh:
+            db = literal_eval(fh.read())
+        save(db, tmp_path / "x.hdb")
+        db2 = load(tmp_path / "x.hdb")
+        assert db2 == db
+        validate(db2)
+
+
+def test_interned(tmp_path):
+    db = {
+        "circuits": {
+            "c": {
+                "m": {
+                    "data": {
+                        "a": ("wire", ("uint", 1), {"x": True}),
+                        "b": ("wire", ("uint", True), {"x": 1}),
+                        "c": ("wire", ("uint", 1), {"x": 1.0}),
+                    },
+                    "code": [[1, 2], (3, [4])],
+                }
+            }
+        }
+    }
+    save(db, tmp_path / "x.hdb")
+    data = load(tmp_path / "x.hdb")["circuits"]["c"]["m"]["data"]
+    assert data["a"][1] is data["c"][1]
+    assert data["b"][1][1] is True
+    assert data["a"][2]["x"] is True
+    assert type(data["c"][2]["x"]) is float
+    assert load(tmp_path / "x.hdb") == db
+
+
+def test_bad_file(tmp_path):
+    (tmp_path / "x.hdb").write_bytes(b"bluppa")
+    with raises(ValueError, match="Not a hamp database file"):
+        load(tmp_path / "x.hdb")
+    save({"circuits": {}}, tmp_path / "x.hdb")
+    data = bytearray((tmp_path / "x.hdb").read_bytes())
+    data[7:15] = b"2.7     "
+    (tmp_path / "x.hdb").write_bytes(data)
+    with raises(ValueError, match="written by Python 2.7, and cannot be"):
+        load(tmp_path / "x.hdb")
+
+
+def test_mapped(tmp_path):
+    with open(f"{_this}/memories.db") as fh:
+        db = literal_eval(fh.read())
+    save_mapped(db, tmp_path / "x.hmm")
+    mdb = open_mapped(tmp_path / "x.hmm", cache=2)
+    assert mdb == db
+    validate(mdb)
+    firrtl(db=db, name="a", odir=tmp_path)
+    firrtl(db=mdb, name="b", odir=tmp_path)
+    assert (tmp_path / "a.fir").read_text() == (tmp_path / "b.fir").read_text()
+
+    m = mdb["circuits"]["memories"]["memories"]
+    assert mdb["circuits"]["memories"]["memories"] is m
+    assert _Module("memories::memories", mdb).clk.kind == "input"
+    with raises(TypeError):
+        mdb["circuits"]["x"] = {}
+    with raises(TypeError):
+        mdb["circuits"]["memories"]["x"] = {}
+
+    (tmp_path / "y.hmm").write_bytes(b"bluppa")
+    with raises(ValueError, match="Not a mapped hamp database file"):
+        open_mapped(tmp_path / "y.hmm")
+
+
+def test_ndjson(tmp_path):
+    for fname in glob(f"{_this}/*.db"):
+        with open(fname) as fh:
+            db = literal_eval(fh.read())
+        save_ndjson(db, tmp_path / "x.ndjson")
+        assert load_ndjson(tmp_path / "x.ndjson") == export(db)
+
+    line = '["foo", "bar", {"data": {}, "bluppa": 1}]\n'
+    (tmp_path / "y.ndjson").write_text(line)
+    with raises(ValueError, match="Malformed item in module bar"):
+        load_ndjson(tmp_path / "y.ndjson")
+    (tmp_path / "y.ndjson").write_text('["foo", {}]\n')
+    with raises(ValueError, match="Malformed module line"):
+        load_ndjson(tmp_path / "y.ndjson")
+
+
+def _lazy_db():
+    from hamp._db import create
+    from hamp._module import module, output
+    from hamp._hwtypes import uint
+
+    db = create()
+    m = module("lazy", db=db, lazy=True)
+    m.x = output(uint[2])
+
+    @m.code
+    def main(m):
+        m.x = 1
+
+    return db
+
+
+def test_lazy(tmp_path):
+    code = [("connect", (("uint", 2), "x"), (("uint", 2), 1))]
+    path = tmp_path / "x.hdb"
+    save(_lazy_db(), path)
+    assert load(path)["circuits"]["lazy"]["lazy"]["code"] == code
+    save_mapped(_lazy_db(), path)
+    assert open_mapped(path)["circuits"]["lazy"]["lazy"]["code"] == code
+    save_ndjson(_lazy_db(), path)
+    assert load_ndjson(path)["circuits"]["lazy"]["lazy"]["code"] == code
+    db = _lazy_db()
+    validate(db)
+    assert db["circuits"]["lazy"]["lazy"]["code"] == code
@@ -0,0 +1,272 @@
+from hamp._sim import simulator, program, coverage_report
+from hamp._module import module, input, output, wire, register
+from hamp._hwtypes import uint, sint, u1, clock
+from hamp._db import _Database, create
+from ast import literal_eval
+from os.path import dirname, abspath
+import pytest
+
+
+_this = dirname(abspath(__file__))
+
+
+@pytest.fixture(params=["compile", "interpret"])
+def backend(request):
+    return request.param
+
+
+def _db(name):
+    with open(f"{_this}/{name}.db") as fh:
+        return _Database(literal_eval(fh.read()))
+
+
+def test_counter(backend):
+    sim = simulator("test", db=_db("counter"), backend=backend)
+    sim.poke("rst", 1)
+    sim.step()
+    assert sim.peek("out") == 0
+    sim.poke("rst", 0)
+    sim.poke("en", 1)
+    sim.step(3)
+    assert sim.peek("out") == 9
+    sim.poke("en", 0)
+    sim.step(2)
+    assert sim.peek("out") == 9
+    sim.poke("en", 1)
+    sim.step(339)
+    assert sim.peek("out") == (9 + 339 * 3) % 1024
+    sim.poke("rst", 1)
+    assert sim.peek("out") == 0
+    assert sim.cycle == 345
+
+
+def test_struct(backend):
+    sim = simulator("struct", db=_db("struct"), backend=backend)
+    data = {"x": 0xABC, "y": [-1, 2, -3]}
+    sim.poke("din", {"valid": 1, "data": data})
+    sim.poke("sel", 2)
+    sim.poke("dout.ready", 1)
+    assert sim.peek("din.ready") == 1
+    assert sim.peek("dout.valid") == 1
+    assert sim.peek("dout.data") == {"x": 0, "y": [0, 0, 0]}
+    sim.step()
+    assert sim.peek("dout.data") == data
+    zero = {"x": 0, "y": [0, 0, 0]}
+    assert sim.peek("dout.data2") == [zero, zero, data]
+    with pytest.raises(TypeError):
+        sim.poke("din.ready", 1)
+    with pytest.raises(KeyError):
+        sim.peek("nothing")
+
+
+def test_instances(backend):
+    sim = simulator("mux4", db=_db("mux4"), backend=backend)
+    a = [{"x": i, "y": -i} for i in range(4)]
+    sim.poke("a", a)
+    for sel in range(4):
+        sim.poke("sel", sel)
+        assert sim.peek("x") == a[sel]
+    assert sim.peek("m3.a") == a[sim.peek("sel") & 1]
+
+
+def test_index(backend):
+    sim = simulator("index", db=_db("index"), backend=backend)
+    a = [[(i * 4 + j) - 6 for j in range(4)] for i in range(3)]
+    sim.poke("a", a)
+    sim.poke("b", -1)
+    for x in range(3):
+        for y in range(4):
+            sim.poke("x", x)
+            sim.poke("y", y)
+            assert sim.peek("z") == (a[x][y] & 0xFF) << 10 | 0x3FF
+
+
+def test_memory(backend):
+    sim = simulator("memories", db=_db("memories"), backend=backend)
+    d0 = {"a": 1, "b": -2, "c": [3, -4]}
+    d1 = {"a": 2, "b": 3, "c": [-1, 0]}
+    sim.poke("din", [d0, d1])
+    sim.poke("addr", 5)
+    sim.poke("we", 1)
+    sim.step()
+    sim.poke("we", 0)
+    sim.poke("addr", 7)
+    sim.poke("ce", 1)
+    sim.poke("wmode", 1)
+    sim.step()
+    sim.poke("wmode", 0)
+    sim.poke("re", 1)
+    sim.poke("addr", 5)
+    sim.step()
+    assert sim.peek("dout")[0] == d0
+    sim.poke("re", 0)
+    sim.poke("addr", 7)
+    sim.step()
+    assert sim.peek("dout") == [d0, d1]
+
+
+def test_when(backend):
+    m = module("when", db=create())
+    m.clk = input(clock)
+    m.rst = input(u1)
+    m.a = input(uint[4])
+    m.b = input(sint[4])
+    m.sel = input(uint[2])
+    m.x = output(uint[4])
+    m.y = output(sint[4])
+    m.w = wire(uint[4])
+    m.r = register(sint[4], m.clk, m.rst, value=-8)
+
+    @m.code
+    def main(m):
+        m.w = 1
+        if m.sel == 0:
+            m.x = m.a
+        elif m.sel == 1:
+            m.x = m.a + 1
+            m.w = 2
+        else:
+            m.x = m.w
+            if m.sel == 3:
+                m.r = m.b
+        m.y = m.r
+
+    sim = simulator("when", db=m.db, backend=backend)
+    sim.poke("rst", 1)
+    sim.poke("a", 15)
+    sim.step()
+    assert sim.peek("y") == -8
+    sim.poke("rst", 0)
+    assert [sim.poke("sel", i) or sim.peek("x") for i in range(4)] == [
+        15,
+        0,
+        1,
+        1,
+    ]
+    sim.poke("b", -3)
+    sim.poke("sel", 2)
+    sim.step()
+    assert sim.peek("y") == -8
+    sim.poke("sel", 3)
+    sim.step()
+    assert sim.peek("y") == -3
+
+
+def test_ops(backend):
+    m = module("ops", db=create())
+    m.a = input(sint[6])
+    m.b = input(sint[6])
+    m.c = input(uint[4])
+    m.q = output(sint[7])
+    m.r = output(sint[6])
+    m.s = output(sint[13])
+    m.n = output(uint[4])
+    m.x = output(uint[1])
+    m.y = output(uint[3])
+    m.d = output(sint[7])
+
+    @m.code
+    def main(m):
+        m.q = m.a // m.b
+        m.r = m.a % m.b
+        m.s = m.a * m.b
+        m.n = ~m.c
+        m.x = m.a < m.b
+        m.y = m.c[3:1]
+        m.d = m.a // 3
+
+    sim = simulator("ops", db=m.db, backend=backend)
+    sim.poke("a", -7)
+    sim.poke("b", 2)
+    sim.poke("c", 0b1010)
+    assert sim.peek("q") == -3
+    assert sim.peek("r") == -1
+    assert sim.peek("s") == -14
+    assert sim.peek("n") == 0b0101
+    assert sim.peek("x") == 1
+    assert sim.peek("y") == 0b101
+    assert sim.peek("d") == -2
+    sim.poke("b", 0)
+    assert sim.peek("q") == 0
+
+
+def test_loop(backend):
+    m = module("loop", db=create())
+    m.x = output(uint[4])
+    m.w = wire(uint[4])
+
+    @m.code
+    def main(m):
+        m.w = m.x
+        m.x = m.w + 1
+
+    with pytest.raises(ValueError):
+        simulator("loop", db=m.db, backend=backend).peek("x")
+    with pytest.raises(NameError):
+        simulator("nothing", db=m.db, backend=backend)
+
+
+def test_program():
+    m = module("chain", db=create())
+    m.sel = input(uint[8])
+    m.x = output(uint[8])
+
+    @m.code
+    def main(m):
+        m.x = 255
+        for i in range(100):
+            if m.sel == i:
+                m.x = i * 2
+
+    p = program("chain", db=m.db)
+    assert program("chain", db=m.db) is p
+    sim = simulator("chain", db=m.db)
+    for i in (0, 42, 99, 100):
+        sim.poke("sel", i)
+        assert sim.peek("x") == (i * 2 if i < 100 else 255)
+    m.bld.x = 1
+    assert program("chain", db=m.db) is not p
+    with pytest.raises(ValueError):
+        simulator("chain", db=m.db, backend="other")
+
+
+def test_statements(backend):
+    m = module("stmts", db=create())
+    m.clk = input(clock)
+    m.en = input(u1)
+    m.a = input(sint[4])
+    m.r = register(uint[4], m.clk)
+
+    @m.code
+    def main(m):
+        m.r = m.r + 1
+        m.printf(m.en, "a=%d r=%x %b%%", m.a, m.r, m.a)
+        m.assertf(m.r != 12, "r=%d", m.r)
+        m.coverf(m.a < 0, "negative")
+        if m.en:
+            m.coverf(m.r[0], "odd")
+
+    sim = simulator("stmts", db=m.db, backend=backend)
+    sim.poke("a", -3)
+    sim.step(2)
+    sim.poke("en", 1)
+    sim.step(2)
+    sim.poke("a", 1)
+    sim.step(7)
+    assert sim.printed() == [
+        "a=-3 r=2 1101%",
+        "a=-3 r=3 1101%",
+        *(f"a=1 r={r:x} 0001%" for r in range(4, 11)),
+    ]
+    assert sim.coverage() == {"negative": 4, "odd": 4}
+    assert coverage_report({"negative": 4, "odd": 0}).split("\n") == [
+        "         4 negative",
+        "         0 odd",
+        "1 of 2 cover points hit",
+    ]
+    sim.poke("en", 0)
+    sim.step()
+    with pytest.raises(AssertionError, match="in cycle 12: r=12"):
+        sim.step(5)
+    assert sim.cycle == 13
+    assert sim.peek("r") == 13
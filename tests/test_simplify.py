@@ -0,0 +1,125 @@
+from hamp._simplify import simplify
+from hamp._flatten import flatten
+from hamp._dce import remove_unused
+from hamp._module import module, input, output, wire, register
+from hamp._hwtypes import uint, sint, u1, clock
+from hamp._stdlib import pad
+from hamp._db import create, validate, validation_cache
+from hamp._sim import simulator
+from itertools import product
+
+
+def _simp():
+    m = module("simp", db=create())
+    m.clk = input(clock)
+    m.rst = input(u1)
+    m.a = input(uint[8])
+    m.s = input(sint[6])
+    m.x = output(uint[9])
+    m.y = output(uint[3])
+    m.z = output(sint[10])
+    m.q = output(u1)
+    m.k = output(uint[8])
+    m.c = wire(uint[4])
+    m.r = register(uint[4], m.clk, m.rst, value=5)
+
+    @m.code
+    def main(m):
+        m.c = 3
+        m.x = m.a + (m.c - 3)
+        m.y = m.a[6:2][3:1]
+        m.z = pad(pad(m.s, 8), 10)
+        m.q = (m.c == 3) & (m.a == 0)
+        if m.c == 4:
+            m.r = m.a
+        m.k = (m.a & 0) | m.r
+
+    return m
+
+
+def _trace(db):
+    sim = simulator("simp", db=db, backend="interpret")
+    sim.poke("rst", 1)
+    sim.step()
+    sim.poke("rst", 0)
+    out = []
+    for a, s in product((0, 1, 77, 255), (-32, -1, 0, 31)):
+        sim.poke("a", a)
+        sim.poke("s", s)
+        out.append(tuple(sim.peek(n) for n in "xyzqk"))
+        sim.step()
+    return out
+
+
+def test_simplify():
+    m = _simp()
+    expected = _trace(m.db)
+    flatten(db=m.db)
+    simplify(db=m.db)
+    validate(m.db)
+    assert _trace(m.db) == expected
+    assert remove_unused(db=m.db) == {"simp::simp": ["c", "r"]}
+    u8, s6 = ("uint", 8), ("sint", 6)
+    a, s, n = (u8, "a"), (s6, "s"), ("uint", 0)
+    assert [c[1:] for c in m.module["code"]] == [
+        ((("uint", 9), "x"), (("uint", 9), ("pad", a, (n, 9)))),
+        ((("uint", 3), "y"), (("uint", 3), ("bits", a, (n, 5), (n, 3)))),
+        ((("sint", 10), "z"), (("sint", 10), ("pad", s, (n, 10)))),
+        (((("uint", 1), "q")), (("uint", 1), ("==", a, (("uint", 0), 0)))),
+        ((u8, "k"), (u8, 5)),
+    ]
+    assert _trace(m.db) == expected
+
+
+def test_shifts():
+    m = module("shift", db=create())
+    m.a = input(uint[8])
+    m.x = output(uint[11])
+    m.y = output(uint[5])
+    m.z = output(uint[1])
+    m.w = output(uint[3])
+
+    @m.code
+    def main(m):
+        m.x = m.a << 3
+        m.y = m.a >> 3
+        m.z = m.a >> 9
+        m.w = (m.a >> 2)[4:2]
+
+    sims = [simulator("shift", db=m.db, backend="interpret")]
+    simplify(db=m.db)
+    validate(m.db)
+    sims.append(simulator("shift", db=m.db, backend="interpret"))
+    for a in (0, 1, 77, 255):
+        out = []
+        for sim in sims:
+            sim.poke("a", a)
+            out.append([sim.peek(n) for n in "xyzw"])
+        assert out[0] == out[1]
+    u8, n = (("uint", 8), "a"), ("uint", 0)
+    assert [c[2][1] for c in m.module["code"]] == [
+        ("cat", u8, (("uint", 3), 0)),
+        ("bits", u8, (n, 7), (n, 3)),
+        0,
+        ("bits", u8, (n, 6), (n, 4)),
+    ]
+
+
+def test_unchanged():
+    m = module("same", db=create())
+    m.en = input(u1)
+    m.a = input(uint[8])
+    m.x = output(uint[8])
+
+    @m.code
+    def main(m):
+        m.x = m.a
+        if m.en:
+            m.x = m.a + 1
+
+    code = m.module["code"]
+    cache = validation_cache(m.db)
+    validate(m.db, incremental=True)
+    simplify(db=m.db)
+    assert m.module["code"] is code
+    assert id(m.module) in cache
@@ -0,0 +1,102 @@
+from hamp._store import open_store, module_hash
+from hamp._module import module, input, output
+from hamp._hwtypes import uint
+from hamp._db import create, export, validate
+from pytest import raises
+
+
+def _design(db, width):
+    sub = module("foo::sub", db=db)
+    sub.a = input(uint[width])
+    sub.b = output(uint[width])
+    sub.bld.b = sub.bld.a
+    top = module("foo", db=db)
+    top.x = input(uint[2])
+    top.s = sub()
+    top.bld.s.a = top.bld.x
+    return top
+
+
+def test_store(tmp_path):
+    db = create()
+    _design(db, 2)
+    with open_store(tmp_path / "x.sqlite") as store:
+        assert store.save(db) == 2
+        assert store.save(db) == 0
+        assert sorted(store.modules()) == [("foo", "foo"), ("foo", "sub")]
+
+    with open_store(tmp_path / "x.sqlite") as store:
+        assert store.load() == export(db)
+        validate(store.load("foo"))
+        sub = db["circuits"]["foo"]["sub"]
+        assert store.hash("foo", "sub") == module_hash(sub)
+        assert store.hash("foo", "bar") is None
+
+        db2 = create()
+        _design(db2, 3)
+        assert store.save(db2) == 2
+        assert (
+            store.lookup("foo", "sub") == export(db2)["circuits"]["foo"]["sub"]
+        )
+        assert not store.update("foo", "foo", db2["circuits"]["foo"]["foo"])
+
+        m = store.create_module("bar", "bar")
+        assert store.hash("bar", "bar") == module_hash(m)
+        assert store.lookup("bar", "bar")["input"] == []
+        assert not store.update("bar", "bar", m)
+        m["input"]["x"] = None
+        m["data"]["x"] = ("input", ("uint", 1))
+        assert store.update("bar", "bar", m)
+        assert store.lookup("bar", "bar")["input"] == ["x"]
+        assert store.hash("bar", "bar") == module_hash(m)
+        with raises(NameError, match="Module bar::bar already defined"):
+            store.create_module("bar", "bar")
+        store.delete("bar", "bar")
+        with raises(KeyError, match="Module bar::bar not found in store"):
+            store.lookup("bar", "bar")
+        with raises(KeyError, match="Module bar::bar not found in store"):
+            store.delete("bar", "bar")
+        assert store.modules("bar") == []
+
+
+def test_lazy(tmp_path):
+    db = create()
+    m = module("lazy", db=db, lazy=True)
+    m.x = output(uint[2])
+
+    @m.code
+    def main(m):
+        m.x = 1
+
+    code = [("connect", (("uint", 2), "x"), (("uint", 2), 1))]
+    with open_store(tmp_path / "x.sqlite") as store:
+        with raises(ValueError, match="Module lazy::lazy has pending code"):
+            store.update("lazy", "lazy", m.module)
+        assert store.save(db) == 1
+        assert store.load()["circuits"]["lazy"]["lazy"]["code"] == code
+        assert not store.update("lazy", "lazy", m.module)
+
+
+def test_format(tmp_path):
+    import json
+    import sqlite3
+
+    db = create()
+    top = _design(db, 2)
+    m = top.module
+    swapped = {**m, "data": dict(reversed(m["data"].items()))}
+    assert module_hash(swapped) == module_hash(m)
+    path = tmp_path / "x.sqlite"
+    with open_store(path) as store:
+        store.save(db)
+        assert store.load("foo", "bar") == export(db)
+        (data,) = store.con.execute(
+            "SELECT data FROM modules WHERE module = 'foo'"
+        ).fetchone()
+        assert json.loads(data)["input"] == {"*": ["x"]}
+
+    con = sqlite3.connect(path)
+    con.execute("PRAGMA user_version = 0")
+    con.close()
+    with raises(ValueError, match="Unsupported module store format"):
+        open_store(path)
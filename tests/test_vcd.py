@@ -0,0 +1,62 @@
+from hamp._sim import simulator
+from hamp._vcd import trace
+from hamp._db import _Database
+from ast import literal_eval
+from os.path import dirname, abspath
+import gzip
+
+
+_this = dirname(abspath(__file__))
+
+
+def _db(name):
+    with open(f"{_this}/{name}.db") as fh:
+        return _Database(literal_eval(fh.read()))
+
+
+def test_trace(tmp_path):
+    sim = simulator("test", db=_db("counter"))
+    path = str(tmp_path / "counter.vcd")
+    with trace(sim, path, ["out", "e?"]):
+        sim.poke("rst", 1)
+        sim.step()
+        sim.poke("rst", 0)
+        sim.step(2)
+        sim.poke("en", 1)
+        sim.step(2)
+    sim.step()
+    with open(path) as fh:
+        header, changes = fh.read().split("$enddefinitions $end\n")
+    assert header.split("\n") == [
+        "$timescale 1ns $end",
+        "$scope module test $end",
+        "$var wire 1 ! en $end",
+        '$var wire 10 " out $end',
+        "$upscope $end",
+        "",
+    ]
+    assert changes.split("\n") == [
+        "#0",
+        "0!",
+        'b0 "',
+        "#3",
+        "1!",
+        "#4",
+        'b11 "',
+        "#5",
+        'b110 "',
+        "#6",
+        "",
+    ]
+
+
+def test_compress(tmp_path):
+    sim = simulator("mux4", db=_db("mux4"))
+    path = str(tmp_path / "mux4.vcd.gz")
+    with trace(sim, path, "m3.a.*", buffer=1):
+        sim.poke("a", [{"x": 1, "y": -1}] * 4)
+        sim.step()
+    with gzip.open(path, "rt") as fh:
+        text = fh.read()
+    assert "$scope module m3 $end\n$scope module a $end" in text
+    assert 'b1 !\nb111 "\n#2\n' in text